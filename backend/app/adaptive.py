@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Optional
+import os
+
+from app.metrics import metrics
+
+# Default for requests that do not set "adaptive"
+ADAPTIVE_PIPELINE = os.getenv("ADAPTIVE_PIPELINE", "false").lower() == "true"
+# Best dense score below which the LLM is not called (unless BM25 matched well)
+ADAPTIVE_MIN_SCORE = float(os.getenv("ADAPTIVE_MIN_SCORE", "0.3"))
+# Best normalized BM25 score (share of the query's attainable score) that still calls the LLM
+ADAPTIVE_MIN_LEXICAL_SCORE = float(os.getenv("ADAPTIVE_MIN_LEXICAL_SCORE", "0.2"))
+# Lead of the best dense hit over the runner-up that makes reranking unnecessary
+ADAPTIVE_RERANK_GAP = float(os.getenv("ADAPTIVE_RERANK_GAP", "0.15"))
+# Candidates scoring within this distance of the best one are kept for MMR
+ADAPTIVE_POOL_MARGIN = float(os.getenv("ADAPTIVE_POOL_MARGIN", "0.2"))
+
+# Same wording the LLM is told to use when the context does not answer the question
+INSUFFICIENT_CONTEXT_ANSWER = (
+    "I don't have enough information to answer this question based on the provided context."
+)
+
+def is_adaptive(requested: Optional[bool]) -> bool:
+    return ADAPTIVE_PIPELINE if requested is None else requested
+
+def pool_margin(adaptive: bool) -> Optional[float]:
+    """Margin for ``VectorStore.search``; None keeps the fixed candidate pool."""
+    return ADAPTIVE_POOL_MARGIN if adaptive else None
+
+def score_profile(chunks: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Dense score profile of retrieved chunks (see ``_select_mmr``), plus BM25 hits.
+    
+    Chunks found only by BM25 carry no dense profile; a query whose dense
+    search found nothing gets a zero profile. ``lexical_score`` is the
+    best normalized BM25 score (see ``BM25Index.search``).
+    """
+    dense = next((chunk for chunk in chunks if "top_score" in chunk), None)
+    return {
+        "top_score": dense["top_score"] if dense else 0.0,
+        "score_gap": dense["score_gap"] if dense else 0.0,
+        "candidate_pool": float(dense["candidate_pool"]) if dense else 0.0,
+        "lexical_hits": float(sum(1 for chunk in chunks if "lexical_score" in chunk)),
+        "lexical_score": max((chunk["lexical_score"] for chunk in chunks if "lexical_score" in chunk), default=0.0)
+    }
+
+def skip_generation(profile: Dict[str, float]) -> bool:
+    """Nothing clears the relevance thresholds, so the answer would be a refusal.
+    
+    Incidental BM25 matches (a shared everyday word) do not keep the LLM
+    call; only a hit covering a good share of the query does.
+    """
+    return profile["top_score"] < ADAPTIVE_MIN_SCORE and profile["lexical_score"] < ADAPTIVE_MIN_LEXICAL_SCORE
+
+def skip_rerank(profile: Dict[str, float], candidates: int, rerank_top_k: int) -> bool:
+    """The dense ranking is decisive, or there is nothing for the reranker to choose."""
+    return candidates <= rerank_top_k or profile["score_gap"] >= ADAPTIVE_RERANK_GAP
+
+def record_skip(stage: str):
+    metrics.inc("rag_adaptive_skips_total", stage=stage)
@@ -0,0 +1,289 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+import os
+import random
+
+import numpy as np
+
+class HNSWIndex:
+    """Hierarchical Navigable Small World graph over unit-normalized vectors.
+    
+    The index stores only graph structure; vectors are read from the
+    caller's matrix (the local store's memory map) by row number, so the
+    index adds roughly ``2 * M`` ints per point. Similarity is the dot
+    product, i.e. cosine for normalized rows.
+    
+    Knobs: ``M`` (links per node), ``ef_construction`` (build-time beam)
+    and ``ef_search`` (query-time beam; higher means better recall and
+    slower queries).
+    """
+    
+    def __init__(
+        self,
+        M: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 64,
+        seed: int = 42
+    ):
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1.0 / math.log(M)
+        self.entry_point = -1
+        self.max_level = -1
+        self._levels: List[int] = []
+        self._graph: List[Dict[int, List[int]]] = []
+        self._size = 0
+        self._rng = random.Random(seed)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __contains__(self, row: int) -> bool:
+        return row < len(self._levels) and self._levels[row] >= 0
+    
+    def add(self, rows: Sequence[int], vectors: np.ndarray):
+        """Insert rows of ``vectors`` that are not indexed yet."""
+        for row in rows:
+            row = int(row)
+            if row not in self:
+                self._insert(row, vectors)
+    
+    def update(self, rows: Sequence[int], vectors: np.ndarray):
+        """Reconnect indexed rows whose vectors changed; rows not indexed yet are inserted."""
+        for row in rows:
+            row = int(row)
+            if row in self:
+                self._relink(row, vectors)
+            else:
+                self._insert(row, vectors)
+    
+    @property
+    def entry(self) -> Tuple[int, int]:
+        """(entry point, max level), to capture alongside a snapshot of the vectors."""
+        return self.entry_point, self.max_level
+    
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        vectors: np.ndarray,
+        ef_search: Optional[int] = None,
+        entry: Optional[Tuple[int, int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k rows by similarity; returns (rows, similarities).
+        
+        ``vectors`` may be a snapshot taken while other threads keep
+        inserting; pass the ``entry`` captured with it, since an insert
+        can move the entry point to a row the snapshot does not have.
+        """
+        entry_point, max_level = self.entry if entry is None else entry
+        if entry_point >= len(vectors):
+            entry_point, max_level = self._entry_below(len(vectors), max_level)
+        if entry_point < 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        ef = max(ef_search or self.ef_search, k)
+        entry = [(float(vectors[entry_point] @ query), entry_point)]
+        for level in range(max_level, 0, -1):
+            entry = self._search_layer(query, entry, 1, level, vectors)
+        found = self._search_layer(query, entry, ef, 0, vectors)[:k]
+        
+        return (
+            np.array([row for _, row in found], dtype=np.int64),
+            np.array([sim for sim, _ in found], dtype=np.float32)
+        )
+    
+    def _entry_below(self, limit: int, max_level: int) -> Tuple[int, int]:
+        """A node under row ``limit`` on the highest layer that has one, with that layer."""
+        for level in range(min(max_level, len(self._graph) - 1), -1, -1):
+            # list() copies the keys in one step, even while another thread inserts
+            node = next((node for node in list(self._graph[level]) if node < limit), None)
+            if node is not None:
+                return node, level
+        return -1, -1
+    
+    def _insert(self, node: int, vectors: np.ndarray):
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_mult)
+        if len(self._levels) <= node:
+            self._levels.extend([-1] * (node + 1 - len(self._levels)))
+        self._levels[node] = level
+        while len(self._graph) <= level:
+            self._graph.append({})
+        for layer in range(level + 1):
+            self._graph[layer][node] = []
+        self._size += 1
+        
+        if self.entry_point < 0:
+            self.entry_point = node
+            self.max_level = level
+            return
+        
+        query = vectors[node]
+        entry = [(float(vectors[self.entry_point] @ query), self.entry_point)]
+        for layer in range(self.max_level, level, -1):
+            entry = self._search_layer(query, entry, 1, layer, vectors)
+        
+        for layer in range(min(level, self.max_level), -1, -1):
+            entry = self._search_layer(query, entry, self.ef_construction, layer, vectors)
+            self._link(node, entry, layer, vectors)
+        
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+    
+    def _relink(self, node: int, vectors: np.ndarray):
+        """Replace a node's links, chosen for its old vector, as if it were inserted now.
+        
+        The node keeps its level. Its old neighbors drop their links to
+        it; each layer is searched before its links change, so this also
+        works when the node is the entry point.
+        """
+        if self._size <= 1:
+            return
+        query = vectors[node]
+        level = self._levels[node]
+        entry = [(float(vectors[self.entry_point] @ query), self.entry_point)]
+        for layer in range(self.max_level, level, -1):
+            entry = self._search_layer(query, entry, 1, layer, vectors)
+        
+        for layer in range(level, -1, -1):
+            # One extra result, since the node itself is usually among them
+            entry = self._search_layer(query, entry, self.ef_construction + 1, layer, vectors)
+            graph = self._graph[layer]
+            for neighbor in graph[node]:
+                links = graph[neighbor]
+                if node in links:
+                    links.remove(node)
+            self._link(node, [(sim, row) for sim, row in entry if row != node], layer, vectors)
+    
+    def _link(self, node: int, candidates: List[Tuple[float, int]], layer: int, vectors: np.ndarray):
+        """Connect ``node`` to the best ``candidates`` on ``layer`` and link them back."""
+        max_links = self.M0 if layer == 0 else self.M
+        neighbors = self._select_neighbors(candidates, self.M, vectors)
+        self._graph[layer][node] = [row for _, row in neighbors]
+        
+        for _, neighbor in neighbors:
+            links = self._graph[layer][neighbor]
+            links.append(node)
+            if len(links) > max_links:
+                self._graph[layer][neighbor] = self._prune(neighbor, links, max_links, vectors)
+    
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entry: List[Tuple[float, int]],
+        ef: int,
+        level: int,
+        vectors: np.ndarray
+    ) -> List[Tuple[float, int]]:
+        """Beam search on one layer; returns up to ``ef`` (similarity, row), best first."""
+        graph = self._graph[level]
+        limit = len(vectors)
+        visited = {row for _, row in entry}
+        candidates = [(-sim, row) for sim, row in entry]
+        heapq.heapify(candidates)
+        results = list(entry)
+        heapq.heapify(results)
+        
+        while candidates:
+            neg_sim, current = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+            
+            # Rows past ``limit`` belong to a concurrent insert into a grown matrix
+            fresh = [row for row in graph.get(current, ()) if row not in visited and row < limit]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            sims = (vectors[fresh] @ query).tolist()
+            
+            for sim, row in zip(sims, fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, row))
+                    heapq.heappush(results, (sim, row))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        
+        return sorted(results, reverse=True)
+    
+    def _select_neighbors(
+        self,
+        candidates: List[Tuple[float, int]],
+        m: int,
+        vectors: np.ndarray
+    ) -> List[Tuple[float, int]]:
+        """HNSW heuristic: skip candidates closer to a chosen neighbor than to the base."""
+        if len(candidates) <= 1:
+            return candidates[:m]
+        
+        rows = [row for _, row in candidates]
+        cand_vectors = vectors[rows]
+        gram = cand_vectors @ cand_vectors.T
+        # Similarity of each candidate to its closest already-selected neighbor
+        closest = np.full(len(candidates), -np.inf, dtype=gram.dtype)
+        selected: List[int] = []
+        skipped: List[int] = []
+        
+        for i, (sim, _) in enumerate(candidates):
+            if len(selected) >= m:
+                break
+            if closest[i] > sim:
+                skipped.append(i)
+                continue
+            selected.append(i)
+            np.maximum(closest, gram[i], out=closest)
+        
+        # Keep pruned connections so sparse regions still reach M links
+        selected.extend(skipped[:m - len(selected)])
+        return [candidates[i] for i in selected]
+    
+    def _prune(self, node: int, links: List[int], m: int, vectors: np.ndarray) -> List[int]:
+        sims = (vectors[links] @ vectors[node]).tolist()
+        ranked = sorted(zip(sims, links), reverse=True)
+        return [row for _, row in self._select_neighbors(ranked, m, vectors)]
+    
+    def save(self, path: str):
+        """Write the graph as per-layer CSR arrays to ``path`` (.npz)."""
+        arrays = {
+            "params": np.array(
+                [self.M, self.ef_construction, self.ef_search, self.entry_point, self.max_level, self._size],
+                dtype=np.int64
+            ),
+            "levels": np.array(self._levels, dtype=np.int16)
+        }
+        for layer, graph in enumerate(self._graph):
+            nodes = np.fromiter(graph.keys(), dtype=np.int32, count=len(graph))
+            lengths = np.array([len(graph[n]) for n in nodes.tolist()], dtype=np.int64)
+            offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            flat = [row for n in nodes.tolist() for row in graph[n]]
+            arrays[f"nodes_{layer}"] = nodes
+            arrays[f"offsets_{layer}"] = offsets
+            arrays[f"links_{layer}"] = np.array(flat, dtype=np.int32)
+        
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str, ef_search: Optional[int] = None) -> "HNSWIndex":
+        """Load a graph written by ``save``."""
+        with np.load(path) as data:
+            M, ef_construction, saved_ef, entry_point, max_level, size = data["params"].tolist()
+            index = cls(M=M, ef_construction=ef_construction, ef_search=ef_search or saved_ef)
+            index.entry_point = entry_point
+            index.max_level = max_level
+            index._size = size
+            index._levels = data["levels"].tolist()
+            for layer in range(max_level + 1):
+                nodes = data[f"nodes_{layer}"].tolist()
+                offsets = data[f"offsets_{layer}"].tolist()
+                links = data[f"links_{layer}"].tolist()
+                index._graph.append({
+                    node: links[offsets[i]:offsets[i + 1]]
+                    for i, node in enumerate(nodes)
+                })
+        return index
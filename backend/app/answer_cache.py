@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.metrics import metrics
+
+class SemanticAnswerCache:
+    """Answer cache keyed by query embedding similarity.
+    
+    A lookup hits when a cached query made with the same retrieval
+    parameters has cosine similarity >= ``threshold`` to the new one.
+    Entries expire after ``ttl`` seconds, the least recently used entry
+    is evicted at ``max_entries``, and ``invalidate_sources`` drops every
+    answer built from chunks of the given sources.
+    
+    Embeddings live in one preallocated matrix so a lookup is a single
+    matrix-vector product.
+    """
+    
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._params = np.zeros(max_entries, dtype=np.int64)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        # slot -> (response, sources, created); order is LRU order
+        self._entries: "OrderedDict[int, Tuple[Dict[str, Any], frozenset, float]]" = OrderedDict()
+        self._free = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def lookup(self, query_embedding, params: Tuple) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return (cached response, similarity) for a close enough query, else None."""
+        hit = self._lookup(query_embedding, params)
+        metrics.inc("rag_cache_lookups_total", cache="answer", result="hit" if hit else "miss")
+        return hit
+    
+    def _lookup(self, query_embedding, params: Tuple) -> Optional[Tuple[Dict[str, Any], float]]:
+        query = _normalize(query_embedding)
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+            
+            sims = self._matrix @ query
+            sims[~self._valid | (self._params != hash(params))] = -np.inf
+            slot = int(np.argmax(sims))
+            similarity = float(sims[slot])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            
+            response, _, created = self._entries[slot]
+            if time.time() - created > self.ttl:
+                self._remove(slot)
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return response, similarity
+    
+    def store(
+        self,
+        query_embedding,
+        params: Tuple,
+        response: Dict[str, Any],
+        sources: Iterable[str]
+    ):
+        """Cache a response together with the sources it was built from."""
+        query = _normalize(query_embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+            
+            slot = self._free.pop()
+            self._matrix[slot] = query
+            self._params[slot] = hash(params)
+            self._valid[slot] = True
+            self._entries[slot] = (response, frozenset(sources), time.time())
+    
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """Drop cached answers that depended on any of ``sources``."""
+        sources = set(sources)
+        with self._lock:
+            stale = [
+                slot for slot, (_, entry_sources, _) in self._entries.items()
+                if entry_sources & sources
+            ]
+            for slot in stale:
+                self._remove(slot)
+            self.invalidations += len(stale)
+            return len(stale)
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations
+            }
+    
+    def _remove(self, slot: int):
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free.append(slot)
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+_cache = None
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Process-wide answer cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _cache
+    
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        _cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+        )
+    return _cache
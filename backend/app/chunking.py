@@ -1,18 +1,289 @@
 import tiktoken
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+from app.metrics import traced
 from app.models import DocumentChunk
 
+# Cap on text held back while waiting for a word boundary between pieces
+MAX_CARRY_CHARS = 64 * 1024
+
+# Markdown ATX headings ("## Install"), used to fill DocumentChunk.section
+HEADING = re.compile(r"^ {0,3}#{1,6}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+# Places a chunk may end, strongest first; the cut goes at the match end
+BREAKS = [
+    re.compile(r"\n(?= {0,3}#{1,6}[ \t])"),
+    re.compile(r"\n[ \t]*\n"),
+    re.compile(r"[.!?][\"')\]]*(?=\s)"),
+    re.compile(r"\n"),
+]
+
+# Places an overlapping window may start: just after a sentence or paragraph
+STARTS = re.compile(r"[.!?][\"')\]]*(?=\s)|\n[ \t]*\n")
+
+# Byte length of every token id, per encoding; built once, grown on demand
+_token_lengths: Dict[str, np.ndarray] = {}
+
+def token_byte_lengths(encoding, tokens: np.ndarray) -> np.ndarray:
+    """UTF-8 byte length of each token, by table lookup instead of decoding."""
+    table = _token_lengths.get(encoding.name)
+    highest = int(tokens.max())
+    if table is None or highest >= len(table):
+        start = 0 if table is None else len(table)
+        grown = np.zeros(max(highest + 1, getattr(encoding, "n_vocab", 0)), dtype=np.int64)
+        grown[:start] = table if table is not None else 0
+        for token in range(start, len(grown)):
+            try:
+                grown[token] = len(encoding.decode_single_token_bytes(token))
+            except KeyError:
+                # Unused ids between the vocabulary and special tokens
+                pass
+        table = _token_lengths[encoding.name] = grown
+    return table[tokens]
+
+class ChunkStream:
+    """Incremental chunker: feed text pieces, get chunks as windows fill up.
+    
+    Each piece is encoded once; token end offsets into the original text
+    are kept alongside the token ids, so a chunk's text is a slice of the
+    input rather than a decode of its tokens. Chunk ends snap back to the
+    strongest heading/paragraph/sentence/line break within the chunker's
+    boundary tolerance, overlaps start at a sentence when one is close,
+    and ``section`` follows the most recent Markdown heading. Windows
+    only start and end after tokens that end on a character boundary,
+    so a chunk's tokens decode to exactly its text even where a token
+    splits a multibyte character.
+    
+    Only the current token window (plus one partial word) is kept in
+    memory, so documents of any size chunk in constant space.
+    """
+    
+    def __init__(
+        self,
+        chunker: "TextChunker",
+        source: str = "user_input",
+        title: str = "Untitled",
+        section: str = None
+    ):
+        self.chunker = chunker
+        self.source = source
+        self.title = title
+        self.section = section
+        self.position = 0
+        self._text = ""
+        self._tokens = np.zeros(0, dtype=np.uint32)
+        # Character offset (into self._text) where each token ends
+        self._ends = np.zeros(0, dtype=np.int64)
+        # Whether each token ends on a character boundary (not inside a multibyte one)
+        self._whole = np.zeros(0, dtype=bool)
+        # Tokens at the front of the window already included in a chunk
+        self._emitted = 0
+        self._carry = ""
+    
+    @traced("chunking.feed")
+    def feed(self, text: str) -> List[DocumentChunk]:
+        """Add a piece of text and return every chunk that is now complete."""
+        text = self._carry + text
+        # Hold back the trailing partial word so it is tokenized whole
+        # (split before the whitespace: tiktoken attaches it to the next word)
+        cut = max(text.rfind(" "), text.rfind("\n"))
+        if cut <= 0 and len(text) < MAX_CARRY_CHARS:
+            self._carry = text
+            return []
+        if cut <= 0:
+            cut = len(text)
+        self._carry = text[cut:]
+        self._append(text[:cut])
+        
+        chunks = []
+        while len(self._tokens) >= self.chunker.chunk_size:
+            chunks.extend(self._emit())
+        return chunks
+    
+    @traced("chunking.flush")
+    def flush(self) -> List[DocumentChunk]:
+        """Emit the remaining windows at end of input."""
+        if self._carry:
+            self._append(self._carry)
+            self._carry = ""
+        
+        chunks = []
+        while len(self._tokens) >= self.chunker.chunk_size:
+            chunks.extend(self._emit())
+        # The tail is only worth a chunk if it has tokens beyond the overlap
+        if len(self._tokens) > self._emitted:
+            chunks.extend(self._emit(final=True))
+        return chunks
+    
+    def _append(self, text: str):
+        """Encode text once and record where each token ends in it."""
+        tokens = self.chunker.encoding.encode(text)
+        if not tokens:
+            return
+        
+        tokens = np.asarray(tokens, dtype=np.uint32)
+        ends = np.cumsum(token_byte_lengths(self.chunker.encoding, tokens))
+        whole = np.ones(len(tokens), dtype=bool)
+        if not text.isascii():
+            # Byte offsets -> character offsets: count UTF-8 lead bytes
+            raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+            lead = (raw & 0xC0) != 0x80
+            chars_before = np.concatenate(([0], np.cumsum(lead)))
+            # A token ending mid-character maps to the end of that character
+            whole = np.append(lead, True)[ends]
+            ends = chars_before[ends]
+        
+        self._tokens = np.concatenate((self._tokens, tokens))
+        self._ends = np.concatenate((self._ends, ends + len(self._text)))
+        self._whole = np.concatenate((self._whole, whole))
+        self._text += text
+    
+    def _emit(self, final: bool = False) -> List[DocumentChunk]:
+        end = len(self._tokens) if final else self._char_boundary(self._snap_end())
+        chunk_end = int(self._ends[end - 1])
+        chunk_text = self._text[:chunk_end]
+        chunk_tokens = self._tokens[:end]
+        section = self._section_at_start(chunk_end)
+        
+        start = end if final else self._char_boundary(self._snap_start(end))
+        start_char = int(self._ends[start - 1]) if start else 0
+        self._advance_section(start_char)
+        self._text = self._text[start_char:]
+        self._tokens = self._tokens[start:]
+        self._ends = self._ends[start:] - start_char
+        self._whole = self._whole[start:]
+        self._emitted = end - start
+        
+        if not chunk_text.strip():
+            return []
+        
+        chunk = DocumentChunk(
+            text=chunk_text,
+            source=self.source,
+            title=self.title,
+            section=section,
+            position=self.position,
+            metadata={
+                "token_count": len(chunk_tokens),
+                "chunk_index": self.position
+            },
+            tokens=chunk_tokens.tolist()
+        )
+        self.position += 1
+        return [chunk]
+    
+    def _snap_end(self) -> int:
+        """Token count of the next chunk, ending at the best break in tolerance."""
+        size = self.chunker.chunk_size
+        lowest = max(size - self.chunker.boundary_tokens, self.chunker.chunk_overlap + 1, 1)
+        if lowest >= size:
+            return size
+        
+        window_start = int(self._ends[lowest - 1])
+        window_end = int(self._ends[size - 1])
+        for pattern in BREAKS:
+            matches = list(pattern.finditer(self._text, window_start, window_end))
+            for match in reversed(matches):
+                end = int(np.searchsorted(self._ends, match.end(), side="right"))
+                if lowest <= end <= size:
+                    return end
+        return size
+    
+    def _snap_start(self, end: int) -> int:
+        """First token of the next window: at least ``chunk_overlap`` back, at a sentence if close."""
+        overlap = self.chunker.chunk_overlap
+        start = end - overlap
+        if overlap < 2:
+            return start
+        
+        latest = end - overlap // 2
+        match = STARTS.search(self._text, int(self._ends[start - 1]), int(self._ends[latest - 1]))
+        if match is not None:
+            snapped = int(np.searchsorted(self._ends, match.end(), side="right"))
+            if start <= snapped <= latest:
+                return snapped
+        return start
+    
+    def _char_boundary(self, count: int) -> int:
+        """``count`` tokens, moved back (or forward, if it must) to a character boundary."""
+        back = count
+        while back > 0 and not self._whole[back - 1]:
+            back -= 1
+        if back > 0:
+            return back
+        # The text ends on a boundary, so this stops at the last token at the latest
+        while count > 0 and not self._whole[count - 1]:
+            count += 1
+        return count
+    
+    def _section_at_start(self, chunk_end: int) -> Optional[str]:
+        """Heading in force where the chunk starts, or the first one in it."""
+        # str.find is far cheaper than a MULTILINE scan of heading-free text
+        match = HEADING.search(self._text) if "#" in self._text else None
+        if match is not None and match.start() < chunk_end and (
+            self.section is None or not self._text[:match.start()].strip()
+        ):
+            return match.group(1)
+        return self.section
+    
+    def _advance_section(self, start_char: int):
+        if self._text.find("#", 0, start_char) < 0:
+            return
+        # Match against the whole window so a heading line is never cut short
+        for match in HEADING.finditer(self._text):
+            if match.start() >= start_char:
+                break
+            self.section = match.group(1)
+
 class TextChunker:
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 150,
-        encoding_name: str = "cl100k_base"
+        encoding_name: str = "cl100k_base",
+        boundary_tolerance: float = 0.15
     ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        # A chunk may end up to this fraction of chunk_size early to land on a break
+        self.boundary_tolerance = boundary_tolerance
+        self.boundary_tokens = int(chunk_size * boundary_tolerance)
         self.encoding = tiktoken.get_encoding(encoding_name)
     
+    @property
+    def config(self) -> Tuple[int, int, str, float]:
+        """Constructor arguments, for rebuilding this chunker in a worker process."""
+        return (self.chunk_size, self.chunk_overlap, self.encoding_name, self.boundary_tolerance)
+    
+    def stream(
+        self,
+        source: str = "user_input",
+        title: str = "Untitled",
+        section: str = None
+    ) -> ChunkStream:
+        """Start an incremental chunk stream for one document."""
+        return ChunkStream(self, source=source, title=title, section=section)
+    
+    def iter_chunks(
+        self,
+        pieces: Iterable[str],
+        source: str = "user_input",
+        title: str = "Untitled",
+        section: str = None
+    ) -> Iterator[DocumentChunk]:
+        """Yield chunks from a sliding token window over a stream of text pieces."""
+        stream = self.stream(source=source, title=title, section=section)
+        for piece in pieces:
+            yield from stream.feed(piece)
+        yield from stream.flush()
+    
     def chunk_text(
         self,
         text: str,
@@ -24,33 +295,38 @@ class TextChunker:
         if not text or not text.strip():
             return []
         
-        tokens = self.encoding.encode(text)
-        if not tokens:
-            return []
-        
-        chunks = []
-        
-        i = 0
-        position = 0
-        while i < len(tokens):
-            chunk_tokens = tokens[i:i + self.chunk_size]
-            chunk_text = self.encoding.decode(chunk_tokens)
-            
-            chunk = DocumentChunk(
-                text=chunk_text,
-                source=source,
-                title=title,
-                section=section,
-                position=position,
-                metadata={
-                    "token_count": len(chunk_tokens),
-                    "chunk_index": position
-                }
-            )
-            chunks.append(chunk)
-            
-            i += self.chunk_size - self.chunk_overlap
-            position += 1
-        
-        return chunks
+        return list(self.iter_chunks([text], source=source, title=title, section=section))
+
+# One chunker per configuration in each worker process
+_worker_chunkers: Dict[Tuple, TextChunker] = {}
+
+def chunk_document(config: Tuple, text: str, source: str, title: str) -> List[DocumentChunk]:
+    """Process-pool entry point: chunk one whole document."""
+    chunker = _worker_chunkers.get(config)
+    if chunker is None:
+        chunker = _worker_chunkers[config] = TextChunker(*config)
+    return chunker.chunk_text(text, source=source, title=title)
 
+_chunk_pool: Optional[ProcessPoolExecutor] = None
+
+def get_chunk_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared process pool for chunking many documents at once (None if CHUNK_WORKERS <= 1)."""
+    global _chunk_pool
+    
+    workers = int(os.getenv("CHUNK_WORKERS", str(min(4, os.cpu_count() or 1))))
+    if workers <= 1:
+        return None
+    if _chunk_pool is None:
+        # spawn: forking a process that runs threads and an event loop is unsafe
+        _chunk_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _chunk_pool
+
+def close_chunk_pool():
+    global _chunk_pool
+    
+    if _chunk_pool is not None:
+        _chunk_pool.shutdown(wait=False, cancel_futures=True)
+        _chunk_pool = None
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import threading
+
+import tiktoken
+
+from app.metrics import traced
+
+# Context windows (tokens) of the models this service is configured for
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-turbo-preview": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "llama-3.1-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+# Tokens the chat format adds per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Shortest text overlap between adjacent chunks worth trimming
+MIN_OVERLAP_CHARS = 16
+
+def context_window(model: str) -> int:
+    """Context window of ``model``; LLM_CONTEXT_WINDOW overrides the table."""
+    override = os.getenv("LLM_CONTEXT_WINDOW")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``.
+    
+    Adjacent chunks are slices of the same document, so their shared
+    overlap is an exact string match.
+    """
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+class ContextPacker:
+    """Fills a prompt's token budget with reranked chunks, best first.
+    
+    Token counts are exact (tiktoken) and cached per chunk id, which is
+    derived from chunk content. When two chunks from neighbouring
+    positions of the same source are both selected, the text they share
+    is kept only once, and the later-selected chunk is charged just for
+    what remains. A chunk that does not fit is skipped in favour of
+    smaller ones further down; if the best chunk alone exceeds the
+    budget it is cut to fit.
+    """
+    
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 50000):
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
+    def chunk_tokens(self, chunk: Dict[str, Any]) -> int:
+        """Token count of a chunk's full text, cached by chunk id."""
+        key = chunk.get("id") or hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+        tokens = self.count(chunk["text"])
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+    
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """Prompt tokens of a chat request, as the provider will count them."""
+        return sum(self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages) + 3
+    
+    @traced("llm.pack_context")
+    def pack(self, chunks: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+        """Select chunks in the given (score) order until ``budget`` tokens are used.
+        
+        Returned chunks carry their possibly trimmed ``text`` and the
+        tokens they use in ``context_tokens``.
+        """
+        selected: Dict[tuple, Dict[str, Any]] = {}
+        packed: List[Dict[str, Any]] = []
+        used = 0
+        for chunk in chunks:
+            if used >= budget:
+                break
+            text = chunk["text"]
+            source, position = chunk.get("source"), chunk.get("position")
+            before = selected.get((source, position - 1)) if position is not None else None
+            after = selected.get((source, position + 1)) if position is not None else None
+            if before is None and after is None:
+                tokens = self.chunk_tokens(chunk)
+            else:
+                if before is not None:
+                    text = text[text_overlap(before["text"], text):]
+                if after is not None:
+                    text = text[:len(text) - text_overlap(text, after["text"])]
+                if not text.strip():
+                    continue
+                tokens = self.count(text)
+            
+            if used + tokens > budget:
+                if packed:
+                    continue
+                # Nothing fits yet: keep as much of the best chunk as the budget allows,
+                # minus the bytes of a character the cut splits
+                cut = self.encoding.encode(text, disallowed_special=())[:budget]
+                text = self.encoding.decode_bytes(cut).decode("utf-8", errors="ignore")
+                tokens = self.count(text)
+            
+            if position is not None:
+                selected[(source, position)] = chunk
+            packed.append({**chunk, "text": text, "context_tokens": tokens})
+            used += tokens
+        return packed
+
+_packer: Optional[ContextPacker] = None
+_packer_lock = threading.Lock()
+
+def get_context_packer() -> ContextPacker:
+    """Process-wide packer; tiktoken shares the loaded encoding with the chunker."""
+    global _packer
+    
+    with _packer_lock:
+        if _packer is None:
+            _packer = ContextPacker(cache_size=int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "50000")))
+        return _packer
@@ -0,0 +1,265 @@
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from app.metrics import metrics
+
+# Disk hits whose access time is held back before it is written in one batch
+TOUCH_BATCH_SIZE = 1024
+
+def cache_key(model: str, dimension: int, text: str) -> bytes:
+    """Content address of an embedding: hash(model, dimension, text)."""
+    return hashlib.blake2b(
+        f"{model}\x00{dimension}\x00{text}".encode("utf-8"),
+        digest_size=16
+    ).digest()
+
+class EmbeddingCache:
+    """Two-tier embedding cache: bounded in-process LRU in front of SQLite.
+    
+    Vectors are held as packed float32 arrays in memory and as float32
+    blobs on disk. The disk tier is evicted oldest-access-first once it
+    grows past ``max_disk_bytes``; access times of disk hits are written
+    in batches with the next insert rather than committed per lookup.
+    
+    ``get_memory``/``put_memory`` only touch the in-process tier and are
+    safe on the event loop; ``get_disk``/``put_disk`` block on SQLite
+    under a separate lock, so async callers run them in the threadpool.
+    """
+    
+    def __init__(
+        self,
+        max_memory_items: int = 10000,
+        path: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024
+    ):
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[bytes, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        self._touched: Dict[bytes, float] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, vector BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+            )
+            self._disk_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()[0]
+    
+    def get_many(
+        self,
+        model: str,
+        dimension: int,
+        texts: List[str]
+    ) -> List[Optional[List[float]]]:
+        """Look up embeddings; returns None in each position that missed."""
+        results, pending = self.get_memory(model, dimension, texts)
+        if pending:
+            self.get_disk(pending, results)
+        return results
+    
+    def get_memory(
+        self,
+        model: str,
+        dimension: int,
+        texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], Dict[bytes, List[int]]]:
+        """Memory-tier lookup: results so far, plus the positions of keys to look for on disk."""
+        keys = [cache_key(model, dimension, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        pending: Dict[bytes, List[int]] = {}
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector.tolist()
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+            missed = sum(len(positions) for positions in pending.values())
+            if self._db is None:
+                self.misses += missed
+        
+        metrics.inc("rag_cache_lookups_total", len(keys) - missed, cache="embedding", result="hit")
+        if self._db is None:
+            metrics.inc("rag_cache_lookups_total", missed, cache="embedding", result="miss")
+            return results, {}
+        return results, pending
+    
+    def get_disk(self, pending: Dict[bytes, List[int]], results: List[Optional[List[float]]]):
+        """Fill ``results`` from the disk tier for the keys ``get_memory`` left pending (blocking)."""
+        with self._db_lock:
+            found = self._read_disk(list(pending))
+        
+        hits = 0
+        with self._lock:
+            for key, vector in found.items():
+                for i in pending[key]:
+                    results[i] = vector.tolist()
+                    hits += 1
+                self._remember(key, vector)
+            missed = sum(len(positions) for positions in pending.values()) - hits
+            self.disk_hits += hits
+            self.misses += missed
+        
+        metrics.inc("rag_cache_lookups_total", hits, cache="embedding", result="hit")
+        metrics.inc("rag_cache_lookups_total", missed, cache="embedding", result="miss")
+    
+    def put_many(self, model: str, dimension: int, embeddings: Dict[str, List[float]]):
+        """Store freshly computed embeddings in both tiers."""
+        rows = self.put_memory(model, dimension, embeddings)
+        if rows:
+            self.put_disk(rows)
+    
+    def put_memory(self, model: str, dimension: int, embeddings: Dict[str, List[float]]) -> list:
+        """Store embeddings in the memory tier; returns the rows for ``put_disk`` (none without one)."""
+        rows = []
+        now = time.time()
+        with self._lock:
+            for text, vector in embeddings.items():
+                key = cache_key(model, dimension, text)
+                packed = array("f", vector)
+                self._remember(key, packed)
+                blob = packed.tobytes()
+                rows.append((key, blob, len(blob), now))
+        return rows if self._db is not None else []
+    
+    def put_disk(self, rows: list):
+        """Write ``put_memory`` rows to the disk tier (blocking)."""
+        with self._db_lock:
+            self._write_disk(rows)
+    
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for both tiers."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "evictions": self.evictions
+            }
+    
+    def _remember(self, key: bytes, vector: array):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+    
+    def _read_disk(self, keys: List[bytes]) -> Dict[bytes, array]:
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector
+        
+        now = time.time()
+        for key in found:
+            self._touched[key] = now
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self._flush_touched()
+            self._db.commit()
+        return found
+    
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()]
+            )
+            self._touched.clear()
+    
+    def _write_disk(self, rows):
+        keys = [row[0] for row in rows]
+        replaced = 0
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            replaced += self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            ).fetchone()[0]
+        
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, size, accessed) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self._disk_bytes += sum(row[2] for row in rows) - replaced
+        # Before evicting, so recently read rows are not taken for stale ones
+        self._flush_touched()
+        
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+        self._db.commit()
+    
+    def _evict_disk(self):
+        """Drop least recently accessed rows until 90% of the size budget."""
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            
+            dropped = []
+            for key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                dropped.append((key,))
+                self._disk_bytes -= size
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", dropped)
+            self.evictions += len(dropped)
+
+_cache = None
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache shared by the sync and async services."""
+    global _cache
+    
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        _cache = EmbeddingCache(
+            max_memory_items=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            path=os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3") or None,
+            max_disk_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+        )
+    return _cache
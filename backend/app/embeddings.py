@@ -1,31 +1,165 @@
-from openai import OpenAI
-from typing import List
+from openai import OpenAI, AsyncOpenAI
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 import os
 
-class EmbeddingService:
-    def __init__(self):
+import numpy as np
+
+from app.embedding_cache import get_embedding_cache
+from app.http_client import get_async_http_client
+from app.metrics import traced
+from app.resilience import ProviderPool, Upstream
+
+# Deadline per embedding request
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT_MS", "20000")) / 1000.0
+# Requests with more inputs than this (ingestion batches) are never hedged
+HEDGE_MAX_INPUTS = 16
+
+def truncate_embeddings(embeddings: List[List[float]], dimension: int) -> List[List[float]]:
+    """Matryoshka truncation: keep the leading ``dimension`` components, re-normalize."""
+    vectors = np.asarray(embeddings, dtype=np.float32)[:, :dimension]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).tolist()
+
+class _BaseEmbeddingService:
+    """Configuration and cache bookkeeping shared by the sync and async services."""
+    
+    def _configure(self, use_async: bool):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not set")
-        self.client = OpenAI(api_key=api_key)
+        if use_async:
+            client = AsyncOpenAI(api_key=api_key, http_client=get_async_http_client())
+        else:
+            client = OpenAI(api_key=api_key)
         self.model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        # A single upstream: vectors from another model would not match the index,
+        # so there is no cross-model failover, only deadlines, the breaker and hedging
+        self.pool = ProviderPool("embedding", [Upstream(f"openai:{self.model}", client)], EMBEDDING_TIMEOUT)
         self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+        # false for models/servers without the `dimensions` parameter: full
+        # vectors are then truncated to EMBEDDING_DIMENSION client-side
+        self.send_dimensions = os.getenv("EMBEDDING_API_DIMENSIONS", "true").lower() == "true"
+        # Inputs per API request; larger lists are split to stay under provider limits
+        self.max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH", "256"))
+        self.cache = get_embedding_cache()
+    
+    @property
+    def client(self):
+        return self.pool.primary.target
+    
+    @client.setter
+    def client(self, client):
+        # Benchmarks swap in a fake client
+        self.pool.primary.target = client
+    
+    def _lookup(self, texts: List[str]) -> tuple[List[Optional[List[float]]], List[str]]:
+        """Return cached vectors (None on miss) and the unique texts still to embed."""
+        if self.cache is None:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        return self._missing(texts, self.cache.get_many(self.model, self.dimension, texts))
+    
+    def _missing(
+        self,
+        texts: List[str],
+        cached: List[Optional[List[float]]]
+    ) -> tuple[List[Optional[List[float]]], List[str]]:
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, cached) if vector is None
+        ))
+        return cached, missing
+    
+    def _request_options(self) -> dict:
+        return {"dimensions": self.dimension} if self.send_dimensions else {}
+    
+    def _fetched(self, missing: List[str], embeddings: List[List[float]]) -> dict:
+        """Fresh vectors by text, truncated to the configured dimension."""
+        if embeddings and len(embeddings[0]) > self.dimension:
+            embeddings = truncate_embeddings(embeddings, self.dimension)
+        return dict(zip(missing, embeddings))
+    
+    def _assemble(
+        self,
+        texts: List[str],
+        cached: List[Optional[List[float]]],
+        fetched: dict
+    ) -> List[List[float]]:
+        """Reassemble cached and fresh vectors in input order."""
+        return [
+            vector if vector is not None else fetched[text]
+            for text, vector in zip(texts, cached)
+        ]
+
+class EmbeddingService(_BaseEmbeddingService):
+    def __init__(self):
+        self._configure(use_async=False)
     
     def embed_text(self, text: str) -> List[float]:
         """Generate embedding for a single text."""
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=text,
-            dimensions=self.dimension
-        )
-        return response.data[0].embedding
+        return self.embed_batch([text])[0]
     
+    @traced("embedding.embed_batch")
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=texts,
-            dimensions=self.dimension
-        )
-        return [item.embedding for item in response.data]
+        """Generate embeddings for multiple texts, sending only cache misses upstream."""
+        cached, missing = self._lookup(texts)
+        embeddings = []
+        
+        for start in range(0, len(missing), self.max_batch_size):
+            batch = missing[start:start + self.max_batch_size]
+            _, response = self.pool.call_sync(
+                lambda client: client.embeddings.create(
+                    model=self.model,
+                    input=batch,
+                    timeout=self.pool.timeout,
+                    **self._request_options()
+                )
+            )
+            embeddings.extend(item.embedding for item in response.data)
+        
+        fetched = self._fetched(missing, embeddings)
+        if self.cache is not None:
+            self.cache.put_many(self.model, self.dimension, fetched)
+        return self._assemble(texts, cached, fetched)
 
+class AsyncEmbeddingService(_BaseEmbeddingService):
+    def __init__(self):
+        self._configure(use_async=True)
+    
+    async def embed_text(self, text: str) -> List[float]:
+        """Generate embedding for a single text without blocking the event loop."""
+        return (await self.embed_batch([text]))[0]
+    
+    @traced("embedding.embed_batch")
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for multiple texts, sending only cache misses upstream."""
+        cached, missing = await self._lookup_async(texts)
+        embeddings = []
+        
+        for start in range(0, len(missing), self.max_batch_size):
+            batch = missing[start:start + self.max_batch_size]
+            _, response = await self.pool.call(
+                lambda client: client.embeddings.create(
+                    model=self.model,
+                    input=batch,
+                    **self._request_options()
+                ),
+                hedge=len(batch) <= HEDGE_MAX_INPUTS
+            )
+            embeddings.extend(item.embedding for item in response.data)
+        
+        fetched = self._fetched(missing, embeddings)
+        if self.cache is not None:
+            rows = self.cache.put_memory(self.model, self.dimension, fetched)
+            if rows:
+                await run_in_threadpool(self.cache.put_disk, rows)
+        return self._assemble(texts, cached, fetched)
+    
+    async def _lookup_async(self, texts: List[str]) -> tuple[List[Optional[List[float]]], List[str]]:
+        """``_lookup`` with the SQLite tier in the threadpool, off the event loop."""
+        if self.cache is None:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        cached, pending = self.cache.get_memory(self.model, self.dimension, texts)
+        if pending:
+            await run_in_threadpool(self.cache.get_disk, pending, cached)
+        return self._missing(texts, cached)
@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import os
+import threading
+
+import numpy as np
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue, Range
+
+# Payload fields every chunk has, indexed in Qdrant and in the local store
+CORE_FIELDS = ("source", "title", "section", "tenant")
+RANGE_BOUNDS = ("gt", "gte", "lt", "lte")
+# Masks kept per local payload index, keyed by filter
+MASK_CACHE_SIZE = 64
+
+def payload_values(payload: Dict[str, Any], key: str) -> List[Any]:
+    """Values of a dotted payload key ("metadata.customer"); lists match any element."""
+    value: Any = payload
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return []
+        value = value[part]
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def _in_range(value: Any, bounds: Dict[str, float]) -> bool:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return (
+        ("gt" not in bounds or value > bounds["gt"])
+        and ("gte" not in bounds or value >= bounds["gte"])
+        and ("lt" not in bounds or value < bounds["lt"])
+        and ("lte" not in bounds or value <= bounds["lte"])
+    )
+
+class SearchFilter:
+    """Conditions on chunk payloads, all of which must hold.
+    
+    ``match`` maps a payload key to the values it may take (any of them);
+    ``ranges`` maps a key to numeric bounds (gt/gte/lt/lte). Keys are
+    payload paths: "source", "tenant", "metadata.published_at", ...
+    """
+    
+    def __init__(
+        self,
+        match: Optional[Dict[str, List[Any]]] = None,
+        ranges: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self.match = {key: list(values) for key, values in (match or {}).items()}
+        self.ranges = {key: dict(bounds) for key, bounds in (ranges or {}).items()}
+    
+    @classmethod
+    def from_request(cls, query_filter) -> Optional["SearchFilter"]:
+        """Build from a ``QueryFilter`` request model; None when it sets nothing."""
+        if query_filter is None:
+            return None
+        match = {}
+        for field in CORE_FIELDS:
+            value = getattr(query_filter, field)
+            if value is not None:
+                match[field] = value if isinstance(value, list) else [value]
+        for key, value in query_filter.metadata.items():
+            match[f"metadata.{key}"] = value if isinstance(value, list) else [value]
+        ranges = {
+            f"metadata.{key}": {
+                bound: getattr(condition, bound)
+                for bound in RANGE_BOUNDS
+                if getattr(condition, bound) is not None
+            }
+            for key, condition in query_filter.ranges.items()
+        }
+        search_filter = cls(match, ranges)
+        return search_filter if search_filter else None
+    
+    def __bool__(self) -> bool:
+        return bool(self.match or self.ranges)
+    
+    def key(self) -> Tuple:
+        """Hashable identity, for caches keyed by filter.
+        
+        Values are keyed by ``repr`` so that 1 and "1", which match
+        different payloads, get different keys.
+        """
+        return (
+            tuple(sorted((key, tuple(sorted(map(repr, values)))) for key, values in self.match.items())),
+            tuple(sorted((key, tuple(sorted(bounds.items()))) for key, bounds in self.ranges.items()))
+        )
+    
+    def matches(self, payload: Dict[str, Any]) -> bool:
+        for key, allowed in self.match.items():
+            if not any(value in allowed for value in payload_values(payload, key)):
+                return False
+        for key, bounds in self.ranges.items():
+            if not any(_in_range(value, bounds) for value in payload_values(payload, key)):
+                return False
+        return True
+    
+    def to_qdrant(self) -> Filter:
+        conditions = [
+            FieldCondition(
+                key=key,
+                match=MatchValue(value=values[0]) if len(values) == 1 else MatchAny(any=values)
+            )
+            for key, values in self.match.items()
+        ]
+        conditions += [
+            FieldCondition(key=key, range=Range(**bounds))
+            for key, bounds in self.ranges.items()
+        ]
+        return Filter(must=conditions)
+
+def to_qdrant_filter(search_filter: Optional[SearchFilter]) -> Optional[Filter]:
+    return search_filter.to_qdrant() if search_filter else None
+
+def filter_key(search_filter: Optional[SearchFilter]) -> Optional[Tuple]:
+    return search_filter.key() if search_filter else None
+
+class PayloadIndex:
+    """Inverted payload index for the local vector store: key -> value -> rows.
+    
+    Indexes the core fields and every scalar ``metadata`` key, so a
+    filter resolves to a row mask from posting sets instead of a scan
+    over payloads. Range conditions walk a key's distinct values, which
+    is cheap for the timestamp- and count-like fields they are used on.
+    Masks are cached per filter until the next write.
+    """
+    
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {}
+        self._masks: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _entries(self, payload: Dict[str, Any]) -> Iterable[Tuple[str, Any]]:
+        for field in CORE_FIELDS:
+            for value in payload_values(payload, field):
+                yield field, value
+        for key in (payload.get("metadata") or {}):
+            for value in payload_values(payload, f"metadata.{key}"):
+                if isinstance(value, (str, int, float, bool)):
+                    yield f"metadata.{key}", value
+    
+    def add(self, row: int, payload: Dict[str, Any]):
+        with self._lock:
+            for key, value in self._entries(payload):
+                self._postings.setdefault(key, {}).setdefault(value, set()).add(row)
+            self._masks.clear()
+    
+    def remove(self, row: int, payload: Dict[str, Any]):
+        with self._lock:
+            for key, value in self._entries(payload):
+                rows = self._postings.get(key, {}).get(value)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._postings[key][value]
+            self._masks.clear()
+    
+    def mask(self, search_filter: SearchFilter, count: int) -> np.ndarray:
+        """Boolean mask over the first ``count`` rows of rows that pass the filter."""
+        cache_key = (search_filter.key(), count)
+        with self._lock:
+            cached = self._masks.get(cache_key)
+            if cached is not None:
+                self._masks.move_to_end(cache_key)
+                return cached
+            
+            mask = np.ones(count, dtype=bool)
+            for key, allowed in search_filter.match.items():
+                values = self._postings.get(key, {})
+                mask &= self._rows_mask((values.get(value, ()) for value in allowed), count)
+            for key, bounds in search_filter.ranges.items():
+                values = self._postings.get(key, {})
+                mask &= self._rows_mask(
+                    (rows for value, rows in values.items() if _in_range(value, bounds)),
+                    count
+                )
+            
+            self._masks[cache_key] = mask
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+            return mask
+    
+    def _rows_mask(self, row_sets: Iterable[Iterable[int]], count: int) -> np.ndarray:
+        mask = np.zeros(count, dtype=bool)
+        for rows in row_sets:
+            if rows:
+                selected = np.fromiter(rows, dtype=np.int64, count=len(rows))
+                mask[selected[selected < count]] = True
+        return mask
+
+def payload_index_fields() -> List[Tuple[str, str]]:
+    """Qdrant payload indexes: the core keyword fields plus PAYLOAD_INDEXES.
+    
+    PAYLOAD_INDEXES lists extra "key:type" entries, e.g.
+    "metadata.customer:keyword,metadata.published_at:integer".
+    """
+    fields = [(field, "keyword") for field in CORE_FIELDS]
+    for entry in os.getenv("PAYLOAD_INDEXES", "").split(","):
+        if entry.strip():
+            key, _, schema = entry.strip().partition(":")
+            fields.append((key, schema or "keyword"))
+    return fields
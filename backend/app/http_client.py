@@ -0,0 +1,30 @@
+import httpx
+import os
+
+_async_client = None
+
+def get_http_limits() -> httpx.Limits:
+    """Connection pool limits shared by all provider clients."""
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    )
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared connection-pooled HTTP client for the async provider SDKs."""
+    global _async_client
+    
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=get_http_limits(),
+            timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "60")))
+        )
+    return _async_client
+
+async def close_async_http_client():
+    """Close the shared HTTP client and release pooled connections."""
+    global _async_client
+    
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
@@ -0,0 +1,438 @@
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+import asyncio
+import codecs
+import os
+import random
+import time
+
+from app.chunking import TextChunker, chunk_document
+from app.metrics import metrics, span
+from app.models import DocumentChunk
+from app.resilience import is_rate_limited
+from app.vector_db import _build_payload, content_hash, make_point_id
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", "100000"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+UPLOAD_READ_SIZE = 256 * 1024
+
+# (whole text or text pieces, source, title[, attributes]); attributes may
+# set "tenant" and "metadata", which are copied onto every chunk
+IngestDocument = Union[
+    Tuple[Union[str, AsyncIterator[str]], str, str],
+    Tuple[Union[str, AsyncIterator[str]], str, str, Optional[Dict[str, Any]]]
+]
+
+_DONE = object()
+
+async def iter_upload_text(file, read_size: int = UPLOAD_READ_SIZE) -> AsyncIterator[str]:
+    """Read an uploaded file incrementally and yield decoded UTF-8 text."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = await file.read(read_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+async def iter_file_text(path: str, read_size: int = UPLOAD_READ_SIZE) -> AsyncIterator[str]:
+    """Read a UTF-8 file from disk incrementally, off the event loop."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(path, "rb") as f:
+        while True:
+            data = await run_in_threadpool(f.read, read_size)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+async def iter_text(text: str, read_size: int = UPLOAD_READ_SIZE) -> AsyncIterator[str]:
+    """Adapt an in-memory document to the streaming ingestion path."""
+    for start in range(0, len(text), read_size):
+        yield text[start:start + read_size]
+
+async def retry_with_backoff(
+    call: Callable[[], Awaitable[Any]],
+    max_retries: int = INGEST_MAX_RETRIES,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0
+) -> Any:
+    """Retry rate-limited calls with full-jitter exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_rate_limited(e):
+                raise
+            metrics.inc("rag_retries_total")
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+
+class StageStats:
+    """Item count and active wall-clock window of one pipeline stage."""
+    
+    def __init__(self):
+        self.chunks = 0
+        self.batches = 0
+        self.retries = 0
+        self.first_start = None
+        self.last_end = None
+    
+    def record(self, chunks: int, started: float):
+        if self.first_start is None or started < self.first_start:
+            self.first_start = started
+        self.last_end = time.perf_counter()
+        self.chunks += chunks
+        self.batches += 1
+    
+    def to_dict(self) -> Dict[str, float]:
+        active = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "retries": self.retries,
+            "active_seconds": active,
+            "chunks_per_second": self.chunks / active if active > 0 else 0.0
+        }
+
+class IngestionPipeline:
+    """Staged ingestion: chunk -> concurrent embed workers -> upsert.
+    
+    Stages are connected by bounded queues, so a slow embedding provider
+    or vector store throttles chunking instead of buffering the document.
+    
+    Point ids are derived from (source, chunk content hash). With a
+    manifest, chunks already stored for their source skip embedding and
+    upsert, and re-ingesting a source listed in ``replace_sources``
+    deletes the chunks the new version no longer contains.
+    """
+    
+    def __init__(
+        self,
+        chunker: TextChunker,
+        embedding_service,
+        vector_db,
+        lexical_index=None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        batch_tokens: int = INGEST_BATCH_TOKENS,
+        embed_workers: int = INGEST_EMBED_WORKERS,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        max_retries: int = INGEST_MAX_RETRIES,
+        chunk_pool: Optional[Executor] = None,
+        manifest=None,
+        pool_min_documents: int = 2
+    ):
+        self.chunker = chunker
+        self.embedding_service = embedding_service
+        self.vector_db = vector_db
+        self.lexical_index = lexical_index
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.chunk_pool = chunk_pool
+        self.manifest = manifest
+        # In-memory texts needed before chunking moves to the process pool
+        self.pool_min_documents = pool_min_documents
+    
+    async def run(
+        self,
+        documents: List[IngestDocument],
+        replace_sources: Iterable[str] = (),
+        progress: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """Ingest documents and return chunk counts and per-stage throughput.
+        
+        Sources in ``replace_sources`` end up with exactly the chunks of
+        this run; other sources keep their existing chunks. ``progress``
+        is called with the size of every batch once it is stored.
+        """
+        documents = [(*document, None) if len(document) == 3 else document for document in documents]
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        stats = {
+            "chunking": StageStats(),
+            "embedding": StageStats(),
+            "upsert": StageStats()
+        }
+        start_time = time.perf_counter()
+        # Point ids per source: already stored, and produced by this run
+        known: Dict[str, Set[str]] = {}
+        seen: Dict[str, Set[str]] = {}
+        
+        embedders = [
+            asyncio.create_task(self._embed_worker(embed_queue, upsert_queue, stats["embedding"]))
+            for _ in range(self.embed_workers)
+        ]
+        upserter = asyncio.create_task(self._upsert_worker(upsert_queue, stats["upsert"], progress))
+        tasks = embedders + [upserter]
+        
+        try:
+            chunk_counts = await self._chunk_stage(
+                documents, embed_queue, stats["chunking"], tasks, known, seen
+            )
+            for _ in embedders:
+                await self._put(embed_queue, _DONE, tasks)
+            await self._wait_for(embedders, tasks)
+            await self._put(upsert_queue, _DONE, [upserter])
+            await upserter
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        deleted = await self._commit_manifest(seen, set(replace_sources))
+        unchanged = sum(len(ids & known[source]) for source, ids in seen.items())
+        return {
+            "chunks_created": sum(chunk_counts),
+            "chunks_embedded": sum(chunk_counts) - unchanged,
+            "chunks_unchanged": unchanged,
+            "chunks_deleted": deleted,
+            "documents": chunk_counts,
+            "processing_time": time.perf_counter() - start_time,
+            "stages": {name: stage.to_dict() for name, stage in stats.items()}
+        }
+    
+    async def _chunk_stage(
+        self,
+        documents: List[IngestDocument],
+        embed_queue: asyncio.Queue,
+        stats: StageStats,
+        workers: List[asyncio.Task],
+        known: Dict[str, Set[str]],
+        seen: Dict[str, Set[str]]
+    ) -> List[int]:
+        chunk_counts = []
+        batch: List[DocumentChunk] = []
+        batch_tokens = 0
+        # Repeats of the same content within a source: (source, hash) -> count
+        occurrences: Dict[Tuple[str, str], int] = {}
+        
+        async def produce(chunks: List[DocumentChunk], attributes: Optional[Dict[str, Any]]):
+            nonlocal batch, batch_tokens
+            for chunk in chunks:
+                if attributes:
+                    chunk.tenant = attributes.get("tenant")
+                    chunk.metadata = {**attributes.get("metadata", {}), **chunk.metadata}
+                source = chunk.source
+                if source not in known:
+                    known[source] = (
+                        await run_in_threadpool(self.manifest.get, source)
+                        if self.manifest is not None else set()
+                    )
+                    seen[source] = set()
+                # Attributes are part of the stored point, so changing them re-upserts
+                digest = content_hash(chunk.text, attributes)
+                occurrence = occurrences.get((source, digest), 0)
+                occurrences[(source, digest)] = occurrence + 1
+                chunk.point_id = make_point_id(source, digest, occurrence)
+                seen[source].add(chunk.point_id)
+                if chunk.point_id in known[source]:
+                    # Same content already stored for this source
+                    continue
+                
+                tokens = chunk.metadata.get("token_count", 0)
+                if batch and (
+                    len(batch) >= self.batch_size
+                    or batch_tokens + tokens > self.batch_tokens
+                ):
+                    await self._put(embed_queue, batch, workers)
+                    batch, batch_tokens = [], 0
+                batch.append(chunk)
+                batch_tokens += tokens
+        
+        # In-memory texts (two or more by default) are chunked whole in the process
+        # pool, at most queue_size ahead so chunks don't pile up before embedding
+        pending = [i for i, (pieces, _, _, _) in enumerate(documents) if isinstance(pieces, str)]
+        if self.chunk_pool is None or len(pending) < self.pool_min_documents:
+            pending = []
+        pooled: Dict[int, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        
+        def submit_next():
+            if pending:
+                i = pending.pop(0)
+                text, source, title, _ = documents[i]
+                pooled[i] = loop.run_in_executor(
+                    self.chunk_pool, chunk_document, self.chunker.config, text, source, title
+                )
+        
+        for _ in range(self.queue_size):
+            submit_next()
+        
+        try:
+            for i, (pieces, source, title, attributes) in enumerate(documents):
+                if i in pooled:
+                    started = time.perf_counter()
+                    with span("chunking.pool"):
+                        chunks = await pooled.pop(i)
+                    stats.record(len(chunks), started)
+                    chunk_counts.append(len(chunks))
+                    submit_next()
+                    await produce(chunks, attributes)
+                    continue
+                
+                if isinstance(pieces, str):
+                    pieces = iter_text(pieces)
+                stream = self.chunker.stream(source=source, title=title)
+                count = 0
+                
+                async for piece in pieces:
+                    started = time.perf_counter()
+                    # Tokenization is CPU-bound, keep it off the event loop
+                    chunks = await run_in_threadpool(stream.feed, piece)
+                    stats.record(len(chunks), started)
+                    count += len(chunks)
+                    await produce(chunks, attributes)
+                
+                started = time.perf_counter()
+                chunks = stream.flush()
+                stats.record(len(chunks), started)
+                count += len(chunks)
+                await produce(chunks, attributes)
+                chunk_counts.append(count)
+        finally:
+            for future in pooled.values():
+                future.cancel()
+        
+        if batch:
+            await self._put(embed_queue, batch, workers)
+        return chunk_counts
+    
+    async def _embed_worker(
+        self,
+        embed_queue: asyncio.Queue,
+        upsert_queue: asyncio.Queue,
+        stats: StageStats
+    ):
+        while True:
+            batch = await embed_queue.get()
+            if batch is _DONE:
+                return
+            
+            started = time.perf_counter()
+            embeddings = await self._with_retries(
+                lambda: self.embedding_service.embed_batch([chunk.text for chunk in batch]),
+                stats
+            )
+            stats.record(len(batch), started)
+            await upsert_queue.put((batch, embeddings))
+    
+    async def _upsert_worker(
+        self,
+        upsert_queue: asyncio.Queue,
+        stats: StageStats,
+        progress: Optional[Callable[[int], None]]
+    ):
+        while True:
+            item = await upsert_queue.get()
+            if item is _DONE:
+                return
+            
+            batch, embeddings = item
+            started = time.perf_counter()
+            ids = [chunk.point_id for chunk in batch]
+            chunk_dicts = [chunk.dict() for chunk in batch]
+            await self._with_retries(
+                lambda: self.vector_db.upsert_chunks(chunk_dicts, embeddings, ids),
+                stats
+            )
+            if self.lexical_index is not None:
+                with span("lexical.add"):
+                    await run_in_threadpool(
+                        self.lexical_index.add,
+                        ids,
+                        [_build_payload(chunk) for chunk in chunk_dicts],
+                        [chunk.tokens for chunk in batch]
+                    )
+            stats.record(len(batch), started)
+            if progress is not None:
+                progress(len(batch))
+    
+    async def _commit_manifest(self, seen: Dict[str, Set[str]], replace_sources: Set[str]) -> int:
+        """Record the run's point ids; drop stale chunks of replaced sources."""
+        if self.manifest is None:
+            return 0
+        
+        stale: List[str] = []
+        for source in replace_sources:
+            ids = seen.get(source, set())
+            previous = await run_in_threadpool(self.manifest.get, source)
+            stale.extend(previous - ids)
+            # Manifest first: a crash before the delete leaves orphaned
+            # points, never manifest entries for points that are gone
+            await run_in_threadpool(self.manifest.replace, source, ids)
+        for source, ids in seen.items():
+            if source not in replace_sources:
+                await run_in_threadpool(self.manifest.add, source, ids)
+        
+        await self._delete_points(stale)
+        return len(stale)
+    
+    async def delete_source(self, source: str) -> int:
+        """Delete every chunk of a source; returns how many there were."""
+        # Without a manifest there is no record of which points a source owns
+        if self.manifest is None:
+            return 0
+        ids = await run_in_threadpool(self.manifest.remove, source)
+        await self._delete_points(list(ids))
+        return len(ids)
+    
+    async def _delete_points(self, ids: List[str]):
+        if not ids:
+            return
+        await self.vector_db.delete_points(ids)
+        if self.lexical_index is not None:
+            with span("lexical.delete"):
+                await run_in_threadpool(self.lexical_index.delete, ids)
+    
+    async def _with_retries(self, call: Callable[[], Awaitable[Any]], stats: StageStats) -> Any:
+        async def counted():
+            try:
+                return await call()
+            except Exception as e:
+                if is_rate_limited(e):
+                    stats.retries += 1
+                raise
+        return await retry_with_backoff(counted, max_retries=self.max_retries)
+    
+    async def _wait_for(self, targets: List[asyncio.Task], workers: List[asyncio.Task]):
+        """Wait for targets to finish, failing fast if any worker raises."""
+        pending = set(workers)
+        while not all(task.done() for task in targets):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+    
+    async def _put(self, queue: asyncio.Queue, item, workers: List[asyncio.Task]):
+        """Put with backpressure, surfacing worker failures instead of blocking forever."""
+        put = asyncio.ensure_future(queue.put(item))
+        while True:
+            done, _ = await asyncio.wait(
+                [put, *workers],
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if put in done:
+                return
+            for task in done:
+                if task.exception() is not None:
+                    put.cancel()
+                    raise task.exception()
+            workers = [task for task in workers if not task.done()]
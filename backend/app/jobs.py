@@ -0,0 +1,411 @@
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.ingestion import IngestDocument, IngestionPipeline, iter_file_text
+from app.metrics import metrics
+
+# Jobs ingested at once; each runs its own pipeline
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+# Embedding workers per background job (interactive uploads use INGEST_EMBED_WORKERS)
+INGEST_JOB_EMBED_WORKERS = int(os.getenv("INGEST_JOB_EMBED_WORKERS", "2"))
+# Queued or running jobs accepted before uploads are refused with 429
+INGEST_JOB_MAX_PENDING = int(os.getenv("INGEST_JOB_MAX_PENDING", "100"))
+# Documents per pipeline run; finished runs are journaled and skipped on resume
+INGEST_JOB_RUN_DOCUMENTS = int(os.getenv("INGEST_JOB_RUN_DOCUMENTS", "16"))
+# Larger spooled documents stream from disk instead of going to the chunk pool whole
+INGEST_JOB_POOL_MAX_BYTES = int(os.getenv("INGEST_JOB_POOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# Finished jobs are forgotten after this long
+INGEST_JOB_RETENTION = float(os.getenv("INGEST_JOB_RETENTION_HOURS", "168")) * 3600
+
+SPOOLING, QUEUED, RUNNING, SUCCEEDED, FAILED = "spooling", "queued", "running", "succeeded", "failed"
+COUNTS = ("chunks_created", "chunks_embedded", "chunks_unchanged", "chunks_deleted")
+
+class JobQueueFull(Exception):
+    """INGEST_JOB_MAX_PENDING jobs are already waiting."""
+
+class JobJournal:
+    """Ingestion jobs and their documents, in SQLite under ``path``.
+    
+    A job is reserved before its documents are spooled, so it holds its
+    place while the text is written. Document text is spooled to
+    ``path/spool/<job>/<position>.txt`` when the job is submitted, so a
+    restart can finish it. Each document is marked done once the
+    pipeline run containing it has committed.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "spool"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "journal.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, replace_sources TEXT NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT, "
+            + ", ".join(f"{count} INTEGER NOT NULL DEFAULT 0" for count in COUNTS) + ")"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_documents ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, source TEXT NOT NULL, "
+            "title TEXT NOT NULL, attributes TEXT, done INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (job_id, position)) WITHOUT ROWID"
+        )
+        self._db.commit()
+    
+    def spool_path(self, job_id: str, position: int) -> str:
+        return os.path.join(self.path, "spool", job_id, f"{position}.txt")
+    
+    def reserve(self, job_id: str, replace_sources: Iterable[str]):
+        """Record a job that is still spooling and create its spool directory."""
+        os.makedirs(os.path.dirname(self.spool_path(job_id, 0)), exist_ok=True)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, replace_sources, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, SPOOLING, json.dumps(sorted(replace_sources)), time.time())
+            )
+            self._db.commit()
+    
+    def create(self, job_id: str, documents: List[Dict[str, Any]]):
+        """Queue a reserved job whose documents (source, title, attributes) are now spooled."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO job_documents (job_id, position, source, title, attributes) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (job_id, position, doc["source"], doc["title"], json.dumps(doc["attributes"]))
+                    for position, doc in enumerate(documents)
+                ]
+            )
+            self._db.execute("UPDATE jobs SET status = ? WHERE id = ?", (QUEUED, job_id))
+            self._db.commit()
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job row plus document progress, or None if unknown."""
+        with self._lock:
+            self._db.row_factory = sqlite3.Row
+            try:
+                row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    return None
+                total, done = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(done), 0) FROM job_documents WHERE job_id = ?",
+                    (job_id,)
+                ).fetchone()
+            finally:
+                self._db.row_factory = None
+        job = dict(row)
+        job["replace_sources"] = json.loads(job["replace_sources"])
+        job["documents_total"] = total
+        job["documents_done"] = done
+        return job
+    
+    def pending_documents(self, job_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT position, source, title, attributes FROM job_documents "
+                "WHERE job_id = ? AND done = 0 ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        return [
+            {"position": position, "source": source, "title": title, "attributes": json.loads(attributes)}
+            for position, source, title, attributes in rows
+        ]
+    
+    def abandoned(self) -> List[str]:
+        """Jobs a restart interrupted while their documents were being spooled."""
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = ?", (SPOOLING,))
+            return [job_id for (job_id,) in rows]
+    
+    def unfinished(self) -> List[str]:
+        """Queued and interrupted jobs, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            )
+            return [job_id for (job_id,) in rows]
+    
+    def start(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (RUNNING, time.time(), job_id)
+            )
+            self._db.commit()
+    
+    def complete_documents(self, job_id: str, positions: List[int], result: Dict[str, Any]):
+        """Mark a finished run's documents done and add its chunk counts, atomically."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE job_documents SET done = 1 WHERE job_id = ? AND position = ?",
+                [(job_id, position) for position in positions]
+            )
+            self._db.execute(
+                "UPDATE jobs SET " + ", ".join(f"{count} = {count} + ?" for count in COUNTS) + " WHERE id = ?",
+                [result[count] for count in COUNTS] + [job_id]
+            )
+            self._db.commit()
+    
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id)
+            )
+            self._db.commit()
+        shutil.rmtree(os.path.join(self.path, "spool", job_id), ignore_errors=True)
+    
+    def prune(self, before: float) -> int:
+        """Forget jobs that finished before ``before``; returns how many."""
+        with self._lock:
+            ids = [
+                job_id for (job_id,) in self._db.execute(
+                    "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                    (before,)
+                )
+            ]
+            self._db.executemany("DELETE FROM job_documents WHERE job_id = ?", [(job_id,) for job_id in ids])
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+            self._db.commit()
+            return len(ids)
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def _runs(documents: List[Dict[str, Any]], size: int) -> List[List[Dict[str, Any]]]:
+    """Split documents into pipeline runs of about ``size``, keeping each source in one run.
+    
+    A replaced source must see all of its documents in one run, or the
+    second run would delete the chunks the first one stored.
+    """
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for document in documents:
+        by_source.setdefault(document["source"], []).append(document)
+    
+    runs: List[List[Dict[str, Any]]] = []
+    for group in by_source.values():
+        if not runs or len(runs[-1]) + len(group) > size:
+            runs.append([])
+        runs[-1].extend(group)
+    return [run for run in runs if run]
+
+class IngestionJobQueue:
+    """Background ingestion: uploads are journaled and spooled, then ingested here.
+    
+    ``workers`` jobs run at once, each through a pipeline built by
+    ``pipeline_factory`` (fewer embedding workers than an interactive
+    upload, chunking in the process pool), so ingestion leaves headroom
+    for queries. Jobs interrupted by a restart resume from their first
+    unfinished pipeline run when ``start`` is called.
+    """
+    
+    def __init__(
+        self,
+        journal: JobJournal,
+        pipeline_factory: Callable[[], IngestionPipeline],
+        answer_cache=None,
+        workers: int = INGEST_JOB_WORKERS,
+        max_pending: int = INGEST_JOB_MAX_PENDING
+    ):
+        self.journal = journal
+        self.pipeline_factory = pipeline_factory
+        self.answer_cache = answer_cache
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending = 0
+        # Chunks stored so far by each job's current pipeline run
+        self._in_flight: Dict[str, int] = {}
+    
+    async def start(self):
+        """Resume unfinished jobs and start the workers."""
+        pruned = await run_in_threadpool(self.journal.prune, time.time() - INGEST_JOB_RETENTION)
+        if pruned:
+            print(f"Pruned {pruned} finished ingestion jobs")
+        for job_id in await run_in_threadpool(self.journal.abandoned):
+            await run_in_threadpool(self.journal.finish, job_id, FAILED, "Interrupted while spooling the upload")
+        self._queue = asyncio.Queue()
+        for job_id in await run_in_threadpool(self.journal.unfinished):
+            self._enqueue(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def submit(self, documents: List[IngestDocument], replace_sources: Iterable[str] = ()) -> str:
+        """Spool the documents, journal the job and queue it; returns the job id."""
+        if self._queue is None:
+            raise RuntimeError("Ingestion job queue not started")
+        if self._pending >= self.max_pending:
+            raise JobQueueFull(f"{self._pending} ingestion jobs already pending")
+        # Claim the slot before the first await, so concurrent uploads cannot overshoot
+        self._reserve()
+        
+        job_id = uuid.uuid4().hex
+        queued = False
+        try:
+            await run_in_threadpool(self.journal.reserve, job_id, replace_sources)
+            records = []
+            for position, (pieces, source, title, *attributes) in enumerate(documents):
+                await self._spool(self.journal.spool_path(job_id, position), pieces)
+                records.append({
+                    "source": source,
+                    "title": title,
+                    "attributes": attributes[0] if attributes else None
+                })
+            await run_in_threadpool(self.journal.create, job_id, records)
+            self._queue.put_nowait(job_id)
+            queued = True
+        except Exception as e:
+            await run_in_threadpool(self.journal.finish, job_id, FAILED, f"Spooling failed: {e}")
+            raise
+        finally:
+            if not queued:
+                self._release()
+        return job_id
+    
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.journal.get(job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "documents_total": job["documents_total"],
+            "documents_done": job["documents_done"],
+            **{count: job[count] for count in COUNTS},
+            # Stored by the pipeline run in progress, not yet in the counts above
+            "chunks_in_flight": self._in_flight.get(job_id, 0),
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"]
+        }
+    
+    async def close(self):
+        """Stop the workers; a job cut short stays running in the journal and resumes."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def _reserve(self):
+        self._pending += 1
+        metrics.set("rag_ingest_jobs_pending", self._pending)
+    
+    def _release(self):
+        self._pending -= 1
+        metrics.set("rag_ingest_jobs_pending", self._pending)
+    
+    def _enqueue(self, job_id: str):
+        self._reserve()
+        self._queue.put_nowait(job_id)
+    
+    async def _spool(self, path: str, pieces):
+        """Write a document to its spool file; opening, writing and closing all run in the threadpool."""
+        if isinstance(pieces, str):
+            await run_in_threadpool(_write_text, path, pieces)
+            return
+        f = await run_in_threadpool(open, path, "w", encoding="utf-8")
+        try:
+            async for piece in pieces:
+                await run_in_threadpool(f.write, piece)
+        finally:
+            await run_in_threadpool(f.close)
+    
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+                metrics.inc("rag_ingest_jobs_total", status=SUCCEEDED)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ingestion job {job_id} failed: {e}")
+                metrics.inc("rag_ingest_jobs_total", status=FAILED)
+                await run_in_threadpool(self.journal.finish, job_id, FAILED, str(e))
+            finally:
+                self._in_flight.pop(job_id, None)
+                self._release()
+    
+    async def _run(self, job_id: str):
+        job = await run_in_threadpool(self.journal.get, job_id)
+        await run_in_threadpool(self.journal.start, job_id)
+        replace_sources = set(job["replace_sources"])
+        documents = await run_in_threadpool(self.journal.pending_documents, job_id)
+        
+        for run in _runs(documents, INGEST_JOB_RUN_DOCUMENTS):
+            sources = {document["source"] for document in run}
+            self._invalidate(sources)
+            self._in_flight[job_id] = 0
+            
+            def progress(chunks: int):
+                self._in_flight[job_id] += chunks
+            
+            result = await self.pipeline_factory().run(
+                [await self._document(job_id, document) for document in run],
+                replace_sources=sources & replace_sources,
+                progress=progress
+            )
+            self._invalidate(sources)
+            await run_in_threadpool(
+                self.journal.complete_documents,
+                job_id,
+                [document["position"] for document in run],
+                result
+            )
+            self._in_flight[job_id] = 0
+        
+        await run_in_threadpool(self.journal.finish, job_id, SUCCEEDED)
+    
+    async def _document(self, job_id: str, document: Dict[str, Any]) -> IngestDocument:
+        """Whole text for the chunk pool when small enough, else a stream from the spool file."""
+        path = self.journal.spool_path(job_id, document["position"])
+        if os.path.getsize(path) <= INGEST_JOB_POOL_MAX_BYTES:
+            pieces = await run_in_threadpool(_read_text, path)
+        else:
+            pieces = iter_file_text(path)
+        return (pieces, document["source"], document["title"], document["attributes"])
+    
+    def _invalidate(self, sources):
+        """Drop cached answers built from sources whose chunks are changing."""
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_sources(sources)
+
+def _write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+_journal: Optional[JobJournal] = None
+_journal_lock = threading.Lock()
+
+def get_job_journal() -> JobJournal:
+    """Process-wide ingestion job journal (INGEST_JOBS_PATH)."""
+    global _journal
+    
+    with _journal_lock:
+        if _journal is None:
+            _journal = JobJournal(os.getenv("INGEST_JOBS_PATH", ".cache/jobs"))
+        return _journal
+
+def close_job_journal():
+    global _journal
+    
+    with _journal_lock:
+        if _journal is not None:
+            _journal.close()
+            _journal = None
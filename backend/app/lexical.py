@@ -0,0 +1,407 @@
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+# Ranked BM25 hits read back per filtered search before giving up on more matches
+FILTER_SCAN_LIMIT = int(os.getenv("LEXICAL_FILTER_SCAN_LIMIT", "2000"))
+
+class BM25Index:
+    """Incremental BM25 inverted index over tiktoken token ids.
+    
+    Token ids are folded into terms by their bytes, stripped of
+    surrounding whitespace and lower-cased, so " Error" in a document
+    matches "error" in a query. Postings are compact growable arrays per
+    term (uint32 doc numbers, uint16 term frequencies) and are scored
+    with vectorized NumPy. Chunk
+    payloads are not held in memory: they live in an append-only JSONL
+    log under ``path`` and only the top hits are read back. Deletes are
+    appended to the same log as tombstones.
+    
+    ``save`` snapshots postings to ``postings.npz``; on startup the
+    snapshot is loaded and log records written after it are re-indexed.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        encode: Callable[[str], List[int]],
+        token_bytes: Callable[[int], bytes],
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_df_ratio: float = 0.5,
+        save_every: int = 50000
+    ):
+        self.path = path
+        self.encode = encode
+        self.token_bytes = token_bytes
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._postings: Dict[int, Tuple[array, array]] = {}
+        self._term_cache: Dict[int, int] = {}
+        self._doc_len = array("I")
+        self._offsets = array("Q")
+        self._deleted = bytearray()
+        self._ids: List[str] = []
+        self._docs: Dict[str, int] = {}
+        self._total_len = 0
+        self._live = 0
+        self._unsaved = 0
+        
+        os.makedirs(path, exist_ok=True)
+        self._log_path = os.path.join(path, "docs.jsonl")
+        self._snapshot_path = os.path.join(path, "postings.npz")
+        self._load()
+        self._log = open(self._log_path, "ab")
+        self._reader = open(self._log_path, "rb")
+    
+    def __len__(self) -> int:
+        return self._live
+    
+    def add(
+        self,
+        ids: Sequence[str],
+        payloads: Sequence[Dict[str, Any]],
+        tokens: Optional[Sequence[Optional[List[int]]]] = None
+    ):
+        """Index chunks; pass the chunker's token ids to skip re-encoding."""
+        tokens = tokens or [None] * len(ids)
+        with self._lock:
+            for point_id, payload, doc_tokens in zip(ids, payloads, tokens):
+                record = json.dumps(
+                    {"id": point_id, "payload": payload},
+                    separators=(",", ":"),
+                    ensure_ascii=False
+                ).encode("utf-8") + b"\n"
+                offset = self._log.tell()
+                self._log.write(record)
+                if doc_tokens is None:
+                    doc_tokens = self.encode(payload["text"])
+                self._index(point_id, doc_tokens, offset)
+            self._log.flush()
+            self._unsaved += len(ids)
+            if self._unsaved >= self.save_every:
+                self._save()
+    
+    def delete(self, ids: Sequence[str]):
+        """Drop chunks from results; postings are reclaimed on rebuild."""
+        with self._lock:
+            deleted = 0
+            for point_id in ids:
+                if point_id not in self._docs:
+                    continue
+                self._log.write(json.dumps(
+                    {"id": point_id, "deleted": True},
+                    separators=(",", ":"),
+                    ensure_ascii=False
+                ).encode("utf-8") + b"\n")
+                self._drop(point_id)
+                deleted += 1
+            if not deleted:
+                return
+            self._log.flush()
+            self._unsaved += deleted
+            if self._unsaved >= self.save_every:
+                self._save()
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        search_filter=None,
+        normalize: bool = False
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        """BM25 top-k; returns (id, payload, score), best first.
+        
+        With a ``search_filter`` (see app.filters), hits are read in score
+        order until ``top_k`` pass it or FILTER_SCAN_LIMIT have been read.
+        With ``normalize``, scores are divided by the most the query could
+        score (every term matched at saturated frequency), so they fall in
+        [0, 1) and a few incidental matches in a long query stay near 0.
+        """
+        terms = set(self._terms(self.encode(query)))
+        with self._lock:
+            if not terms or self._live == 0 or top_k <= 0:
+                return []
+            
+            scored = self._score(terms)
+            if scored is None:
+                return []
+            unique, totals, ceiling = scored
+            if normalize:
+                totals /= ceiling
+            if search_filter:
+                return self._filtered_top_k(unique, totals, top_k, search_filter)
+            
+            k = min(top_k, len(totals))
+            top = np.argpartition(-totals, k - 1)[:k]
+            top = top[np.argsort(-totals[top])]
+            
+            return [
+                (self._ids[doc], self._read_payload(doc), float(totals[i]))
+                for i, doc in zip(top.tolist(), unique[top].tolist())
+                if totals[i] > 0
+            ]
+    
+    def _filtered_top_k(self, unique: np.ndarray, totals: np.ndarray, top_k: int, search_filter):
+        k = min(FILTER_SCAN_LIMIT, int((totals > 0).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top])]
+        
+        hits = []
+        for i, doc in zip(top.tolist(), unique[top].tolist()):
+            payload = self._read_payload(doc)
+            if search_filter.matches(payload):
+                hits.append((self._ids[doc], payload, float(totals[i])))
+                if len(hits) == top_k:
+                    break
+        return hits
+    
+    def _score(self, terms) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        """Summed BM25 per matching document as (doc numbers, scores, ceiling).
+        
+        The ceiling is the score of a document matching every scored
+        query term at saturated frequency; terms missing from the index
+        count toward it at the idf of an unseen term.
+        
+        Works on zero-copy views of the postings arrays, which must be
+        released before the lock is, so the arrays can grow again.
+        """
+        doc_count = len(self._ids)
+        avg_len = self._total_len / self._live
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+        all_docs, all_scores = [], []
+        ceiling = 0.0
+        for term in terms:
+            entry = self._postings.get(term)
+            if entry is None:
+                ceiling += math.log(1.0 + (self._live + 0.5) / 0.5) * (self.k1 + 1.0)
+                continue
+            docs = np.frombuffer(entry[0], dtype=np.uint32)
+            df = len(docs)
+            # Near-stopword tokens cost the most and rank the least
+            if df > self.max_df_ratio * self._live and len(terms) > 1:
+                continue
+            idf = math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+            ceiling += idf * (self.k1 + 1.0)
+            tf = np.frombuffer(entry[1], dtype=np.uint16).astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[docs] / avg_len)
+            all_docs.append(docs)
+            all_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        
+        if not all_docs:
+            return None
+        docs = np.concatenate(all_docs)
+        scores = np.concatenate(all_scores)
+        
+        # Sum per document: sort-based for sparse hits, dense bincount otherwise
+        if len(docs) * 16 < doc_count:
+            unique, inverse = np.unique(docs, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+        else:
+            totals = np.bincount(docs, weights=scores, minlength=doc_count)
+            unique = np.arange(doc_count)
+        
+        deleted = np.frombuffer(self._deleted, dtype=np.uint8)[unique].astype(bool)
+        totals[deleted] = 0.0
+        return unique, totals, ceiling
+    
+    def save(self):
+        """Snapshot postings so startup does not re-index the whole log."""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+    
+    def close(self):
+        self.save()
+        with self._lock:
+            self._log.close()
+            self._reader.close()
+    
+    def _drop(self, point_id: str):
+        doc = self._docs.pop(point_id, None)
+        if doc is not None and not self._deleted[doc]:
+            self._deleted[doc] = 1
+            self._total_len -= self._doc_len[doc]
+            self._live -= 1
+    
+    def _index(self, point_id: str, tokens: List[int], offset: int):
+        self._drop(point_id)
+        
+        doc = len(self._ids)
+        self._ids.append(point_id)
+        self._docs[point_id] = doc
+        self._doc_len.append(len(tokens))
+        self._offsets.append(offset)
+        self._deleted.append(0)
+        self._total_len += len(tokens)
+        self._live += 1
+        
+        counts: Dict[int, int] = {}
+        for term in self._terms(tokens):
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = (array("I"), array("H"))
+                self._postings[term] = entry
+            entry[0].append(doc)
+            entry[1].append(min(count, 65535))
+    
+    def _terms(self, tokens: List[int]) -> List[int]:
+        """Map token ids to normalized 64-bit term ids, skipping whitespace tokens."""
+        terms = []
+        cache = self._term_cache
+        for token in tokens:
+            term = cache.get(token)
+            if term is None:
+                normalized = self.token_bytes(token).strip().lower()
+                term = int.from_bytes(
+                    hashlib.blake2b(normalized, digest_size=8).digest(), "little"
+                ) if normalized else 0
+                cache[token] = term
+            if term:
+                terms.append(term)
+        return terms
+    
+    def _read_payload(self, doc: int) -> Dict[str, Any]:
+        self._reader.seek(self._offsets[doc])
+        return json.loads(self._reader.readline())["payload"]
+    
+    def _save(self):
+        self._log.flush()
+        terms = np.array(sorted(self._postings), dtype=np.uint64)
+        lengths = np.array([len(self._postings[t][0]) for t in terms.tolist()], dtype=np.int64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        docs = np.empty(offsets[-1], dtype=np.uint32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms.tolist()):
+            entry = self._postings[term]
+            docs[offsets[i]:offsets[i + 1]] = np.frombuffer(entry[0], dtype=np.uint32)
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(entry[1], dtype=np.uint16)
+        
+        tmp_path = self._snapshot_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=terms,
+            term_offsets=offsets,
+            docs=docs,
+            tfs=tfs,
+            doc_len=np.frombuffer(self._doc_len, dtype=np.uint32),
+            log_offsets=np.frombuffer(self._offsets, dtype=np.uint64),
+            deleted=np.frombuffer(self._deleted, dtype=np.uint8),
+            ids=np.array(self._ids, dtype=np.bytes_),
+            log_size=np.array([self._log.tell()], dtype=np.int64)
+        )
+        os.replace(tmp_path, self._snapshot_path)
+        self._unsaved = 0
+    
+    def _load(self):
+        log_start = 0
+        if os.path.exists(self._snapshot_path):
+            with np.load(self._snapshot_path) as data:
+                terms = data["terms"].tolist()
+                offsets = data["term_offsets"].tolist()
+                docs, tfs = data["docs"], data["tfs"]
+                for i, term in enumerate(terms):
+                    self._postings[term] = (
+                        array("I", docs[offsets[i]:offsets[i + 1]].tobytes()),
+                        array("H", tfs[offsets[i]:offsets[i + 1]].tobytes())
+                    )
+                self._doc_len = array("I", data["doc_len"].tobytes())
+                self._offsets = array("Q", data["log_offsets"].tobytes())
+                self._deleted = bytearray(data["deleted"].tobytes())
+                self._ids = [raw.decode("utf-8") for raw in data["ids"].tolist()]
+                log_start = int(data["log_size"][0])
+            
+            for doc, point_id in enumerate(self._ids):
+                if not self._deleted[doc]:
+                    self._docs[point_id] = doc
+                    self._total_len += self._doc_len[doc]
+                    self._live += 1
+        
+        if not os.path.exists(self._log_path):
+            return
+        # Re-index records (and replay tombstones) appended after the snapshot
+        with open(self._log_path, "r+b") as f:
+            f.seek(log_start)
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final write from a crash
+                    f.seek(offset)
+                    f.truncate()
+                    break
+                if record.get("deleted"):
+                    self._drop(record["id"])
+                else:
+                    self._index(record["id"], self.encode(record["payload"]["text"]), offset)
+                self._unsaved += 1
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Dict[str, Any]]],
+    top_k: int,
+    k: int = 60
+) -> List[Dict[str, Any]]:
+    """Fuse ranked chunk lists by sum of 1 / (k + rank), keyed by chunk id.
+    
+    The fused value is stored as ``rrf_score``; ``score`` stays the one
+    from the earliest ranking that returned the chunk, as do other fields
+    both rankings set.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking):
+            key = chunk.get("id") or f"{chunk['source']}:{chunk['position']}"
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            fused[key] = {**chunk, **fused.get(key, {})}
+    
+    ordered = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**fused[key], "rrf_score": scores[key]} for key in ordered]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_lexical_index() -> Optional[BM25Index]:
+    """Process-wide BM25 index, or None when HYBRID_SEARCH is off."""
+    global _index
+    
+    if os.getenv("HYBRID_SEARCH", "true").lower() != "true":
+        return None
+    with _index_lock:
+        if _index is None:
+            import tiktoken
+            encoding = tiktoken.get_encoding("cl100k_base")
+            _index = BM25Index(
+                os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical"),
+                encode=encoding.encode_ordinary,
+                token_bytes=encoding.decode_single_token_bytes
+            )
+        return _index
+
+def close_lexical_index():
+    """Snapshot and close the shared index if it was opened."""
+    global _index
+    
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
@@ -1,39 +1,163 @@
 import os
 import time
 import re
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 
-class LLMService:
-    def __init__(self):
-        self.provider = os.getenv("LLM_PROVIDER", "groq")
+from app.context import context_window, get_context_packer
+from app.http_client import get_async_http_client
+from app.metrics import metrics, traced
+from app.resilience import ProviderPool, Upstream
+
+SYSTEM_PROMPT = "You are a helpful assistant that provides accurate answers with citations."
+
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+PARTIAL_CITATION = re.compile(r"\[\d{0,6}")
+# Tokens per context entry for its "[n] " label and the blank line between entries
+CHUNK_LABEL_TOKENS = 6
+# Deadline per provider attempt; past it the next provider is tried
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT_MS", "30000")) / 1000.0
+
+DEFAULT_MODELS = {"groq": "llama-3.1-70b-versatile", "openai": "gpt-4-turbo-preview"}
+
+class LLMTarget:
+    """A provider's SDK client and the model to ask it for."""
+    
+    def __init__(self, provider: str, model: str, client):
+        self.provider = provider
+        self.model = model
+        self.client = client
+
+def _llm_client(provider: str, use_async: bool):
+    if provider == "groq":
+        from groq import Groq, AsyncGroq
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not set")
+        if use_async:
+            return AsyncGroq(api_key=api_key, http_client=get_async_http_client())
+        return Groq(api_key=api_key)
+    
+    from openai import OpenAI, AsyncOpenAI
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not set")
+    if use_async:
+        return AsyncOpenAI(api_key=api_key, http_client=get_async_http_client())
+    return OpenAI(api_key=api_key)
+
+def llm_upstreams(use_async: bool) -> List[Upstream]:
+    """Providers in failover order.
+    
+    LLM_PROVIDERS lists "provider:model" entries, e.g.
+    "groq:llama-3.1-70b-versatile,openai:gpt-4o-mini"; without it the
+    single LLM_PROVIDER (with GROQ_MODEL/OPENAI_MODEL) is used.
+    """
+    spec = os.getenv("LLM_PROVIDERS")
+    if spec:
+        entries = [entry.strip().partition(":")[::2] for entry in spec.split(",") if entry.strip()]
+    else:
+        provider = os.getenv("LLM_PROVIDER", "groq")
+        entries = [(provider, "")]
+    
+    clients = {}
+    upstreams = []
+    for provider, model in entries:
+        provider = "groq" if provider == "groq" else "openai"
+        model = model or os.getenv(f"{provider.upper()}_MODEL", DEFAULT_MODELS[provider])
+        if provider not in clients:
+            clients[provider] = _llm_client(provider, use_async)
+        upstreams.append(Upstream(f"{provider}:{model}", LLMTarget(provider, model, clients[provider])))
+    return upstreams
+
+class CitationParser:
+    """Incremental parser for inline [n] citations in a streamed answer.
+    
+    ``feed`` takes each text delta and returns citation ids seen for the
+    first time; a marker split across deltas ("[1" + "2]") is held back
+    until it closes. Ids outside 1..max_id are ignored.
+    """
+    
+    def __init__(self, max_id: int):
+        self.max_id = max_id
+        self.ids: List[int] = []
+        self._seen = set()
+        self._pending = ""
+    
+    def feed(self, text: str) -> List[int]:
+        buffer = self._pending + text
+        new_ids = []
+        for match in CITATION_PATTERN.finditer(buffer):
+            cid = int(match.group(1))
+            if 1 <= cid <= self.max_id and cid not in self._seen:
+                self._seen.add(cid)
+                self.ids.append(cid)
+                new_ids.append(cid)
         
-        if self.provider == "groq":
-            from groq import Groq
-            api_key = os.getenv("GROQ_API_KEY")
-            if not api_key:
-                raise ValueError("GROQ_API_KEY not set")
-            self.client = Groq(api_key=api_key)
-            self.model = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
-        else:
-            from openai import OpenAI
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise ValueError("OPENAI_API_KEY not set")
-            self.client = OpenAI(api_key=api_key)
-            self.model = os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
+        start = buffer.rfind("[")
+        tail = buffer[start:] if start != -1 else ""
+        self._pending = tail if PARTIAL_CITATION.fullmatch(tail) else ""
+        return new_ids
+
+class _BaseLLMService:
+    """Prompting, citation and cost logic shared by the sync and async services."""
     
-    def generate_answer(
+    def _configure(self, use_async: bool):
+        self.pool = ProviderPool("llm", llm_upstreams(use_async), LLM_TIMEOUT)
+        
+        self.packer = get_context_packer()
+        # Completion tokens reserved out of the context window (and sent as max_tokens)
+        self.max_answer_tokens = int(os.getenv("LLM_MAX_ANSWER_TOKENS", "1024"))
+        # Optional cap on context tokens below what the window allows (0 = none)
+        self.context_max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+        # Context is packed once, so it must fit every model it may fail over to
+        self.context_window = min(context_window(upstream.target.model) for upstream in self.pool.upstreams)
+    
+    @property
+    def provider(self) -> str:
+        return self.pool.primary.target.provider
+    
+    @property
+    def model(self) -> str:
+        return self.pool.primary.target.model
+    
+    @property
+    def client(self):
+        return self.pool.primary.target.client
+    
+    @client.setter
+    def client(self, client):
+        # Benchmarks swap in a fake client for the primary provider
+        self.pool.primary.target.client = client
+    
+    def _prepare(
         self,
         query: str,
         context_chunks: List[Dict[str, Any]]
-    ) -> Dict[str, Any]:
-        """Generate answer with citations."""
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        """Pack chunks into the model's token budget; returns (packed chunks, messages)."""
+        overhead = self.packer.count_messages(self._build_messages(self._build_prompt(query, [])))
+        budget = (
+            self.context_window
+            - self.max_answer_tokens
+            - overhead
+            - CHUNK_LABEL_TOKENS * len(context_chunks)
+        )
+        if self.context_max_tokens:
+            budget = min(budget, self.context_max_tokens)
+        packed = self.packer.pack(context_chunks, max(budget, 0))
+        return packed, self._build_messages(self._build_prompt(query, packed))
+    
+    def _build_prompt(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> str:
         context_text = "\n\n".join([
             f"[{i+1}] {chunk['text']}"
             for i, chunk in enumerate(context_chunks)
         ])
         
-        prompt = f"""You are a helpful assistant that answers questions based on the provided context. 
+        return f"""You are a helpful assistant that answers questions based on the provided context. 
 Always cite your sources using [1], [2], etc. when referencing information from the context.
 
 Context:
@@ -45,77 +169,219 @@ Answer the question based on the context above. Include inline citations like [1
 If the context doesn't contain enough information to answer, say "I don't have enough information to answer this question based on the provided context."
 
 Answer:"""
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _citation(self, cid: int, context_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        chunk = context_chunks[cid - 1]
+        return {
+            "id": cid,
+            "text": chunk["text"][:200] + "...",
+            "source": chunk["source"],
+            "title": chunk.get("title", ""),
+            "section": chunk.get("section", "")
+        }
+    
+    def _format_result(
+        self,
+        answer: str,
+        messages: List[Dict[str, str]],
+        context_chunks: List[Dict[str, Any]],
+        elapsed: float,
+        citation_ids: Optional[List[int]] = None,
+        usage: Optional[Tuple[int, int]] = None,
+        provider: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if not answer:
+            answer = "No answer generated."
+        
+        # Extract citations from answer, in order of first mention
+        if citation_ids is None:
+            parser = CitationParser(len(context_chunks))
+            parser.feed(answer)
+            citation_ids = parser.ids
+        citations = [self._citation(cid, context_chunks) for cid in citation_ids]
+        
+        # Provider-reported usage when available, else exact tiktoken counts
+        if usage is not None:
+            input_tokens, output_tokens = usage
+        else:
+            input_tokens = self.packer.count_messages(messages)
+            output_tokens = self.packer.count(answer)
+        
+        return {
+            "answer": answer,
+            "citations": citations,
+            "timing": {"llm_generation": elapsed},
+            "token_estimate": {
+                "input": input_tokens,
+                "output": output_tokens,
+                "total": input_tokens + output_tokens,
+                "context": sum(chunk["context_tokens"] for chunk in context_chunks),
+                "context_chunks": len(context_chunks)
+            },
+            "cost_estimate": self._estimate_cost(input_tokens, output_tokens, provider or self.provider)
+        }
+    
+    def _error_result(self, e: Exception) -> Dict[str, Any]:
+        metrics.inc("rag_fallbacks_total", stage="llm")
+        return {
+            "answer": f"Error generating answer: {str(e)}",
+            "citations": [],
+            "timing": {"llm_generation": 0},
+            "token_estimate": {"input": 0, "output": 0, "total": 0},
+            "cost_estimate": 0.0,
+            "error": str(e)
+        }
+    
+    def _usage(self, response) -> Optional[Tuple[int, int]]:
+        """(prompt, completion) tokens reported by the provider, if any."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            # Groq reports streaming usage on the last chunk under x_groq
+            usage = getattr(getattr(response, "x_groq", None), "usage", None)
+        if usage is None or getattr(usage, "prompt_tokens", None) is None:
+            return None
+        return usage.prompt_tokens, usage.completion_tokens or 0
+    
+    def _estimate_cost(self, input_tokens: int, output_tokens: int, provider: str) -> float:
+        """Rough cost estimate for the provider that answered."""
+        if provider == "groq":
+            # Groq is free tier, so $0
+            return 0.0
+        else:
+            # OpenAI GPT-4 Turbo pricing (rough)
+            return (input_tokens / 1000 * 0.01) + (output_tokens / 1000 * 0.03)
+
+class LLMService(_BaseLLMService):
+    def __init__(self):
+        self._configure(use_async=False)
+    
+    @traced("llm.generate_answer")
+    def generate_answer(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Generate answer with citations."""
+        context_chunks, messages = self._prepare(query, context_chunks)
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
-            if self.provider == "groq":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that provides accurate answers with citations."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1
-                )
-            else:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that provides accurate answers with citations."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1
+            upstream, response = self.pool.call_sync(
+                lambda target: target.client.chat.completions.create(
+                    model=target.model,
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=self.max_answer_tokens,
+                    timeout=self.pool.timeout
                 )
+            )
             
             answer = response.choices[0].message.content
-            if not answer:
-                answer = "No answer generated."
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
+            
+            return self._format_result(
+                answer, messages, context_chunks, elapsed,
+                usage=self._usage(response), provider=upstream.target.provider
+            )
+        except Exception as e:
+            return self._error_result(e)
+
+class AsyncLLMService(_BaseLLMService):
+    def __init__(self):
+        self._configure(use_async=True)
+    
+    @traced("llm.generate_answer")
+    async def generate_answer(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Generate answer with citations without blocking the event loop."""
+        context_chunks, messages = self._prepare(query, context_chunks)
+        
+        start_time = time.perf_counter()
+        
+        try:
+            upstream, response = await self.pool.call(
+                lambda target: target.client.chat.completions.create(
+                    model=target.model,
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=self.max_answer_tokens
+                )
+            )
             
-            # Extract citations from answer
-            citation_ids = [int(x) for x in re.findall(r'\[(\d+)\]', answer) if x.isdigit()]
-            citations = [
-                {
-                    "id": cid,
-                    "text": context_chunks[cid-1]["text"][:200] + "...",
-                    "source": context_chunks[cid-1]["source"],
-                    "title": context_chunks[cid-1].get("title", ""),
-                    "section": context_chunks[cid-1].get("section", "")
-                }
-                for cid in set(citation_ids) if 1 <= cid <= len(context_chunks)
-            ]
+            answer = response.choices[0].message.content
+            elapsed = time.perf_counter() - start_time
             
-            # Estimate tokens (rough)
-            input_tokens = len(prompt.split()) * 1.3  # rough estimate
-            output_tokens = len(answer.split()) * 1.3
+            return self._format_result(
+                answer, messages, context_chunks, elapsed,
+                usage=self._usage(response), provider=upstream.target.provider
+            )
+        except Exception as e:
+            return self._error_result(e)
+    
+    @traced("llm.stream_answer")
+    async def stream_answer(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the answer as events: "delta" text, "citation" on first mention, then "done".
+        
+        The "done" event carries the same fields as ``generate_answer``.
+        Failover and hedging cover opening the stream; once tokens flow,
+        a failure ends the answer with an error.
+        """
+        context_chunks, messages = self._prepare(query, context_chunks)
+        parser = CitationParser(len(context_chunks))
+        usage = None
+        parts = []
+        first_token_time = None
+        
+        start_time = time.perf_counter()
+        
+        upstream = None
+        try:
+            upstream, stream = await self.pool.call(
+                lambda target: target.client.chat.completions.create(
+                    model=target.model,
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=self.max_answer_tokens,
+                    stream=True
+                )
+            )
             
-            return {
-                "answer": answer,
-                "citations": citations,
-                "timing": {"llm_generation": elapsed},
-                "token_estimate": {
-                    "input": int(input_tokens),
-                    "output": int(output_tokens),
-                    "total": int(input_tokens + output_tokens)
-                },
-                "cost_estimate": self._estimate_cost(input_tokens, output_tokens)
-            }
+            async for event in stream:
+                usage = self._usage(event) or usage
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                parts.append(delta)
+                yield {"type": "delta", "text": delta}
+                for cid in parser.feed(delta):
+                    yield {"type": "citation", "citation": self._citation(cid, context_chunks)}
         except Exception as e:
-            return {
-                "answer": f"Error generating answer: {str(e)}",
-                "citations": [],
-                "timing": {"llm_generation": 0},
-                "token_estimate": {"input": 0, "output": 0, "total": 0},
-                "cost_estimate": 0.0
-            }
-    
-    def _estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
-        """Rough cost estimate."""
-        if self.provider == "groq":
-            # Groq is free tier, so $0
-            return 0.0
-        else:
-            # OpenAI GPT-4 Turbo pricing (rough)
-            return (input_tokens / 1000 * 0.01) + (output_tokens / 1000 * 0.03)
-
+            if upstream is not None:
+                upstream.breaker.record_failure()
+            yield {"type": "done", **self._error_result(e)}
+            return
+        
+        elapsed = time.perf_counter() - start_time
+        result = self._format_result(
+            "".join(parts), messages, context_chunks, elapsed, parser.ids, usage, upstream.target.provider
+        )
+        result["timing"]["llm_first_token"] = first_token_time or elapsed
+        yield {"type": "done", **result}
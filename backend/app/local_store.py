@@ -0,0 +1,456 @@
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import json
+import math
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from app.ann import HNSWIndex
+from app.filters import PayloadIndex, SearchFilter
+from app.metrics import traced
+from app.quantization import make_codes, rescored_top_k
+from app.vector_db import VectorStore, _build_payload
+
+# Filters matching at most this share of rows are answered by scoring just those rows
+FILTER_SUBSET_FRACTION = float(os.getenv("LOCAL_FILTER_SUBSET_FRACTION", "0.1"))
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store on a memory-mapped float32 matrix.
+    
+    Layout of ``path``:
+    
+    - ``vectors.f32``: row-major unit-normalized vectors, grown by doubling
+    - ``payloads.jsonl``: append-only log of ``{"id", "row", "payload"}``
+      and ``{"id", "row", "deleted": true}`` tombstones; replayed on
+      startup, later records for the same id win
+    - ``meta.json``: the embedding dimension the store was created with
+    - ``hnsw.npz``: optional HNSW graph (``index="hnsw"``)
+    
+    Vectors are written and flushed before their log record, so a crash
+    mid-upsert leaves at most an unreferenced row behind. Rows missing
+    from a saved HNSW graph are inserted again on startup.
+    
+    With an HNSW index, searches over at least ``ann_min_points`` vectors
+    use the graph; smaller stores keep the exact scan.
+    
+    Filters resolve to a row mask through an in-memory inverted payload
+    index (see ``PayloadIndex``), rebuilt from the log on startup.
+    
+    With ``quantization`` ("int8" or "binary") the exact scan runs over an
+    in-memory quantized copy of the vectors, rebuilt on startup, and the
+    best ``limit * oversampling`` rows are rescored against the float32
+    matrix, which then only has to be paged in for those rows.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        dimension: int,
+        initial_capacity: int = 1024,
+        index: str = "exact",
+        ann_min_points: int = 10000,
+        hnsw_params: Optional[Dict[str, int]] = None,
+        save_every: int = 10000,
+        quantization: str = "none",
+        oversampling: float = 4.0
+    ):
+        self.path = path
+        self.dimension = dimension
+        self.ann_min_points = ann_min_points
+        self.save_every = save_every
+        self.oversampling = oversampling
+        self.codes = make_codes(quantization, dimension)
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # Tombstoned rows, excluded from search; rows are not reused
+        self._dead: Optional[np.ndarray] = None
+        dead_rows: List[int] = []
+        
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "payloads.jsonl")
+        self._check_meta()
+        self._replay_log(dead_rows)
+        self.payload_index = PayloadIndex()
+        for row, payload in enumerate(self._payloads):
+            if payload:
+                self.payload_index.add(row, payload)
+        
+        existing = os.path.getsize(self._vectors_path) // (4 * dimension) if os.path.exists(self._vectors_path) else 0
+        self._capacity = 0
+        self._vectors = None
+        self._grow(max(initial_capacity, existing, len(self._ids)))
+        self._dead[dead_rows] = True
+        if self.codes is not None:
+            self._encode_existing()
+        self._log = open(self._log_path, "a", encoding="utf-8")
+        
+        self.index: Optional[HNSWIndex] = None
+        self._index_path = os.path.join(path, "hnsw.npz")
+        self._unsaved = 0
+        if index == "hnsw":
+            self._load_index(hnsw_params or {})
+        elif index != "exact":
+            raise ValueError(f"Unknown local index type: {index}")
+    
+    @property
+    def count(self) -> int:
+        return len(self._rows)
+    
+    @traced("vector_db.upsert")
+    def upsert_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """Upsert document chunks with embeddings."""
+        if not chunks or not len(embeddings):
+            return
+        
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dimension}"
+            )
+        ids = ids or [str(uuid.uuid4()) for _ in chunks]
+        
+        with self._lock:
+            rows = []
+            new_rows = []
+            for point_id in ids:
+                row = self._rows.get(point_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[point_id] = row
+                    self._ids.append(point_id)
+                    self._payloads.append({})
+                    new_rows.append(row)
+                rows.append(row)
+            
+            if len(self._ids) > self._capacity:
+                self._grow(max(len(self._ids), self._capacity * 2))
+            
+            # Re-embedded points need new graph links: the old ones were chosen for the old vector
+            relink = []
+            if self.index is not None and len(new_rows) < len(rows):
+                known = set(new_rows)
+                existing = [(i, row) for i, row in enumerate(rows) if row not in known]
+                changed = np.any(
+                    np.abs(self._vectors[[row for _, row in existing]] - vectors[[i for i, _ in existing]]) > 1e-6,
+                    axis=1
+                )
+                relink = [row for (_, row), moved in zip(existing, changed.tolist()) if moved]
+            
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            if self.codes is not None:
+                self.codes.set(rows, vectors)
+            
+            records = []
+            for point_id, row, chunk in zip(ids, rows, chunks):
+                payload = _build_payload(chunk)
+                if self._payloads[row]:
+                    self.payload_index.remove(row, self._payloads[row])
+                self.payload_index.add(row, payload)
+                self._payloads[row] = payload
+                records.append(json.dumps(
+                    {"id": point_id, "row": row, "payload": payload},
+                    separators=(",", ":"),
+                    ensure_ascii=False
+                ))
+            self._log.write("\n".join(records) + "\n")
+            self._log.flush()
+            
+            if self.index is not None:
+                self.index.add(new_rows, self._vectors)
+                self.index.update(relink, self._vectors)
+                self._unsaved += len(new_rows) + len(relink)
+                if self._unsaved >= self.save_every:
+                    self._save_index()
+    
+    @traced("vector_db.delete")
+    def delete_points(self, ids: List[str]):
+        """Tombstone points by id; unknown ids are ignored."""
+        with self._lock:
+            records = []
+            for point_id in ids:
+                row = self._rows.pop(point_id, None)
+                if row is None:
+                    continue
+                self._dead[row] = True
+                self._ids[row] = ""
+                self.payload_index.remove(row, self._payloads[row])
+                self._payloads[row] = {}
+                records.append(json.dumps(
+                    {"id": point_id, "row": row, "deleted": True},
+                    separators=(",", ":")
+                ))
+            if records:
+                self._log.write("\n".join(records) + "\n")
+                self._log.flush()
+    
+    def iter_points(self, batch_size: int = 1024) -> Iterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """Live points in row order, read from the memory map in batches."""
+        count, matrix, dead, ids, payloads, _ = self._snapshot()
+        live = np.flatnonzero(~dead)
+        for start in range(0, len(live), batch_size):
+            # Rows deleted since the snapshot have lost their id
+            rows = [row for row in live[start:start + batch_size].tolist() if ids[row]]
+            yield [ids[row] for row in rows], [payloads[row] for row in rows], np.asarray(matrix[rows])
+    
+    def _snapshot(self):
+        """Rows visible to a read, plus the graph's entry point for exactly those rows."""
+        with self._lock:
+            count = len(self._ids)
+            entry = self.index.entry if self.index is not None else None
+            return count, self._vectors[:count], self._dead[:count].copy(), self._ids, self._payloads, entry
+    
+    def _excluded(self, dead: np.ndarray, search_filter: Optional[SearchFilter]) -> np.ndarray:
+        """Rows a search must skip: tombstones plus rows the filter rejects."""
+        if not search_filter:
+            return dead
+        return dead | ~self.payload_index.mask(search_filter, len(dead))
+    
+    def _search_hits(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Tuple[str, Dict[str, Any], float, Optional[np.ndarray]]]:
+        """Cosine top-k: HNSW when indexed and large enough, exact scan otherwise.
+        
+        A filter matching at most FILTER_SUBSET_FRACTION of the rows is
+        answered by scoring only those rows, so selective filters cost
+        less than an unfiltered search rather than more. ``ef_search``
+        overrides the graph's query-time beam for this search.
+        """
+        count, matrix, dead, ids, payloads, entry = self._snapshot()
+        if count == 0 or limit <= 0:
+            return []
+        
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        excluded = self._excluded(dead, search_filter)
+        excluded_count = int(excluded.sum())
+        live = count - excluded_count
+        if live <= 0:
+            return []
+        
+        subset = bool(search_filter) and live <= FILTER_SUBSET_FRACTION * count
+        if not subset and self.index is not None and count >= self.ann_min_points:
+            # The graph still links excluded rows; fetch extra and drop them
+            fetch = limit + min(excluded_count, limit)
+            if search_filter:
+                fetch = max(fetch, math.ceil(limit * count / live))
+            top, top_scores = self.index.search(
+                query, min(fetch, count), matrix, ef_search=ef_search, entry=entry
+            )
+            keep = ~excluded[top]
+            top, top_scores = top[keep][:limit], top_scores[keep][:limit]
+            # Too few matches survived the graph walk: scan the matching rows instead
+            subset = bool(search_filter) and len(top) < min(limit, live)
+        elif not subset and self.codes is not None:
+            top, top_scores = rescored_top_k(self.codes, query, matrix, limit, self.oversampling, excluded)
+        elif not subset:
+            scores = matrix @ query
+            if excluded_count:
+                scores[excluded] = -np.inf
+            top, top_scores = _top_k(scores, min(limit, live))
+        
+        if subset:
+            rows = np.flatnonzero(~excluded)
+            top, top_scores = _top_k(matrix[rows] @ query, min(limit, live))
+            top = rows[top]
+        
+        return [
+            (ids[row], payloads[row], score, matrix[row] if with_vectors else None)
+            for row, score in zip(top.tolist(), top_scores.tolist())
+            if score >= score_threshold
+        ]
+    
+    def _search_hits_batch(
+        self,
+        query_embeddings: List[List[float]],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Tuple[str, Dict[str, Any], float, Optional[np.ndarray]]]]:
+        """Exact scans share one pass over the matrix: a single (rows x queries) product."""
+        count, matrix, dead, ids, payloads, _ = self._snapshot()
+        excluded = self._excluded(dead, search_filter)
+        live = count - int(excluded.sum())
+        subset = bool(search_filter) and live <= FILTER_SUBSET_FRACTION * count
+        
+        exact = self.codes is None and (self.index is None or count < self.ann_min_points)
+        if not (exact or subset) or len(query_embeddings) < 2:
+            return super()._search_hits_batch(
+                query_embeddings, limit, score_threshold, with_vectors, search_filter, ef_search
+            )
+        
+        k = min(limit, live)
+        if k <= 0:
+            return [[] for _ in query_embeddings]
+        
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if subset:
+            rows = np.flatnonzero(~excluded)
+            scores = queries @ matrix[rows].T
+        else:
+            rows = None
+            scores = queries @ matrix.T
+            scores[:, excluded] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, best in zip(scores, top):
+            best = best[np.argsort(-query_scores[best])]
+            found = rows[best] if subset else best
+            results.append([
+                (ids[row], payloads[row], score, matrix[row] if with_vectors else None)
+                for row, score in zip(found.tolist(), query_scores[best].tolist())
+                if score >= score_threshold
+            ])
+        return results
+    
+    def persist(self):
+        """Flush vectors and write the ANN graph; the store stays open."""
+        with self._lock:
+            self._vectors.flush()
+            if self.index is not None and self._unsaved:
+                self._save_index()
+    
+    def close(self):
+        """Flush and close the store files."""
+        self.persist()
+        with self._lock:
+            self._log.close()
+    
+    def _load_index(self, hnsw_params: Dict[str, int]):
+        if os.path.exists(self._index_path):
+            self.index = HNSWIndex.load(self._index_path, ef_search=hnsw_params.get("ef_search"))
+        else:
+            self.index = HNSWIndex(**hnsw_params)
+        
+        missing = [row for row in range(len(self._ids)) if row not in self.index]
+        if missing:
+            self.index.add(missing, self._vectors)
+            self._unsaved += len(missing)
+            self._save_index()
+    
+    def _save_index(self):
+        self.index.save(self._index_path)
+        self._unsaved = 0
+    
+    def _check_meta(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dimension"] != self.dimension:
+                raise ValueError(
+                    f"Local store at {self.path} has dimension {meta['dimension']}, "
+                    f"expected {self.dimension}"
+                )
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.dimension}, f)
+    
+    def _replay_log(self, dead_rows: List[int]):
+        if not os.path.exists(self._log_path):
+            return
+        
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final write from a crash; everything before it is intact
+                    break
+                row = record["row"]
+                while len(self._ids) <= row:
+                    self._ids.append("")
+                    self._payloads.append({})
+                if record.get("deleted"):
+                    if self._rows.get(record["id"]) == row:
+                        del self._rows[record["id"]]
+                    self._ids[row] = ""
+                    self._payloads[row] = {}
+                    dead_rows.append(row)
+                    continue
+                self._ids[row] = record["id"]
+                self._payloads[row] = record["payload"]
+                self._rows[record["id"]] = row
+    
+    def _encode_existing(self):
+        """Quantize the stored vectors, a block at a time."""
+        count = len(self._ids)
+        for start in range(0, count, 65536):
+            end = min(start + 65536, count)
+            self.codes.set(slice(start, end), np.asarray(self._vectors[start:end]))
+    
+    def _grow(self, capacity: int):
+        """Extend the backing file and remap it with room for ``capacity`` rows."""
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dimension)
+        )
+        dead = np.zeros(capacity, dtype=bool)
+        if self._dead is not None:
+            dead[:len(self._dead)] = self._dead
+        self._dead = dead
+        if self.codes is not None:
+            self.codes.resize(capacity)
+        self._capacity = capacity
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the ``k`` highest scores, best first."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+_stores: Dict[str, LocalVectorStore] = {}
+_stores_lock = threading.Lock()
+
+def get_local_store(path: str, dimension: int) -> LocalVectorStore:
+    """One store instance per directory, shared by every caller in the process."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = LocalVectorStore(
+                path,
+                dimension,
+                index=os.getenv("LOCAL_INDEX", "exact"),
+                ann_min_points=int(os.getenv("LOCAL_ANN_MIN_POINTS", "10000")),
+                hnsw_params={
+                    "M": int(os.getenv("HNSW_M", "16")),
+                    "ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", "100")),
+                    "ef_search": int(os.getenv("HNSW_EF_SEARCH", "64"))
+                },
+                quantization=os.getenv("VECTOR_QUANTIZATION", "none"),
+                oversampling=float(os.getenv("QUANTIZATION_OVERSAMPLING", "4.0"))
+            )
+            _stores[path] = store
+        return store
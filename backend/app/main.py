@@ -1,23 +1,69 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import os
 import time
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 from app.models import (
-    UploadRequest, QueryRequest, AnswerResponse, RetrievedChunk, Citation
+    UploadRequest, BulkUploadRequest, DocumentUpdate, QueryRequest, AnswerResponse,
+    RetrievedChunk, Citation, BatchQueryRequest, BatchQueryResult, BatchQueryResponse
+)
+from app.services import ServiceContainer
+from app.embedding_cache import get_embedding_cache
+from app.ingestion import IngestDocument, IngestionPipeline, iter_text, iter_upload_text
+from app.jobs import JobQueueFull
+from app.answer_cache import get_answer_cache
+from app.reranker import get_rerank_cache
+from app.metrics import metrics, start_trace, current_trace
+from app.resilience import breaker_states
+from app.filters import SearchFilter, filter_key
+from app.adaptive import (
+    INSUFFICIENT_CONTEXT_ANSWER, is_adaptive, pool_margin, record_skip,
+    score_profile, skip_generation, skip_rerank
 )
-from app.chunking import TextChunker
-from app.embeddings import EmbeddingService
-from app.vector_db import VectorDB
-from app.retriever import Retriever
-from app.reranker import Reranker
-from app.llm import LLMService
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="RAG API", version="1.0.0")
+# Services are built and warmed once per worker in the lifespan handler
+services: Optional[ServiceContainer] = None
+startup_error: Optional[Exception] = None
+startup_time: Optional[float] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build and warm every service before the worker accepts traffic."""
+    global services, startup_error, startup_time
+    
+    start = time.perf_counter()
+    try:
+        container = ServiceContainer()
+        await container.warm_up()
+        services = container
+    except Exception as e:
+        # Keep serving so /api/ready and /api/health can report the problem
+        print(f"Service initialization failed: {e}")
+        startup_error = e
+    startup_time = time.perf_counter() - start
+    print(f"Startup completed in {startup_time:.3f}s")
+    
+    yield
+    
+    if services is not None:
+        await services.close()
+
+def get_services() -> ServiceContainer:
+    """Return the shared service container."""
+    if services is None:
+        raise RuntimeError(f"Services not initialized: {startup_error}")
+    return services
+
+app = FastAPI(title="RAG API", version="1.0.0", lifespan=lifespan)
 
 # CORS
 origins = os.getenv(
@@ -33,154 +79,688 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services (lazy loading to handle missing env vars gracefully)
-chunker = None
-embedding_service = None
-vector_db = None
-retriever = None
-reranker = None
-llm_service = None
-
-def get_services():
-    """Lazy initialization of services."""
-    global chunker, embedding_service, vector_db, retriever, reranker, llm_service
-    
-    if chunker is None:
-        chunker = TextChunker(chunk_size=1000, chunk_overlap=150)
-    if embedding_service is None:
-        embedding_service = EmbeddingService()
-    if vector_db is None:
-        vector_db = VectorDB()
-    if retriever is None:
-        retriever = Retriever()
-    if reranker is None:
-        reranker = Reranker()
-    if llm_service is None:
-        llm_service = LLMService()
-    
-    return chunker, embedding_service, vector_db, retriever, reranker, llm_service
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Start a trace per request and record per-endpoint latency and status."""
+    trace = start_trace(request.headers.get("x-trace-id", "")[:64] or None)
+    start = time.perf_counter()
+    response = await call_next(request)
+    
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.observe("rag_http_request_duration_seconds", time.perf_counter() - start, path=path)
+    metrics.inc("rag_http_requests_total", path=path, status=str(response.status_code))
+    response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
+def trace_fields() -> Dict[str, Any]:
+    """Trace id and spans recorded so far, for correlating a response with /metrics."""
+    trace = current_trace()
+    if trace is None:
+        return {"trace_id": None, "spans": []}
+    return {"trace_id": trace.trace_id, "spans": list(trace.spans)}
 
 @app.get("/")
 def root():
     return {"message": "RAG API is running"}
 
+# Shared source for pasted text; uploads to it add chunks instead of replacing
+DEFAULT_SOURCE = "user_input"
+
+def invalidate_answers(sources):
+    """Drop cached answers built from sources whose chunks are changing."""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate_sources(sources)
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    return get_services().ingestion_pipeline()
+
+def replaced_sources(sources) -> List[str]:
+    """Named sources are replaced on re-upload; the shared default source only grows."""
+    return [source for source in sources if source != DEFAULT_SOURCE]
+
+def upload_attributes(tenant: Optional[str], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-document ingest attributes, copied onto every chunk."""
+    return {"tenant": tenant, "metadata": metadata}
+
+def upload_counts(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "chunks_created": result["chunks_created"],
+        "chunks_embedded": result["chunks_embedded"],
+        "chunks_unchanged": result["chunks_unchanged"],
+        "chunks_deleted": result["chunks_deleted"],
+        "processing_time": result["processing_time"],
+        "stages": result["stages"]
+    }
+
+async def queue_job(documents: List[IngestDocument], replace_sources: List[str]) -> JSONResponse:
+    """Journal an upload for the background workers and answer 202 with its job id."""
+    job_id = await get_services().jobs.submit(documents, replace_sources)
+    return JSONResponse(status_code=202, content={
+        "message": "Upload accepted for processing",
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    })
+
+async def ingest_now(documents: List[IngestDocument], replace_sources: List[str]) -> Dict[str, Any]:
+    """Ingest inside the request (``?wait=true``)."""
+    sources = {document[1] for document in documents}
+    invalidate_answers(sources)
+    result = await get_ingestion_pipeline().run(documents, replace_sources=replace_sources)
+    invalidate_answers(sources)
+    return result
+
 @app.post("/api/upload")
-async def upload_document(request: UploadRequest):
-    """Upload and process a document."""
+async def upload_document(request: UploadRequest, wait: bool = False):
+    """Upload a document: queued as a background job, or ingested inline with ``wait``."""
     try:
-        chunker, embedding_service, vector_db, _, _, _ = get_services()
-        
-        start_time = time.time()
-        
-        # Chunk text
-        chunks = chunker.chunk_text(
-            text=request.text,
-            source=request.source or "user_input",
-            title=request.title or "Untitled Document"
-        )
-        
-        # Generate embeddings
-        texts = [chunk.text for chunk in chunks]
-        embeddings = embedding_service.embed_batch(texts)
-        
-        # Prepare chunks for vector DB
-        chunk_dicts = [chunk.dict() for chunk in chunks]
+        source = request.source or DEFAULT_SOURCE
+        documents = [(
+            iter_text(request.text),
+            source,
+            request.title or "Untitled Document",
+            upload_attributes(request.tenant, request.metadata)
+        )]
+        if not wait:
+            return await queue_job(documents, replaced_sources([source]))
+        result = await ingest_now(documents, replaced_sources([source]))
         
-        # Upsert to vector DB
-        vector_db.upsert_chunks(chunk_dicts, embeddings)
+        return {"message": "Document uploaded successfully", **upload_counts(result)}
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/upload/file")
+async def upload_file(
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    source: Optional[str] = Form(None),
+    tenant: Optional[str] = Form(None),
+    wait: bool = False
+):
+    """Upload a text file; it is streamed to the job spool (or through ingestion with ``wait``)."""
+    try:
+        source = source or file.filename or DEFAULT_SOURCE
+        documents = [(
+            iter_upload_text(file),
+            source,
+            title or file.filename or "Untitled Document",
+            upload_attributes(tenant, {})
+        )]
+        if not wait:
+            return await queue_job(documents, replaced_sources([source]))
+        result = await ingest_now(documents, replaced_sources([source]))
         
-        elapsed = time.time() - start_time
+        return {"message": "Document uploaded successfully", **upload_counts(result)}
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+@app.post("/api/upload/bulk")
+async def upload_bulk(request: BulkUploadRequest, wait: bool = False):
+    """Upload many documents as one job (or through one shared pipeline with ``wait``)."""
+    try:
+        sources = {document.source or DEFAULT_SOURCE for document in request.documents}
+        documents = [
+            (
+                document.text,
+                document.source or DEFAULT_SOURCE,
+                document.title or "Untitled Document",
+                upload_attributes(document.tenant, document.metadata)
+            )
+            for document in request.documents
+        ]
+        if not wait:
+            return await queue_job(documents, replaced_sources(sources))
+        result = await ingest_now(documents, replaced_sources(sources))
         
         return {
-            "message": "Document uploaded successfully",
-            "chunks_created": len(chunks),
-            "processing_time": elapsed
+            "message": f"{len(request.documents)} documents uploaded successfully",
+            **upload_counts(result),
+            "chunks_per_document": result["documents"]
         }
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/query", response_model=AnswerResponse)
-async def query(request: QueryRequest):
-    """Query the RAG system."""
+@app.get("/api/jobs/{job_id}")
+def job_status(job_id: str):
+    """Status and progress of a background upload job."""
     try:
-        _, _, _, retriever, reranker, llm_service = get_services()
-        
-        total_start = time.time()
+        status = get_services().jobs.status(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return status
+
+@app.get("/api/documents")
+def list_documents():
+    """Sources in the manifest with their chunk counts."""
+    try:
+        return {"documents": get_services().manifest.sources()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/documents/{source:path}")
+async def replace_document(source: str, request: DocumentUpdate, wait: bool = False):
+    """Replace a document: embed new chunks, keep unchanged ones, delete removed ones."""
+    try:
+        documents = [(
+            iter_text(request.text),
+            source,
+            request.title or "Untitled Document",
+            upload_attributes(request.tenant, request.metadata)
+        )]
+        if not wait:
+            return await queue_job(documents, [source])
+        result = await ingest_now(documents, [source])
         
-        # Retrieve chunks
-        retrieved_chunks, retrieval_timing = retriever.retrieve(
-            query=request.query,
-            top_k=request.top_k
+        return {"message": "Document replaced successfully", **upload_counts(result)}
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/documents/{source:path}")
+async def delete_document(source: str):
+    """Delete every chunk of a document in one bulk request."""
+    try:
+        deleted = await get_ingestion_pipeline().delete_source(source)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Unknown source: {source}")
+    invalidate_answers([source])
+    return {"message": "Document deleted successfully", "chunks_deleted": deleted}
+
+def format_chunks(chunks) -> List[RetrievedChunk]:
+    """Format reranked chunks for the response."""
+    return [
+        RetrievedChunk(
+            text=chunk["text"],
+            source=chunk["source"],
+            title=chunk.get("title"),
+            section=chunk.get("section"),
+            position=chunk.get("position", 0),
+            score=chunk.get("rerank_score", chunk.get("score", 0.0)),
+            metadata=chunk.get("metadata", {})
         )
-        
-        if not retrieved_chunks:
-            return AnswerResponse(
-                answer="No relevant documents found in the knowledge base.",
-                citations=[],
-                retrieved_chunks=[],
-                timing={"total": time.time() - total_start},
-                token_estimate={"input": 0, "output": 0, "total": 0}
-            )
-        
-        # Rerank
-        rerank_start = time.time()
-        reranked_chunks = reranker.rerank(
+        for chunk in chunks
+    ]
+
+def cache_params(request: QueryRequest) -> tuple:
+    """Request parameters an answer cache entry must match."""
+    return (
+        request.top_k,
+        request.rerank_top_k,
+        request.mmr_lambda,
+        request.candidate_pool,
+        filter_key(SearchFilter.from_request(request.filter)),
+        is_adaptive(request.adaptive),
+        request.ef_search
+    )
+
+def cached_answer(
+    request: QueryRequest,
+    query_embedding: List[float],
+    embedding_time: float,
+    start: float
+) -> Optional[AnswerResponse]:
+    """Serve repeated and near-duplicate questions from the answer cache."""
+    cached = get_answer_cache().lookup(query_embedding, cache_params(request))
+    if cached is None:
+        return None
+    response, _ = cached
+    return AnswerResponse(**{
+        **response,
+        "timing": {
+            "embedding": embedding_time,
+            "answer_cache": time.perf_counter() - start - embedding_time,
+            "total": time.perf_counter() - start
+        },
+        "cached": True,
+        **trace_fields()
+    })
+
+async def rerank_context(
+    request: QueryRequest,
+    context: Dict[str, Any],
+    retrieved_chunks: List[Dict[str, Any]],
+    timing: Dict[str, float]
+) -> Dict[str, Any]:
+    """Rerank retrieved chunks and record them in ``context``.
+    
+    In adaptive mode, the dense score profile decides the later stages:
+    reranking is skipped when the ranking is already decisive, and when
+    no chunk clears the relevance threshold ``context["insufficient"]``
+    is set so generation is skipped too. The profile and both decisions
+    are added to ``timing``.
+    """
+    timing = dict(timing)
+    insufficient = skip = False
+    if is_adaptive(request.adaptive) and retrieved_chunks:
+        profile = score_profile(retrieved_chunks)
+        insufficient = skip_generation(profile)
+        skip = insufficient or skip_rerank(profile, len(retrieved_chunks), request.rerank_top_k)
+        timing.update(profile, reranking_skipped=float(skip), generation_skipped=float(insufficient))
+    
+    rerank_start = time.perf_counter()
+    if skip:
+        record_skip("rerank")
+        reranked_chunks = retrieved_chunks[:request.rerank_top_k]
+    else:
+        reranked_chunks = await get_services().reranker.rerank(
             query=request.query,
             documents=retrieved_chunks,
             top_n=request.rerank_top_k
+        ) if retrieved_chunks else []
+    rerank_time = time.perf_counter() - rerank_start
+    
+    context.update(
+        retrieved=retrieved_chunks,
+        reranked=reranked_chunks,
+        insufficient=insufficient,
+        timing={**timing, "reranking": rerank_time}
+    )
+    return context
+
+async def prepare_context(request: QueryRequest) -> Dict[str, Any]:
+    """Run the stages before generation: answer cache lookup, retrieval, rerank.
+    
+    Returns a dict with ``cached`` (an AnswerResponse on a cache hit) or
+    ``retrieved``/``reranked`` chunks, plus ``timing`` so far and the
+    ``query_embedding``/``cache_params`` needed to store the answer.
+    """
+    services = get_services()
+    retriever = services.retriever
+    answer_cache = services.answer_cache
+    
+    total_start = time.perf_counter()
+    context = {"query_embedding": None, "cache_params": None, "cached": None, "start": total_start}
+    
+    # Serve repeated and near-duplicate questions from the answer cache
+    if answer_cache is not None:
+        context["query_embedding"] = await services.embedding_service.embed_text(request.query)
+        embedding_time = time.perf_counter() - total_start
+        context["cache_params"] = cache_params(request)
+        context["cached"] = cached_answer(request, context["query_embedding"], embedding_time, total_start)
+        if context["cached"] is not None:
+            return context
+    
+    # Retrieve chunks
+    retrieved_chunks, retrieval_timing = await retriever.retrieve(
+        query=request.query,
+        top_k=request.top_k,
+        mmr_lambda=request.mmr_lambda,
+        candidate_pool=request.candidate_pool,
+        query_embedding=context["query_embedding"],
+        search_filter=SearchFilter.from_request(request.filter),
+        pool_margin=pool_margin(is_adaptive(request.adaptive)),
+        ef_search=request.ef_search
+    )
+    if context["query_embedding"] is not None:
+        retrieval_timing["embedding"] = embedding_time
+    
+    return await rerank_context(request, context, retrieved_chunks, retrieval_timing)
+
+def cache_answer(context: Dict[str, Any], response: AnswerResponse, llm_result: Dict[str, Any]):
+    """Store a generated answer unless caching is off or generation failed."""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None and "error" not in llm_result:
+        answer_cache.store(
+            context["query_embedding"],
+            context["cache_params"],
+            response.dict(),
+            sources={chunk["source"] for chunk in context["retrieved"]}
         )
-        rerank_time = time.time() - rerank_start
-        
-        # Generate answer
-        llm_result = llm_service.generate_answer(
-            query=request.query,
-            context_chunks=reranked_chunks
+
+NO_DOCUMENTS_ANSWER = "No relevant documents found in the knowledge base."
+
+def insufficient_response(context: Dict[str, Any]) -> AnswerResponse:
+    """Refuse without calling the LLM: no retrieved chunk is relevant enough.
+    
+    Not cached, since a later upload of a new source would not invalidate it.
+    """
+    record_skip("generation")
+    return AnswerResponse(
+        answer=INSUFFICIENT_CONTEXT_ANSWER,
+        citations=[],
+        retrieved_chunks=format_chunks(context["reranked"]),
+        timing={**context["timing"], "total": time.perf_counter() - context["start"]},
+        token_estimate={"input": 0, "output": 0, "total": 0},
+        cost_estimate=0.0,
+        **trace_fields()
+    )
+
+async def generate_response(request: QueryRequest, context: Dict[str, Any]) -> AnswerResponse:
+    """Generate the answer for a prepared (uncached) context and cache it."""
+    total_start = context["start"]
+    
+    if not context["retrieved"]:
+        return AnswerResponse(
+            answer=NO_DOCUMENTS_ANSWER,
+            citations=[],
+            retrieved_chunks=[],
+            timing={"total": time.perf_counter() - total_start},
+            token_estimate={"input": 0, "output": 0, "total": 0},
+            **trace_fields()
         )
+    if context["insufficient"]:
+        return insufficient_response(context)
+    
+    reranked_chunks = context["reranked"]
+    
+    # Generate answer
+    llm_result = await get_services().llm_service.generate_answer(
+        query=request.query,
+        context_chunks=reranked_chunks
+    )
+    
+    # Format citations
+    citations = [
+        Citation(**citation)
+        for citation in llm_result["citations"]
+    ]
+    
+    total_time = time.perf_counter() - total_start
+    
+    timing = {
+        **context["timing"],
+        **llm_result["timing"],
+        "total": total_time
+    }
+    
+    response = AnswerResponse(
+        answer=llm_result["answer"],
+        citations=citations,
+        retrieved_chunks=format_chunks(reranked_chunks),
+        timing=timing,
+        token_estimate=llm_result["token_estimate"],
+        cost_estimate=llm_result.get("cost_estimate"),
+        **trace_fields()
+    )
+    cache_answer(context, response, llm_result)
+    
+    return response
+
+@app.post("/api/query", response_model=AnswerResponse)
+async def query(request: QueryRequest):
+    """Query the RAG system."""
+    try:
+        context = await prepare_context(request)
+        if context["cached"] is not None:
+            return context["cached"]
         
-        # Format retrieved chunks for response
-        formatted_chunks = [
-            RetrievedChunk(
-                text=chunk["text"],
-                source=chunk["source"],
-                title=chunk.get("title"),
-                section=chunk.get("section"),
-                position=chunk.get("position", 0),
-                score=chunk.get("rerank_score", chunk.get("score", 0.0)),
-                metadata=chunk.get("metadata", {})
-            )
-            for chunk in reranked_chunks
-        ]
-        
-        # Format citations
-        citations = [
-            Citation(**citation)
-            for citation in llm_result["citations"]
-        ]
+        return await generate_response(request, context)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Largest batch accepted, and how many queries rerank and generate at once
+BATCH_QUERY_MAX_SIZE = int(os.getenv("BATCH_QUERY_MAX_SIZE", "64"))
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+
+def batch_result(query: str, response: AnswerResponse) -> BatchQueryResult:
+    # The batch response carries the trace once, not per query
+    return BatchQueryResult(query=query, **response.dict(exclude={"trace_id", "spans"}))
+
+@app.post("/api/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest):
+    """Answer many queries with one embedding call and one vector search.
+    
+    Reranking and generation run concurrently, at most
+    BATCH_QUERY_CONCURRENCY at a time. Results keep the input order; a
+    query that fails carries ``error`` without failing the others. With
+    ``generate`` off, only retrieval and reranking run.
+    """
+    if len(request.queries) > BATCH_QUERY_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_QUERY_MAX_SIZE} queries per batch"
+        )
+    
+    batch_start = time.perf_counter()
+    requests = [
+        QueryRequest(
+            query=query,
+            top_k=request.top_k,
+            rerank_top_k=request.rerank_top_k,
+            mmr_lambda=request.mmr_lambda,
+            candidate_pool=request.candidate_pool,
+            filter=request.filter,
+            adaptive=request.adaptive,
+            ef_search=request.ef_search
+        )
+        for query in request.queries
+    ]
+    results: List[Optional[BatchQueryResult]] = [None] * len(requests)
+    contexts: Dict[int, Dict[str, Any]] = {}
+    
+    try:
+        services = get_services()
+        answer_cache = services.answer_cache if request.generate else None
         
-        total_time = time.time() - total_start
+        # One embedding call for the whole batch
+        embeddings = await services.embedding_service.embed_batch(request.queries)
+        embedding_time = time.perf_counter() - batch_start
         
-        timing = {
-            **retrieval_timing,
-            "reranking": rerank_time,
-            **llm_result["timing"],
-            "total": total_time
-        }
+        for i, (query_request, embedding) in enumerate(zip(requests, embeddings)):
+            context = {
+                "query_embedding": embedding,
+                "cache_params": cache_params(query_request),
+                "cached": None,
+                "start": batch_start
+            }
+            if answer_cache is not None:
+                context["cached"] = cached_answer(query_request, embedding, embedding_time, batch_start)
+                if context["cached"] is not None:
+                    results[i] = batch_result(query_request.query, context["cached"])
+                    continue
+            contexts[i] = context
         
-        return AnswerResponse(
-            answer=llm_result["answer"],
-            citations=citations,
-            retrieved_chunks=formatted_chunks,
-            timing=timing,
-            token_estimate=llm_result["token_estimate"],
-            cost_estimate=llm_result.get("cost_estimate")
-        )
+        # One batch search for every query the answer cache could not serve
+        pending = sorted(contexts)
+        retrieved, retrieval_timing = await services.retriever.retrieve_batch(
+            [request.queries[i] for i in pending],
+            top_k=request.top_k,
+            mmr_lambda=request.mmr_lambda,
+            candidate_pool=request.candidate_pool,
+            query_embeddings=[embeddings[i] for i in pending],
+            search_filter=SearchFilter.from_request(request.filter),
+            pool_margin=pool_margin(is_adaptive(request.adaptive)),
+            ef_search=request.ef_search
+        ) if pending else ([], {})
+        retrieval_timing["embedding"] = embedding_time
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    semaphore = asyncio.Semaphore(BATCH_QUERY_CONCURRENCY)
+    
+    async def finish(i: int, retrieved_chunks: List[Dict[str, Any]]):
+        query_request = requests[i]
+        async with semaphore:
+            try:
+                context = await rerank_context(query_request, contexts[i], retrieved_chunks, {})
+                if request.generate:
+                    response = await generate_response(query_request, context)
+                    results[i] = batch_result(query_request.query, response)
+                else:
+                    results[i] = BatchQueryResult(
+                        query=query_request.query,
+                        retrieved_chunks=format_chunks(context["reranked"]),
+                        timing={**context["timing"], "total": time.perf_counter() - batch_start}
+                    )
+            except Exception as e:
+                print(f"Batch query error: {e}")
+                results[i] = BatchQueryResult(query=query_request.query, error=str(e))
+    
+    await asyncio.gather(*(
+        finish(i, retrieved_chunks)
+        for i, retrieved_chunks in zip(pending, retrieved)
+    ))
+    
+    return BatchQueryResponse(
+        results=results,
+        timing={**retrieval_timing, "total": time.perf_counter() - batch_start},
+        **trace_fields()
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/query/stream")
+async def query_stream(request: QueryRequest):
+    """Query the RAG system, streaming the answer as Server-Sent Events.
+    
+    Events: ``chunks`` (reranked context), ``delta`` (answer text),
+    ``citation`` (as soon as a new [n] appears), then ``done`` with
+    citations, timing and token estimates. Failures end with ``error``.
+    """
+    try:
+        llm_service = get_services().llm_service
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        try:
+            context = await prepare_context(request)
+            
+            cached = context["cached"]
+            if cached is not None:
+                yield sse_event("chunks", [chunk.dict() for chunk in cached.retrieved_chunks])
+                yield sse_event("delta", {"text": cached.answer})
+                for citation in cached.citations:
+                    yield sse_event("citation", citation.dict())
+                yield sse_event("done", {
+                    "citations": [citation.dict() for citation in cached.citations],
+                    "timing": cached.timing,
+                    "token_estimate": cached.token_estimate,
+                    "cost_estimate": cached.cost_estimate,
+                    "cached": True,
+                    **trace_fields()
+                })
+                return
+            
+            reranked_chunks = context["reranked"]
+            formatted_chunks = format_chunks(reranked_chunks)
+            yield sse_event("chunks", [chunk.dict() for chunk in formatted_chunks])
+            
+            if not context["retrieved"]:
+                yield sse_event("delta", {"text": NO_DOCUMENTS_ANSWER})
+                yield sse_event("done", {
+                    "citations": [],
+                    "timing": {"total": time.perf_counter() - context["start"]},
+                    "token_estimate": {"input": 0, "output": 0, "total": 0},
+                    "cost_estimate": None,
+                    "cached": False,
+                    **trace_fields()
+                })
+                return
+            
+            if context["insufficient"]:
+                response = insufficient_response(context)
+                yield sse_event("delta", {"text": response.answer})
+                yield sse_event("done", {
+                    "citations": [],
+                    "timing": response.timing,
+                    "token_estimate": response.token_estimate,
+                    "cost_estimate": response.cost_estimate,
+                    "cached": False,
+                    **trace_fields()
+                })
+                return
+            
+            async for event in llm_service.stream_answer(request.query, reranked_chunks):
+                if event["type"] == "delta":
+                    yield sse_event("delta", {"text": event["text"]})
+                elif event["type"] == "citation":
+                    yield sse_event("citation", event["citation"])
+                else:
+                    timing = {
+                        **context["timing"],
+                        **event["timing"],
+                        "total": time.perf_counter() - context["start"]
+                    }
+                    response = AnswerResponse(
+                        answer=event["answer"],
+                        citations=[Citation(**citation) for citation in event["citations"]],
+                        retrieved_chunks=formatted_chunks,
+                        timing=timing,
+                        token_estimate=event["token_estimate"],
+                        cost_estimate=event.get("cost_estimate")
+                    )
+                    cache_answer(context, response, event)
+                    yield sse_event("done", {
+                        "citations": event["citations"],
+                        "timing": timing,
+                        "token_estimate": event["token_estimate"],
+                        "cost_estimate": event.get("cost_estimate"),
+                        "cached": False,
+                        **trace_fields(),
+                        **({"error": event["error"]} if "error" in event else {})
+                    })
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Embedding, answer and rerank score cache hit/miss counters."""
+    stats = {}
+    caches = (
+        ("embedding", get_embedding_cache()),
+        ("answer", get_answer_cache()),
+        ("rerank", get_rerank_cache())
+    )
+    for name, cache in caches:
+        stats[name] = {"enabled": True, **cache.stats()} if cache is not None else {"enabled": False}
+    return stats
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latency histograms and cache/error/fallback counters in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/metrics")
+def metrics_summary():
+    """Approximate p50/p95/p99 per stage, read from the same histograms."""
+    return metrics.summary()
 
 @app.get("/api/health")
 def health():
     return {"status": "healthy"}
 
+@app.get("/api/ready")
+def ready():
+    """Readiness probe: 200 once services are built and warmed, 503 otherwise."""
+    if services is None:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "not_ready",
+                "detail": str(startup_error) if startup_error else "starting"
+            }
+        )
+    return {
+        "status": "ready",
+        "startup_time": startup_time,
+        "warmup": services.warmup_timing,
+        "circuit_breakers": breaker_states()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
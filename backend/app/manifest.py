@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, Optional, Set
+import os
+import sqlite3
+import threading
+
+class SourceManifest:
+    """Point ids currently stored for each document source, in SQLite.
+    
+    Point ids are deterministic (see ``make_point_id``), so the manifest
+    is all re-ingestion needs to tell unchanged chunks from new ones and
+    to find the chunks an edit removed.
+    """
+    
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "source TEXT NOT NULL, point_id TEXT NOT NULL, "
+            "PRIMARY KEY (source, point_id)) WITHOUT ROWID"
+        )
+        self._db.commit()
+    
+    def get(self, source: str) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT point_id FROM chunks WHERE source = ?", (source,))
+            return {point_id for (point_id,) in rows}
+    
+    def add(self, source: str, ids: Iterable[str]):
+        """Record new points for a source, keeping the existing ones."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO chunks (source, point_id) VALUES (?, ?)",
+                [(source, point_id) for point_id in ids]
+            )
+            self._db.commit()
+    
+    def replace(self, source: str, ids: Iterable[str]):
+        """Make ``ids`` the complete set of points for a source."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO chunks (source, point_id) VALUES (?, ?)",
+                [(source, point_id) for point_id in ids]
+            )
+            self._db.commit()
+    
+    def remove(self, source: str) -> Set[str]:
+        """Forget a source; returns the point ids it had."""
+        with self._lock:
+            rows = self._db.execute("SELECT point_id FROM chunks WHERE source = ?", (source,))
+            ids = {point_id for (point_id,) in rows}
+            self._db.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._db.commit()
+            return ids
+    
+    def sources(self) -> Dict[str, int]:
+        """Chunk count per source."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT source, COUNT(*) FROM chunks GROUP BY source ORDER BY source"
+            )
+            return dict(rows.fetchall())
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_manifest: Optional[SourceManifest] = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> SourceManifest:
+    """Process-wide source manifest (MANIFEST_PATH)."""
+    global _manifest
+    
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = SourceManifest(os.getenv("MANIFEST_PATH", ".cache/manifest.sqlite3"))
+        return _manifest
+
+def close_manifest():
+    global _manifest
+    
+    with _manifest_lock:
+        if _manifest is not None:
+            _manifest.close()
+            _manifest = None
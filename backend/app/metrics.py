@@ -0,0 +1,259 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import inspect
+import os
+import secrets
+import threading
+import time
+
+# Latency buckets in seconds, from cache-hit lookups up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Spans kept per trace; long ingestions stop recording detail past this
+MAX_TRACE_SPANS = int(os.getenv("MAX_TRACE_SPANS", "256"))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and two adds."""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in Prometheus text format."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+    
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+    
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+    
+    def set(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+    
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+    
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Count, mean and approximate p50/p95/p99 per histogram series."""
+        result = {}
+        with self._lock:
+            for name, series in self._histograms.items():
+                for labels, histogram in series.items():
+                    result.setdefault(name, {})[_format_labels(labels) or "{}"] = {
+                        "count": histogram.count,
+                        "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                        "p99": histogram.quantile(0.99)
+                    }
+        return result
+    
+    def render(self) -> str:
+        """Prometheus text exposition (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            
+            for name, series in sorted(self._gauges.items()):
+                self._header(lines, name, "gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}"
+                        )
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+    
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(pairs) + "}"
+
+metrics = MetricsRegistry()
+metrics.describe("rag_stage_duration_seconds", "Latency of traced pipeline stages")
+metrics.describe("rag_stage_errors_total", "Exceptions raised out of traced stages")
+metrics.describe("rag_http_request_duration_seconds", "Time to response headers per endpoint")
+metrics.describe("rag_http_requests_total", "HTTP requests by endpoint and status")
+metrics.describe("rag_cache_lookups_total", "Cache lookups by cache and result")
+metrics.describe("rag_fallbacks_total", "Degraded responses served after a stage failed")
+metrics.describe("rag_retries_total", "Provider calls retried after rate limiting")
+metrics.describe("rag_circuit_state", "Provider circuit breaker state: 0 closed, 1 half-open, 2 open")
+metrics.describe("rag_circuit_opened_total", "Times a provider circuit breaker opened")
+metrics.describe("rag_hedged_requests_total", "Hedged requests sent after the first one passed its p95")
+metrics.describe("rag_failovers_total", "Calls that moved on to the next provider after a failure")
+metrics.describe("rag_ingest_jobs_pending", "Background ingestion jobs queued or running")
+metrics.describe("rag_ingest_jobs_total", "Background ingestion jobs finished, by status")
+metrics.describe("rag_shard_duration_seconds", "Latency of vector store shard searches")
+metrics.describe("rag_shard_requests_total", "Shard searches by shard and result (ok, error, timeout)")
+metrics.describe("rag_shard_partial_searches_total", "Searches answered without every shard")
+metrics.describe("rag_adaptive_skips_total", "Query stages skipped by the adaptive pipeline")
+
+class Trace:
+    """Spans recorded while serving one request."""
+    
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+    
+    def record(self, span: Dict[str, Any]):
+        if len(self.spans) < MAX_TRACE_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+# Called as listener(name, duration) for every finished span
+_span_listeners: List[Callable[[str, float], None]] = []
+
+def add_span_listener(listener: Callable[[str, float], None]):
+    """Receive every span duration, e.g. to keep exact samples in a benchmark."""
+    _span_listeners.append(listener)
+
+def remove_span_listener(listener: Callable[[str, float], None]):
+    _span_listeners.remove(listener)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("rag_span", default=None)
+
+def start_trace(trace_id: Optional[str] = None) -> Trace:
+    """Begin a trace for the current request context."""
+    trace = Trace(trace_id)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def _finish(name: str, span_id: str, parent_id: Optional[str], start: float, error: bool):
+    duration = time.perf_counter() - start
+    metrics.observe("rag_stage_duration_seconds", duration, stage=name)
+    if error:
+        metrics.inc("rag_stage_errors_total", stage=name)
+    for listener in _span_listeners:
+        listener(name, duration)
+    
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record({
+            "name": name,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "duration": duration,
+            **({"error": True} if error else {})
+        })
+
+@contextmanager
+def span(name: str) -> Iterator[str]:
+    """Time a block with perf_counter; yields the span id."""
+    span_id = secrets.token_hex(8)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield span_id
+    except Exception:
+        error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(name, span_id, parent_id, start, error)
+
+def traced(name: str):
+    """Decorator recording a span around a sync, async or async-generator function."""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                # Generators resume in their consumer's context, so this span
+                # is not made current for nested calls
+                span_id = secrets.token_hex(8)
+                parent_id = _current_span.get()
+                start = time.perf_counter()
+                error = False
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    _finish(name, span_id, parent_id, start, error)
+            return gen_wrapper
+        
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,50 @@
+from typing import List, Optional
+
+import numpy as np
+
+def mmr_select(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """Maximal Marginal Relevance over candidate vectors.
+    
+    Greedily picks the candidate maximizing
+    ``lambda * sim(query, c) - (1 - lambda) * max sim(c, selected)``.
+    ``lambda_mult=1`` is plain relevance order, lower values favour
+    novelty. Returns candidate indices in selection order.
+    """
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    
+    candidates = _normalize(np.asarray(candidates, dtype=np.float32))
+    if relevance is None:
+        relevance = candidates @ _normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+    relevance = np.asarray(relevance, dtype=np.float32)
+    
+    pairwise = candidates @ candidates.T
+    first = int(np.argmax(relevance))
+    selected = [first]
+    chosen = np.zeros(n, dtype=bool)
+    chosen[first] = True
+    # Similarity of each candidate to its closest selected candidate
+    redundancy = pairwise[first].copy()
+    
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    
+    return selected
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Union
 
 class DocumentChunk(BaseModel):
     text: str
@@ -7,17 +7,77 @@ class DocumentChunk(BaseModel):
     title: Optional[str] = None
     section: Optional[str] = None
     position: int
+    # Tenant the chunk belongs to, for tenant-scoped queries
+    tenant: Optional[str] = None
     metadata: Dict[str, Any] = {}
+    # Token ids from the chunker, reused by the lexical index; never serialized
+    tokens: Optional[List[int]] = Field(None, exclude=True)
+    # Deterministic point id, assigned during ingestion; never serialized
+    point_id: Optional[str] = Field(None, exclude=True)
 
 class UploadRequest(BaseModel):
     text: str
     title: Optional[str] = "Untitled Document"
     source: Optional[str] = "user_input"
+    tenant: Optional[str] = None
+    # Filterable attributes copied onto every chunk, e.g. {"customer": "acme"}
+    metadata: Dict[str, Any] = {}
+
+class DocumentUpdate(BaseModel):
+    text: str
+    title: Optional[str] = "Untitled Document"
+    tenant: Optional[str] = None
+    metadata: Dict[str, Any] = {}
+
+class BulkUploadRequest(BaseModel):
+    documents: List[UploadRequest]
+
+class RangeCondition(BaseModel):
+    gt: Optional[float] = None
+    gte: Optional[float] = None
+    lt: Optional[float] = None
+    lte: Optional[float] = None
+
+class QueryFilter(BaseModel):
+    """Restricts retrieval to chunks matching every condition set.
+    
+    A list matches any of its values. ``metadata`` keys match upload
+    metadata exactly; ``ranges`` bound numeric metadata (use epoch
+    seconds for dates).
+    """
+    source: Optional[Union[str, List[str]]] = None
+    title: Optional[Union[str, List[str]]] = None
+    section: Optional[Union[str, List[str]]] = None
+    tenant: Optional[Union[str, List[str]]] = None
+    metadata: Dict[str, Any] = {}
+    ranges: Dict[str, RangeCondition] = {}
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
     rerank_top_k: int = 3
+    # MMR trade-off: 1.0 = pure relevance, lower = more diverse (default: MMR_LAMBDA)
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    # Candidates fetched before MMR selection (default: 4 * top_k)
+    candidate_pool: Optional[int] = Field(None, ge=1)
+    filter: Optional[QueryFilter] = None
+    # Skip reranking/generation when retrieval scores make them unnecessary (default: ADAPTIVE_PIPELINE)
+    adaptive: Optional[bool] = None
+    # HNSW search beam: higher trades latency for recall (default: HNSW_EF_SEARCH, or Qdrant's)
+    ef_search: Optional[int] = Field(None, ge=1)
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    top_k: int = 5
+    rerank_top_k: int = 3
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    candidate_pool: Optional[int] = Field(None, ge=1)
+    # Applied to every query in the batch
+    filter: Optional[QueryFilter] = None
+    # False returns reranked chunks only, for fast retrieval evals
+    generate: bool = True
+    adaptive: Optional[bool] = None
+    ef_search: Optional[int] = Field(None, ge=1)
 
 class RetrievedChunk(BaseModel):
     text: str
@@ -42,4 +102,25 @@ class AnswerResponse(BaseModel):
     timing: Dict[str, float]
     token_estimate: Dict[str, int]
     cost_estimate: Optional[float] = None
+    cached: bool = False
+    trace_id: Optional[str] = None
+    spans: List[Dict[str, Any]] = []
 
+class BatchQueryResult(BaseModel):
+    query: str
+    # None when generation was skipped or the query failed
+    answer: Optional[str] = None
+    citations: List[Citation] = []
+    retrieved_chunks: List[RetrievedChunk] = []
+    timing: Dict[str, float] = {}
+    token_estimate: Dict[str, int] = {}
+    cost_estimate: Optional[float] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    # Shared stages (embedding, retrieval) run once for the whole batch
+    timing: Dict[str, float]
+    trace_id: Optional[str] = None
+    spans: List[Dict[str, Any]] = []
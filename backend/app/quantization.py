@@ -0,0 +1,121 @@
+from typing import Optional, Tuple
+import math
+
+import numpy as np
+
+# Rows scored per block, bounding the float32 temporaries of a full scan
+SCAN_BLOCK_ROWS = 4096
+
+# Set bits in every byte value, for Hamming distance over packed codes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+class Int8Codes:
+    """Scalar-quantized copy of unit vectors: one int8 per dimension.
+    
+    Each row keeps its own scale (max |component| / 127), so a vector
+    costs ``dimension + 4`` bytes instead of ``4 * dimension``.
+    """
+    
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.codes = np.zeros((0, dimension), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+    
+    def resize(self, capacity: int):
+        codes = np.zeros((capacity, self.dimension), dtype=np.int8)
+        scales = np.zeros(capacity, dtype=np.float32)
+        keep = min(capacity, len(self.scales))
+        codes[:keep] = self.codes[:keep]
+        scales[:keep] = self.scales[:keep]
+        self.codes, self.scales = codes, scales
+    
+    def set(self, rows, vectors: np.ndarray):
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self.codes[rows] = np.rint(vectors / scales[:, None]).astype(np.int8)
+        self.scales[rows] = scales
+    
+    def scores(self, query: np.ndarray, count: int) -> np.ndarray:
+        """Approximate dot products with the first ``count`` rows."""
+        codes, scales = self.codes, self.scales
+        out = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, count)
+            out[start:end] = codes[start:end].astype(np.float32) @ query
+        return out * scales[:count]
+
+class BinaryCodes:
+    """1-bit sign codes, packed 8 dimensions per byte, compared by Hamming distance."""
+    
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.codes = np.zeros((0, math.ceil(dimension / 8)), dtype=np.uint8)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+    
+    def resize(self, capacity: int):
+        codes = np.zeros((capacity, self.codes.shape[1]), dtype=np.uint8)
+        keep = min(capacity, len(self.codes))
+        codes[:keep] = self.codes[:keep]
+        self.codes = codes
+    
+    def set(self, rows, vectors: np.ndarray):
+        self.codes[rows] = np.packbits(vectors > 0, axis=1)
+    
+    def scores(self, query: np.ndarray, count: int) -> np.ndarray:
+        """Negated Hamming distances to the first ``count`` rows (higher is closer)."""
+        codes = self.codes
+        packed = np.packbits(query > 0)
+        out = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, count)
+            out[start:end] = _POPCOUNT[codes[start:end] ^ packed].sum(axis=1, dtype=np.uint16)
+        return -out
+
+def make_codes(quantization: str, dimension: int):
+    """Quantized code store for ``quantization`` ("none", "int8" or "binary")."""
+    if quantization == "none":
+        return None
+    if quantization == "int8":
+        return Int8Codes(dimension)
+    if quantization == "binary":
+        return BinaryCodes(dimension)
+    raise ValueError(f"Unknown vector quantization: {quantization}")
+
+def rescored_top_k(
+    codes,
+    query: np.ndarray,
+    matrix: np.ndarray,
+    limit: int,
+    oversampling: float,
+    dead: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Shortlist ``limit * oversampling`` rows by code score, rescore them in float32.
+    
+    Only the shortlisted rows of ``matrix`` (the full-precision memory
+    map) are read, so the scan itself touches just the compact codes.
+    """
+    count = len(matrix)
+    approx = codes.scores(query, count)
+    live = count
+    if dead is not None and dead.any():
+        approx[dead] = -np.inf
+        live -= int(dead.sum())
+    
+    shortlist = min(live, max(limit, math.ceil(limit * oversampling)))
+    if shortlist <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    candidates = np.argpartition(-approx, shortlist - 1)[:shortlist]
+    candidates.sort()  # sequential reads from the memory map
+    exact = matrix[candidates] @ query
+    
+    k = min(limit, shortlist)
+    best = np.argpartition(-exact, k - 1)[:k]
+    best = best[np.argsort(-exact[best])]
+    return candidates[best], exact[best]
@@ -1,14 +1,235 @@
 import cohere
+import hashlib
 import os
-from typing import List, Dict, Any
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
 
-class Reranker:
-    def __init__(self):
+import numpy as np
+
+from app.metrics import metrics, span, traced
+from app.resilience import ProviderPool, Upstream
+
+RERANK_MODEL = "rerank-english-v3.0"
+# Deadline for the remote reranker before the local one answers instead
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT_MS", "1500")) / 1000.0
+
+WORD = re.compile(r"\w+")
+
+def _rank(
+    documents: List[Dict[str, Any]],
+    scores: List[float],
+    top_n: int
+) -> List[Dict[str, Any]]:
+    """Attach relevance scores to the original documents, best first."""
+    order = sorted(range(len(documents)), key=lambda i: -scores[i])[:top_n]
+    return [
+        {
+            **documents[i],
+            "rerank_score": float(scores[i]),
+            "original_score": documents[i].get("score", 0.0)
+        }
+        for i in order
+    ]
+
+def _chunk_key(document: Dict[str, Any]) -> str:
+    # Point ids are derived from chunk content, so they key scores safely
+    return document.get("id") or hashlib.sha256(document["text"].encode("utf-8")).hexdigest()
+
+class RerankScoreCache:
+    """LRU cache of (model, query hash, chunk id) -> remote relevance score.
+    
+    The remote reranker is asked for every candidate's score, so a chunk
+    that comes back for the same question is never sent again.
+    """
+    
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _keys(self, model: str, query: str, documents: List[Dict[str, Any]]) -> List[bytes]:
+        prefix = hashlib.blake2b(f"{model}\x00{query}".encode("utf-8"), digest_size=16).digest()
+        return [prefix + _chunk_key(document).encode("utf-8") for document in documents]
+    
+    def get_many(self, model: str, query: str, documents: List[Dict[str, Any]]) -> List[Optional[float]]:
+        scores = []
+        with self._lock:
+            for key in self._keys(model, query, documents):
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                scores.append(score)
+            missed = scores.count(None)
+            self.hits += len(scores) - missed
+            self.misses += missed
+        metrics.inc("rag_cache_lookups_total", len(scores) - missed, cache="rerank", result="hit")
+        metrics.inc("rag_cache_lookups_total", missed, cache="rerank", result="miss")
+        return scores
+    
+    def put_many(self, model: str, query: str, documents: List[Dict[str, Any]], scores: List[float]):
+        with self._lock:
+            for key, score in zip(self._keys(model, query, documents), scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._scores)
+            }
+
+_cache = None
+
+def get_rerank_cache() -> Optional[RerankScoreCache]:
+    """Process-wide rerank score cache, or None when RERANK_CACHE_ENABLED is off."""
+    global _cache
+    
+    if os.getenv("RERANK_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        _cache = RerankScoreCache(max_entries=int(os.getenv("RERANK_CACHE_SIZE", "50000")))
+    return _cache
+
+class LexicalReranker:
+    """CPU-only reranker: BM25 over the candidate set, blended with retrieval order.
+    
+    Term statistics come from the candidates themselves, so scoring 20
+    chunks is one small term-frequency matrix and a dot product. The
+    lexical score is normalized by the best score the candidates could
+    reach and weighted against the candidate's retrieval rank, which keeps
+    dense-only matches from sinking to the bottom.
+    """
+    
+    def __init__(self, k1: float = 1.2, b: float = 0.75, lexical_weight: float = 0.7):
+        self.k1 = k1
+        self.b = b
+        self.lexical_weight = lexical_weight
+    
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        count = len(texts)
+        prior = 1.0 - np.arange(count) / max(count, 1)
+        terms = list(dict.fromkeys(WORD.findall(query.lower())))
+        if not terms or not count:
+            return prior
+        
+        column = {term: i for i, term in enumerate(terms)}
+        tf = np.zeros((count, len(terms)), dtype=np.float32)
+        lengths = np.zeros(count, dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD.findall(text.lower())
+            lengths[row] = len(words)
+            hits = [column[word] for word in words if word in column]
+            if hits:
+                tf[row] = np.bincount(hits, minlength=len(terms))
+        
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((count - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+        bm25 = (tf * (self.k1 + 1.0) / (tf + norm[:, None])) @ idf
+        # Best reachable score: terms no candidate contains can't separate them
+        upper = (self.k1 + 1.0) * float(idf[df > 0].sum())
+        lexical = bm25 / upper if upper > 0 else np.zeros(count)
+        return self.lexical_weight * lexical + (1.0 - self.lexical_weight) * prior
+    
+    def rank(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_n: int = 3
+    ) -> List[Dict[str, Any]]:
+        with span("reranker.local"):
+            scores = self.score(query, [doc["text"] for doc in documents])
+        return _rank(documents, scores.tolist(), top_n)
+    
+    @traced("reranker.rerank")
+    async def rerank(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_n: int = 3
+    ) -> List[Dict[str, Any]]:
+        """Rerank locally; fast enough for the event loop at candidate-set sizes."""
+        if not documents:
+            return []
+        return self.rank(query, documents, top_n)
+    
+    async def close(self):
+        pass
+
+class _BaseReranker:
+    """Score cache and local fallback shared by the sync and async Cohere rerankers."""
+    
+    def _configure(self, fallback: Optional[LexicalReranker]):
         api_key = os.getenv("COHERE_API_KEY")
         if not api_key:
             raise ValueError("COHERE_API_KEY not set")
-        self.client = cohere.Client(api_key=api_key)
+        self.fallback = fallback or LexicalReranker()
+        self.cache = get_rerank_cache()
+        return api_key
+    
+    def _use_client(self, client, timeout: float):
+        self.pool = ProviderPool("reranker", [Upstream(f"cohere:{RERANK_MODEL}", client)], timeout)
+    
+    @property
+    def client(self):
+        return self.pool.primary.target
+    
+    @client.setter
+    def client(self, client):
+        # Benchmarks swap in a fake client
+        self.pool.primary.target = client
+    
+    @property
+    def timeout(self) -> float:
+        return self.pool.timeout
+    
+    def _cached_scores(self, query: str, documents: List[Dict[str, Any]]):
+        """Cached scores (None where missing) and the indices still to score."""
+        if self.cache is None:
+            return [None] * len(documents), list(range(len(documents)))
+        scores = self.cache.get_many(RERANK_MODEL, query, documents)
+        return scores, [i for i, score in enumerate(scores) if score is None]
+    
+    def _merge(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        scores: List[Optional[float]],
+        missing: List[int],
+        results,
+        top_n: int
+    ) -> List[Dict[str, Any]]:
+        """Fill in the scores Cohere returned, cache them and rank."""
+        fresh = [0.0] * len(missing)
+        for result in results.results:
+            fresh[result.index] = result.relevance_score
+        for i, score in zip(missing, fresh):
+            scores[i] = score
+        if self.cache is not None:
+            self.cache.put_many(RERANK_MODEL, query, [documents[i] for i in missing], fresh)
+        return _rank(documents, scores, top_n)
+    
+    def _fall_back(self, query: str, documents: List[Dict[str, Any]], top_n: int) -> List[Dict[str, Any]]:
+        metrics.inc("rag_fallbacks_total", stage="reranker.rerank")
+        # Fallback: score locally instead of returning vector order
+        return self.fallback.rank(query, documents, top_n)
+
+class Reranker(_BaseReranker):
+    def __init__(self, fallback: Optional[LexicalReranker] = None, timeout: float = RERANK_TIMEOUT):
+        api_key = self._configure(fallback)
+        self._use_client(cohere.Client(api_key=api_key, timeout=timeout), timeout)
     
+    @traced("reranker.rerank")
     def rerank(
         self,
         query: str,
@@ -19,28 +240,82 @@ class Reranker:
         if not documents:
             return []
         
-        doc_texts = [doc["text"] for doc in documents]
+        scores, missing = self._cached_scores(query, documents)
+        if not missing:
+            return _rank(documents, scores, top_n)
         
         try:
-            results = self.client.rerank(
-                model="rerank-english-v3.0",
-                query=query,
-                documents=doc_texts,
-                top_n=min(top_n, len(documents))
+            # Every candidate's score is requested so all of them can be cached
+            _, results = self.pool.call_sync(
+                lambda client: client.rerank(
+                    model=RERANK_MODEL,
+                    query=query,
+                    documents=[documents[i]["text"] for i in missing],
+                    top_n=len(missing)
+                )
             )
-            
-            reranked = []
-            for result in results.results:
-                original_doc = documents[result.index]
-                reranked.append({
-                    **original_doc,
-                    "rerank_score": result.relevance_score,
-                    "original_score": original_doc.get("score", 0.0)
-                })
-            
-            return reranked
         except Exception as e:
             print(f"Reranking error: {e}")
-            # Fallback: return original order
-            return documents[:top_n]
+            return self._fall_back(query, documents, top_n)
+        
+        return self._merge(query, documents, scores, missing, results, top_n)
+
+class AsyncReranker(_BaseReranker):
+    """Cohere reranker with a score cache and a local fallback.
+    
+    Cohere gets ``timeout`` seconds (RERANK_TIMEOUT_MS); past that, or on
+    any error, the local reranker answers, so a slow or failing provider
+    costs at most the budget. While Cohere's circuit breaker is open the
+    local reranker answers straight away.
+    """
+    
+    def __init__(
+        self,
+        fallback: Optional[LexicalReranker] = None,
+        timeout: float = RERANK_TIMEOUT
+    ):
+        # AsyncClient keeps one pooled aiohttp session for all requests
+        self._use_client(cohere.AsyncClient(api_key=self._configure(fallback)), timeout)
+    
+    @traced("reranker.rerank")
+    async def rerank(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_n: int = 3
+    ) -> List[Dict[str, Any]]:
+        """Rerank documents using Cohere Rerank API without blocking the event loop."""
+        if not documents:
+            return []
+        
+        scores, missing = self._cached_scores(query, documents)
+        if not missing:
+            return _rank(documents, scores, top_n)
+        
+        try:
+            _, results = await self.pool.call(
+                lambda client: client.rerank(
+                    model=RERANK_MODEL,
+                    query=query,
+                    documents=[documents[i]["text"] for i in missing],
+                    top_n=len(missing)
+                )
+            )
+        except Exception as e:
+            print(f"Reranking error: {e}")
+            return self._fall_back(query, documents, top_n)
+        
+        return self._merge(query, documents, scores, missing, results, top_n)
+    
+    async def close(self):
+        """Close the underlying client session."""
+        await self.client.close()
 
+def create_reranker():
+    """Reranker selected by RERANKER: "cohere" (with local fallback) or "local"."""
+    backend = os.getenv("RERANKER", "cohere")
+    if backend == "local":
+        return LexicalReranker()
+    if backend == "cohere":
+        return AsyncReranker()
+    raise ValueError(f"Unknown reranker: {backend}")
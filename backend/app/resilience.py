@@ -0,0 +1,297 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import math
+import os
+import threading
+import time
+
+from app.metrics import metrics
+
+# Consecutive failures that open a provider's breaker
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Time an open breaker waits before letting one trial call through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_MS", "30000")) / 1000.0
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+# Latency quantile past which a second request is sent
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+# Floor on the hedge delay, so fast providers are not hedged on noise
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY_MS", "50")) / 1000.0
+# Latency samples needed before a provider is hedged at all
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 512
+
+class ProvidersUnavailable(Exception):
+    """Every provider of a stage has an open circuit breaker, so none was called."""
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for provider errors that signal throttling (HTTP 429)."""
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    return status == 429 or "ratelimit" in type(error).__name__.lower()
+
+class CircuitBreaker:
+    """Per-provider breaker: closed, open after repeated failures, then half-open.
+    
+    While open, calls are refused without touching the network. After
+    ``reset_timeout`` a single trial call is let through; its outcome
+    closes the breaker or opens it again.
+    """
+    
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allow(self) -> bool:
+        """Whether a call may go out now; claims the trial slot when half-open."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set(self.HALF_OPEN)
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self._state != self.CLOSED:
+                self._set(self.CLOSED)
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    metrics.inc("rag_circuit_opened_total", provider=self.name)
+                self.opened_at = time.monotonic()
+                self._set(self.OPEN)
+    
+    def release(self):
+        """Give back a trial slot whose call was cancelled without an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def _set(self, state: str):
+        self._state = state
+        self._publish()
+    
+    def _publish(self):
+        metrics.set("rag_circuit_state", self._GAUGE[self._state], provider=self.name)
+
+class LatencyWindow:
+    """Latencies of a provider's recent successful calls."""
+    
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+    
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-th latency, or None until HEDGE_MIN_SAMPLES calls have been seen."""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyWindow] = {}
+_registry_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a provider, shared by every service that calls it."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def get_latencies(name: str) -> LatencyWindow:
+    with _registry_lock:
+        if name not in _latencies:
+            _latencies[name] = LatencyWindow()
+        return _latencies[name]
+
+def breaker_states() -> Dict[str, str]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
+
+class Upstream:
+    """One provider (and model) a stage can call, e.g. "groq:llama-3.1-70b-versatile".
+    
+    ``target`` is whatever the calling service needs to reach it, such as
+    an SDK client and model name.
+    """
+    
+    def __init__(self, name: str, target: Any):
+        self.name = name
+        self.target = target
+        self.breaker = get_breaker(name)
+        self.latencies = get_latencies(name)
+
+class ProviderPool:
+    """Ordered failover across upstreams, with per-call deadlines and hedging.
+    
+    Upstreams are tried in order, skipping those whose breaker is open.
+    Each attempt gets ``timeout`` seconds. When a hedgeable call is still
+    running past its upstream's p95 latency, one more request goes to the
+    next available upstream (or the same one if it is the only one) and
+    the first success wins; the loser is cancelled.
+    """
+    
+    def __init__(
+        self,
+        stage: str,
+        upstreams: List[Upstream],
+        timeout: float,
+        hedging: bool = HEDGE_ENABLED
+    ):
+        if not upstreams:
+            raise ValueError(f"No providers configured for {stage}")
+        self.stage = stage
+        self.upstreams = upstreams
+        self.timeout = timeout
+        self.hedging = hedging
+    
+    @property
+    def primary(self) -> Upstream:
+        return self.upstreams[0]
+    
+    def _record_error(self, upstream: Upstream, error: Exception):
+        # Throttling is not an outage: fail over, but keep the breaker closed
+        if is_rate_limited(error):
+            upstream.breaker.release()
+        else:
+            upstream.breaker.record_failure()
+    
+    def _hedge_delay(self, upstream: Upstream) -> Optional[float]:
+        delay = upstream.latencies.quantile(HEDGE_QUANTILE)
+        return None if delay is None else max(delay, HEDGE_MIN_DELAY)
+    
+    async def _attempt(self, upstream: Upstream, call: Callable[[Any], Awaitable], record_latency: bool):
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(upstream.target), timeout=self.timeout)
+        except asyncio.CancelledError:
+            upstream.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            upstream.breaker.record_failure()
+            raise TimeoutError(f"no response within {self.timeout * 1000:.0f} ms")
+        except Exception as e:
+            self._record_error(upstream, e)
+            raise
+        upstream.breaker.record_success()
+        if record_latency:
+            upstream.latencies.add(time.perf_counter() - start)
+        return result
+    
+    async def call(self, call: Callable[[Any], Awaitable], hedge: bool = True) -> Tuple[Upstream, Any]:
+        """Run ``call(target)`` against the upstreams; returns (upstream, result).
+        
+        Only hedgeable calls feed the latency window, so large batch
+        requests do not inflate the p95 that small ones are hedged at.
+        When every attempt fails, the last provider error is raised.
+        """
+        hedge = hedge and self.hedging
+        remaining = iter(self.upstreams)
+        pending: Dict[asyncio.Task, Upstream] = {}
+        errors: List[Exception] = []
+        hedged = False
+        
+        def launch(upstream: Optional[Upstream] = None) -> bool:
+            if upstream is None:
+                upstream = next((u for u in remaining if u.breaker.allow()), None)
+            elif not upstream.breaker.allow():
+                return False
+            if upstream is None:
+                return False
+            task = asyncio.ensure_future(self._attempt(upstream, call, hedge))
+            pending[task] = upstream
+            return True
+        
+        launch()
+        try:
+            while pending:
+                delay = None
+                if hedge and not hedged:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # Past the p95: send one more request, the first answer wins
+                    hedged = True
+                    if launch() or launch(next(iter(pending.values()))):
+                        metrics.inc("rag_hedged_requests_total", stage=self.stage)
+                    continue
+                
+                for task in done:
+                    upstream = pending.pop(task)
+                    if task.exception() is None:
+                        return upstream, task.result()
+                    errors.append(task.exception())
+                    print(f"Provider error ({self.stage}): {upstream.name}: {errors[-1]}")
+                
+                if not pending and launch():
+                    metrics.inc("rag_failovers_total", stage=self.stage)
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        if errors:
+            raise errors[-1]
+        raise ProvidersUnavailable(f"{self.stage}: all circuit breakers open")
+    
+    def call_sync(self, call: Callable[[Any], Any]) -> Tuple[Upstream, Any]:
+        """Blocking ordered failover, without hedging; deadlines are up to ``call``."""
+        errors: List[Exception] = []
+        for upstream in self.upstreams:
+            if not upstream.breaker.allow():
+                continue
+            if errors:
+                metrics.inc("rag_failovers_total", stage=self.stage)
+            try:
+                result = call(upstream.target)
+            except Exception as e:
+                self._record_error(upstream, e)
+                errors.append(e)
+                print(f"Provider error ({self.stage}): {upstream.name}: {e}")
+                continue
+            upstream.breaker.record_success()
+            return upstream, result
+        
+        if errors:
+            raise errors[-1]
+        raise ProvidersUnavailable(f"{self.stage}: all circuit breakers open")
@@ -1,35 +1,247 @@
-from app.vector_db import VectorDB
-from app.embeddings import EmbeddingService
-from typing import List, Dict, Any
+from app.vector_db import create_vector_db, create_async_vector_db, _format_hit
+from app.embeddings import EmbeddingService, AsyncEmbeddingService
+from app.filters import SearchFilter
+from app.lexical import get_lexical_index, reciprocal_rank_fusion
+from app.metrics import span, traced
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
 import time
 
+def _fuse(
+    dense: List[Dict[str, Any]],
+    lexical_hits,
+    top_k: int
+) -> List[Dict[str, Any]]:
+    """Reciprocal-rank fusion of dense and BM25 results (BM25 scores normalized to [0, 1)).
+    
+    Fused chunks keep their dense ``score``; BM25-only chunks carry the
+    normalized BM25 score instead.
+    """
+    if not lexical_hits:
+        return dense
+    
+    dense = [{**chunk, "dense_score": chunk["score"]} for chunk in dense]
+    lexical = [
+        {**_format_hit(point_id, payload, score), "lexical_score": score}
+        for point_id, payload, score in lexical_hits
+    ]
+    return reciprocal_rank_fusion([dense, lexical], top_k)
+
 class Retriever:
-    def __init__(self):
-        self.vector_db = VectorDB()
-        self.embedding_service = EmbeddingService()
+    def __init__(self, vector_db=None, embedding_service=None, lexical_index=None):
+        self.vector_db = vector_db or create_vector_db()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.lexical_index = lexical_index or get_lexical_index()
     
+    @traced("retriever.retrieve")
     def retrieve(
         self,
         query: str,
-        top_k: int = 5
+        top_k: int = 5,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
     ) -> tuple[List[Dict[str, Any]], Dict[str, float]]:
-        """Retrieve relevant chunks for a query."""
-        start_time = time.time()
+        """Retrieve relevant chunks for a query, optionally restricted by ``search_filter``."""
+        start_time = time.perf_counter()
         
-        # Embed query
-        query_embedding = self.embedding_service.embed_text(query)
-        embedding_time = time.time() - start_time
+        # Embed query (unless the caller already did)
+        if query_embedding is None:
+            query_embedding = self.embedding_service.embed_text(query)
+        embedding_time = time.perf_counter() - start_time
         
         # Search vector DB
-        search_start = time.time()
-        chunks = self.vector_db.search(query_embedding, top_k=top_k)
-        search_time = time.time() - search_start
+        search_start = time.perf_counter()
+        chunks = self.vector_db.search(
+            query_embedding,
+            top_k=top_k,
+            mmr_lambda=mmr_lambda,
+            candidate_pool=candidate_pool,
+            search_filter=search_filter,
+            pool_margin=pool_margin,
+            ef_search=ef_search
+        )
+        search_time = time.perf_counter() - search_start
+        
+        # Lexical search + fusion
+        lexical_start = time.perf_counter()
+        if self.lexical_index is not None:
+            with span("lexical.search"):
+                lexical_hits = self.lexical_index.search(query, top_k, search_filter, normalize=True)
+            chunks = _fuse(chunks, lexical_hits, top_k)
+        lexical_time = time.perf_counter() - lexical_start
         
         timing = {
             "embedding": embedding_time,
             "retrieval": search_time,
-            "total_retrieval": time.time() - start_time
+            "lexical": lexical_time,
+            "total_retrieval": time.perf_counter() - start_time
         }
         
         return chunks, timing
+    
+    
+    @traced("retriever.retrieve_batch")
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> tuple[List[List[Dict[str, Any]]], Dict[str, float]]:
+        """Retrieve for several queries with one embedding call and one batch search."""
+        start_time = time.perf_counter()
+        
+        if query_embeddings is None:
+            query_embeddings = self.embedding_service.embed_batch(queries)
+        embedding_time = time.perf_counter() - start_time
+        
+        search_start = time.perf_counter()
+        results = self.vector_db.search_batch(
+            query_embeddings,
+            top_k=top_k,
+            mmr_lambda=mmr_lambda,
+            candidate_pool=candidate_pool,
+            search_filter=search_filter,
+            pool_margin=pool_margin,
+            ef_search=ef_search
+        )
+        search_time = time.perf_counter() - search_start
+        
+        lexical_start = time.perf_counter()
+        if self.lexical_index is not None:
+            with span("lexical.search"):
+                results = [
+                    _fuse(chunks, self.lexical_index.search(query, top_k, search_filter, normalize=True), top_k)
+                    for query, chunks in zip(queries, results)
+                ]
+        lexical_time = time.perf_counter() - lexical_start
+        
+        timing = {
+            "embedding": embedding_time,
+            "retrieval": search_time,
+            "lexical": lexical_time,
+            "total_retrieval": time.perf_counter() - start_time
+        }
+        
+        return results, timing
 
+class AsyncRetriever:
+    def __init__(self, vector_db=None, embedding_service=None, lexical_index=None):
+        self.vector_db = vector_db or create_async_vector_db()
+        self.embedding_service = embedding_service or AsyncEmbeddingService()
+        self.lexical_index = lexical_index or get_lexical_index()
+    
+    @traced("retriever.retrieve")
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """Retrieve relevant chunks for a query without blocking the event loop."""
+        start_time = time.perf_counter()
+        
+        # Embed query (unless the caller already did)
+        if query_embedding is None:
+            query_embedding = await self.embedding_service.embed_text(query)
+        embedding_time = time.perf_counter() - start_time
+        
+        # Search vector DB
+        search_start = time.perf_counter()
+        chunks = await self.vector_db.search(
+            query_embedding,
+            top_k=top_k,
+            mmr_lambda=mmr_lambda,
+            candidate_pool=candidate_pool,
+            search_filter=search_filter,
+            pool_margin=pool_margin,
+            ef_search=ef_search
+        )
+        search_time = time.perf_counter() - search_start
+        
+        # Lexical search + fusion
+        lexical_start = time.perf_counter()
+        if self.lexical_index is not None:
+            with span("lexical.search"):
+                lexical_hits = await run_in_threadpool(
+                    self.lexical_index.search, query, top_k, search_filter, normalize=True
+                )
+            chunks = _fuse(chunks, lexical_hits, top_k)
+        lexical_time = time.perf_counter() - lexical_start
+        
+        timing = {
+            "embedding": embedding_time,
+            "retrieval": search_time,
+            "lexical": lexical_time,
+            "total_retrieval": time.perf_counter() - start_time
+        }
+        
+        return chunks, timing
+    
+    @traced("retriever.retrieve_batch")
+    async def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> tuple[List[List[Dict[str, Any]]], Dict[str, float]]:
+        """Retrieve for several queries with one embedding call and one batch search.
+        
+        Timing covers the whole batch, since each stage runs once for all queries.
+        """
+        start_time = time.perf_counter()
+        
+        if query_embeddings is None:
+            query_embeddings = await self.embedding_service.embed_batch(queries)
+        embedding_time = time.perf_counter() - start_time
+        
+        search_start = time.perf_counter()
+        results = await self.vector_db.search_batch(
+            query_embeddings,
+            top_k=top_k,
+            mmr_lambda=mmr_lambda,
+            candidate_pool=candidate_pool,
+            search_filter=search_filter,
+            pool_margin=pool_margin,
+            ef_search=ef_search
+        )
+        search_time = time.perf_counter() - search_start
+        
+        lexical_start = time.perf_counter()
+        if self.lexical_index is not None:
+            with span("lexical.search"):
+                lexical_hits = await run_in_threadpool(
+                    lambda: [self.lexical_index.search(query, top_k, search_filter, normalize=True) for query in queries]
+                )
+            results = [
+                _fuse(chunks, hits, top_k)
+                for chunks, hits in zip(results, lexical_hits)
+            ]
+        lexical_time = time.perf_counter() - lexical_start
+        
+        timing = {
+            "embedding": embedding_time,
+            "retrieval": search_time,
+            "lexical": lexical_time,
+            "total_retrieval": time.perf_counter() - start_time
+        }
+        
+        return results, timing
@@ -0,0 +1,102 @@
+from starlette.concurrency import run_in_threadpool
+import os
+import time
+
+from app.chunking import TextChunker, get_chunk_pool, close_chunk_pool
+from app.ingestion import IngestionPipeline
+from app.jobs import INGEST_JOB_EMBED_WORKERS, IngestionJobQueue, get_job_journal, close_job_journal
+from app.embeddings import AsyncEmbeddingService
+from app.vector_db import create_async_vector_db
+from app.retriever import AsyncRetriever
+from app.reranker import create_reranker
+from app.llm import AsyncLLMService
+from app.http_client import close_async_http_client
+from app.lexical import get_lexical_index, close_lexical_index
+from app.answer_cache import get_answer_cache
+from app.manifest import get_manifest, close_manifest
+
+class ServiceContainer:
+    """One shared, connection-pooled instance of every service per worker.
+    
+    The retriever is handed the same embedding service and vector store
+    that ingestion uses, so each backend has exactly one client. Any
+    service can be passed in pre-built (the offline benchmarks do this).
+    """
+    
+    def __init__(
+        self,
+        embedding_service=None,
+        vector_db=None,
+        reranker=None,
+        llm_service=None
+    ):
+        self.chunker = TextChunker(chunk_size=1000, chunk_overlap=150)
+        self.embedding_service = embedding_service or AsyncEmbeddingService()
+        self.vector_db = vector_db or create_async_vector_db()
+        self.lexical_index = get_lexical_index()
+        self.manifest = get_manifest()
+        self.retriever = AsyncRetriever(
+            vector_db=self.vector_db,
+            embedding_service=self.embedding_service,
+            lexical_index=self.lexical_index
+        )
+        self.reranker = reranker or create_reranker()
+        self.llm_service = llm_service or AsyncLLMService()
+        self.answer_cache = get_answer_cache()
+        # Background uploads: fewer embedding workers, chunking always in the process pool
+        self.jobs = IngestionJobQueue(
+            get_job_journal(),
+            lambda: self.ingestion_pipeline(embed_workers=INGEST_JOB_EMBED_WORKERS, pool_min_documents=1),
+            answer_cache=self.answer_cache
+        )
+        self.warmup_timing = {}
+    
+    def ingestion_pipeline(self, **options) -> IngestionPipeline:
+        """A pipeline over the shared services; ``options`` override its defaults."""
+        return IngestionPipeline(
+            self.chunker,
+            self.embedding_service,
+            self.vector_db,
+            self.lexical_index,
+            chunk_pool=get_chunk_pool(),
+            manifest=self.manifest,
+            **options
+        )
+    
+    async def warm_up(self):
+        """Pay cold-start costs before the worker reports ready.
+        
+        Warms the tiktoken encoding and the chunker's token tables, checks (or creates) the collection
+        and, unless WARMUP_EMBEDDING=false, sends one tiny embedding
+        request so the provider connection pool is open. Finally resumes
+        ingestion jobs a restart interrupted.
+        """
+        start = time.perf_counter()
+        await run_in_threadpool(self.chunker.chunk_text, "warm up")
+        self.warmup_timing["tokenizer"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        await self.vector_db.ensure_ready()
+        self.warmup_timing["vector_db"] = time.perf_counter() - start
+        
+        if os.getenv("WARMUP_EMBEDDING", "true").lower() == "true":
+            start = time.perf_counter()
+            try:
+                await self.embedding_service.embed_text("warm up")
+            except Exception as e:
+                # A provider hiccup should not keep the worker from serving
+                print(f"Embedding warm-up failed: {e}")
+            self.warmup_timing["embedding"] = time.perf_counter() - start
+        
+        await self.jobs.start()
+    
+    async def close(self):
+        """Stop background jobs, release pooled connections and persist local indexes."""
+        await self.jobs.close()
+        await self.vector_db.close()
+        await self.reranker.close()
+        close_lexical_index()
+        close_manifest()
+        close_job_journal()
+        close_chunk_pool()
+        await close_async_http_client()
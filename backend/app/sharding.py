@@ -0,0 +1,334 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import argparse
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import time
+
+import numpy as np
+
+from app.filters import SearchFilter
+from app.metrics import metrics
+from app.resilience import ProvidersUnavailable, get_breaker
+from app.vector_db import VectorDB, VectorStore
+
+# Comma-separated shards: "collection", "collection@https://node:6333" or "local:path"
+VECTOR_SHARDS = os.getenv("VECTOR_SHARDS", "")
+# Points per shard on the hash ring; more gives a more even spread
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+# Searches return without shards that have not answered by then
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT_MS", "1000")) / 1000.0
+# Fan-out threads; 0 means four per shard
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+
+Hits = List[Tuple[str, Dict[str, Any], float, Optional[Any]]]
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing of keys onto named shards, with virtual nodes."""
+    
+    def __init__(self, shards: List[str], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted(
+            (_ring_hash(f"{shard}#{i}"), shard)
+            for shard in shards
+            for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+    
+    def shard_for(self, key: str) -> str:
+        i = bisect.bisect(self._hashes, _ring_hash(key))
+        return self._shards[i % len(self._shards)]
+
+def _take(embeddings, rows: List[int]):
+    if isinstance(embeddings, np.ndarray):
+        return embeddings[rows]
+    return [embeddings[i] for i in rows]
+
+def merge_hits(shard_hits: List[Hits], limit: int) -> Hits:
+    """Global top ``limit`` of per-shard hit lists (each best first), one hit per id.
+    
+    A point can briefly sit on two shards while it is being rebalanced.
+    """
+    merged = []
+    seen = set()
+    for hit in heapq.merge(*shard_hits, key=lambda hit: -hit[2]):
+        if hit[0] in seen:
+            continue
+        seen.add(hit[0])
+        merged.append(hit)
+        if len(merged) == limit:
+            break
+    return merged
+
+class ShardedVectorStore(VectorStore):
+    """Scatter-gather over several vector stores.
+    
+    Writes go to the shard owning each chunk's source. Searches fan out
+    to every shard at once; each has ``timeout`` seconds to answer, and
+    the per-shard top hits are merged with a heap. A slow or failing
+    shard is left out of the result instead of failing the search, and
+    feeds a circuit breaker (``shard:<name>``) that stops sending it
+    requests while it is down. Only a search no shard answered raises.
+    """
+    
+    def __init__(
+        self,
+        shards: Dict[str, VectorStore],
+        timeout: float = SHARD_TIMEOUT,
+        virtual_nodes: int = SHARD_VIRTUAL_NODES,
+        workers: int = SHARD_WORKERS
+    ):
+        if not shards:
+            raise ValueError("VECTOR_SHARDS must list at least one shard")
+        dimensions = {store.dimension for store in shards.values()}
+        if len(dimensions) > 1:
+            raise ValueError(f"Shards have different dimensions: {sorted(dimensions)}")
+        self.shards = shards
+        self.dimension = dimensions.pop()
+        self.timeout = timeout
+        self.ring = HashRing(list(shards), virtual_nodes)
+        self.breakers = {name: get_breaker(f"shard:{name}") for name in shards}
+        # Hung shards hold a thread until they answer, so leave headroom
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or 4 * len(shards),
+            thread_name_prefix="shard"
+        )
+    
+    def shard_for(self, source: str) -> str:
+        return self.ring.shard_for(source)
+    
+    def _on_all(self, call: Callable[[VectorStore], Any]):
+        """Run ``call`` on every shard concurrently and wait; raises the first error."""
+        futures = [self._pool.submit(call, store) for store in self.shards.values()]
+        for future in futures:
+            future.result()
+    
+    def upsert_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """Upsert each chunk on the shard that owns its source."""
+        if not chunks or not len(embeddings):
+            return
+        ids = ids or [None] * len(chunks)
+        
+        routed: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            routed.setdefault(self.shard_for(chunk.get("source", "")), []).append(i)
+        futures = [
+            self._pool.submit(
+                self.shards[name].upsert_chunks,
+                [chunks[i] for i in rows],
+                _take(embeddings, rows),
+                None if ids[0] is None else [ids[i] for i in rows]
+            )
+            for name, rows in routed.items()
+        ]
+        for future in futures:
+            future.result()
+    
+    def delete_points(self, ids: List[str]):
+        """Delete on every shard; point ids do not say which shard holds them."""
+        if not ids:
+            return
+        self._on_all(lambda store: store.delete_points(ids))
+    
+    def iter_points(self, batch_size: int = 1024) -> Iterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        for store in self.shards.values():
+            yield from store.iter_points(batch_size)
+    
+    def _timed(self, name: str, call: Callable[[VectorStore], Any]):
+        start = time.perf_counter()
+        result = call(self.shards[name])
+        metrics.observe("rag_shard_duration_seconds", time.perf_counter() - start, shard=name)
+        return result
+    
+    def _scatter(self, call: Callable[[VectorStore], Any]) -> List[Any]:
+        """Results of ``call`` from every shard that answered within the deadline."""
+        futures = {
+            self._pool.submit(self._timed, name, call): name
+            for name in self.shards
+            if self.breakers[name].allow()
+        }
+        if not futures:
+            raise ProvidersUnavailable("vector_db: all shard circuit breakers open")
+        done, late = wait(futures, timeout=self.timeout)
+        
+        results = []
+        errors = []
+        for future in done:
+            name = futures[future]
+            if future.exception() is None:
+                self.breakers[name].record_success()
+                metrics.inc("rag_shard_requests_total", shard=name, result="ok")
+                results.append(future.result())
+            else:
+                self.breakers[name].record_failure()
+                metrics.inc("rag_shard_requests_total", shard=name, result="error")
+                errors.append(future.exception())
+                print(f"Shard error ({name}): {errors[-1]}")
+        for future in late:
+            name = futures[future]
+            future.cancel()
+            self.breakers[name].record_failure()
+            metrics.inc("rag_shard_requests_total", shard=name, result="timeout")
+            print(f"Shard timeout ({name}): no answer within {self.timeout * 1000:.0f} ms")
+        
+        if len(results) < len(self.shards):
+            if not results:
+                if errors:
+                    raise errors[-1]
+                raise TimeoutError("No vector store shard answered")
+            metrics.inc("rag_shard_partial_searches_total")
+        return results
+    
+    def _search_hits(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> Hits:
+        shard_hits = self._scatter(
+            lambda store: store._search_hits(
+                query_embedding, limit, score_threshold, with_vectors,
+                search_filter=search_filter, ef_search=ef_search
+            )
+        )
+        return merge_hits(shard_hits, limit)
+    
+    def _search_hits_batch(
+        self,
+        query_embeddings: List[List[float]],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Hits]:
+        """One batch request per shard, merged query by query."""
+        if not query_embeddings:
+            return []
+        shard_batches = self._scatter(
+            lambda store: store._search_hits_batch(
+                query_embeddings, limit, score_threshold, with_vectors,
+                search_filter=search_filter, ef_search=ef_search
+            )
+        )
+        return [
+            merge_hits([batch[i] for batch in shard_batches], limit)
+            for i in range(len(query_embeddings))
+        ]
+    
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for store in self.shards.values():
+            # Local stand-ins are shared process-wide (get_local_store) and stay open
+            persist = getattr(store, "persist", None)
+            if persist is not None:
+                persist()
+            else:
+                store.close()
+
+def parse_shards(spec: str) -> List[Tuple[str, str, Optional[str]]]:
+    """(name, kind, location) per VECTOR_SHARDS entry; the name places it on the ring.
+    
+    Qdrant shards are named by collection, local ones by path, so moving
+    a collection to another node does not move any sources.
+    """
+    shards = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if entry.startswith("local:"):
+            shards.append((entry[len("local:"):], "local", entry[len("local:"):]))
+        else:
+            collection, _, url = entry.partition("@")
+            shards.append((collection, "qdrant", url or None))
+    names = [name for name, _, _ in shards]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate shard names in VECTOR_SHARDS: {spec}")
+    return shards
+
+def create_sharded_store(spec: Optional[str] = None) -> ShardedVectorStore:
+    from app.local_store import get_local_store
+    
+    stores: Dict[str, VectorStore] = {}
+    for name, kind, location in parse_shards(VECTOR_SHARDS if spec is None else spec):
+        if kind == "local":
+            stores[name] = get_local_store(location, int(os.getenv("EMBEDDING_DIMENSION", "1536")))
+        else:
+            stores[name] = VectorDB(url=location, collection_name=name)
+    return ShardedVectorStore(stores)
+
+def rebalance(
+    store: ShardedVectorStore,
+    batch_size: int = 1024,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """Move every point whose source the ring now assigns to another shard.
+    
+    Points are copied to their new shard before being deleted from the
+    old one, so searches keep finding them throughout (merge_hits drops
+    the duplicate). Safe to re-run after an interruption.
+    """
+    moves: Dict[str, int] = {}
+    scanned = 0
+    for name, shard in store.shards.items():
+        # Deleting points already scrolled past does not disturb the iteration
+        for ids, payloads, vectors in shard.iter_points(batch_size):
+            scanned += len(ids)
+            routed: Dict[str, List[int]] = {}
+            for i, payload in enumerate(payloads):
+                target = store.shard_for(payload.get("source", ""))
+                if target != name:
+                    routed.setdefault(target, []).append(i)
+            for target, rows in routed.items():
+                moves[f"{name} -> {target}"] = moves.get(f"{name} -> {target}", 0) + len(rows)
+                if dry_run:
+                    continue
+                store.shards[target].upsert_chunks(
+                    [payloads[i] for i in rows],
+                    vectors[rows],
+                    [ids[i] for i in rows]
+                )
+                shard.delete_points([ids[i] for i in rows])
+    return {
+        "scanned": scanned,
+        "moved": sum(moves.values()),
+        "moves": moves,
+        "dry_run": dry_run
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Move sources to the shards VECTOR_SHARDS assigns them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("rebalance", help="Move points to the shards VECTOR_SHARDS now assigns them")
+    move.add_argument("--batch-size", type=int, default=1024)
+    move.add_argument("--dry-run", action="store_true", help="Only count the points that would move")
+    args = parser.parse_args()
+    
+    from dotenv import load_dotenv
+    load_dotenv()
+    store = create_sharded_store(os.getenv("VECTOR_SHARDS", ""))
+    try:
+        result = rebalance(store, args.batch_size, args.dry_run)
+    finally:
+        store.close()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+import argparse
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from app.vector_db import _build_payload
+
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "2048"))
+# Batches upserted at once during import
+SNAPSHOT_IMPORT_CONCURRENCY = int(os.getenv("SNAPSHOT_IMPORT_CONCURRENCY", "4"))
+
+MAGIC = b"RAGSNAP\x00"
+VERSION = 1
+# magic, version, vector dtype code, dimension, point count, section count
+_HEADER = struct.Struct("<8sHBxIQI")
+# section name, offset, length
+_SECTION = struct.Struct("<24sQQ")
+# Sections start on this boundary, so every column can be viewed in place
+ALIGNMENT = 64
+VECTOR_DTYPES = {"float32": (0, np.float32), "float16": (1, np.float16)}
+# Low-cardinality payload fields: distinct values once, plus a uint32 code per point
+DICTIONARY_FIELDS = ("source", "title", "section", "tenant")
+# Code of a missing (None) dictionary field
+NULL_CODE = 0xFFFFFFFF
+
+# Metadata value tags
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+def _encode_value(out: bytearray, value: Any, keys: Dict[str, int]):
+    """Append a tagged binary encoding of a metadata value; dict keys go through ``keys``."""
+    if value is None:
+        out.append(_NONE)
+    elif isinstance(value, bool):
+        out.append(_TRUE if value else _FALSE)
+    elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        out.append(_INT)
+        out += _I64.pack(value)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _F64.pack(value)
+    elif isinstance(value, (str, int)):
+        data = str(value).encode("utf-8")
+        out.append(_STR)
+        out += _U32.pack(len(data))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        out += _U32.pack(len(value))
+        for item in value:
+            _encode_value(out, item, keys)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        out += _U32.pack(len(value))
+        for key, item in value.items():
+            out += _U32.pack(keys.setdefault(str(key), len(keys)))
+            _encode_value(out, item, keys)
+    else:
+        raise ValueError(f"Cannot snapshot metadata value of type {type(value).__name__}")
+
+def _decode_value(data: bytes, pos: int, keys: List[str]) -> Tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag in (_FALSE, _TRUE):
+        return tag == _TRUE, pos
+    if tag == _INT:
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return _F64.unpack_from(data, pos)[0], pos + 8
+    (length,) = _U32.unpack_from(data, pos)
+    pos += 4
+    if tag == _STR:
+        return data[pos:pos + length].decode("utf-8"), pos + length
+    if tag == _LIST:
+        items = []
+        for _ in range(length):
+            item, pos = _decode_value(data, pos, keys)
+            items.append(item)
+        return items, pos
+    if tag == _DICT:
+        items = {}
+        for _ in range(length):
+            key = keys[_U32.unpack_from(data, pos)[0]]
+            items[key], pos = _decode_value(data, pos + 4, keys)
+        return items, pos
+    raise ValueError(f"Corrupt snapshot metadata (tag {tag})")
+
+def _pack_strings(values: List[str]) -> Tuple[bytes, bytes]:
+    """(uint64 offsets, UTF-8 arena) for a small in-memory string column."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets.tobytes(), b"".join(encoded)
+
+class _StringColumn:
+    """Variable-length values: uint64 end offsets in memory, the byte arena spooled to disk."""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = array("Q", [0])
+        self._file = open(path, "wb")
+    
+    def add(self, data: bytes):
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+    
+    def close(self):
+        self._file.close()
+
+class SnapshotWriter:
+    """Writes a columnar snapshot: header, section table, then 64-byte aligned sections.
+    
+    Sections are a float32 or float16 vector block (points x dimension),
+    UTF-8 arenas with uint64 offsets for ids, texts and encoded metadata,
+    dictionary-encoded source/title/section/tenant, and int32 positions.
+    Metadata uses a tagged binary encoding whose keys are stored once.
+    Large columns are spooled to a temporary directory next to ``path``
+    and assembled on ``close``; ``abort`` discards them instead.
+    """
+    
+    def __init__(self, path: str, dimension: int, vector_dtype: str = "float32"):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown snapshot vector dtype: {vector_dtype}")
+        self.path = path
+        self.dimension = dimension
+        self.vector_dtype = vector_dtype
+        self.count = 0
+        self._spool = tempfile.mkdtemp(prefix=".snapshot-", dir=os.path.dirname(os.path.abspath(path)))
+        self._vectors = open(os.path.join(self._spool, "vectors"), "wb")
+        self._ids = _StringColumn(os.path.join(self._spool, "ids"))
+        self._text = _StringColumn(os.path.join(self._spool, "text"))
+        self._metadata = _StringColumn(os.path.join(self._spool, "metadata"))
+        self._dictionaries: Dict[str, Dict[str, int]] = {field: {} for field in DICTIONARY_FIELDS}
+        self._codes = {field: array("I") for field in DICTIONARY_FIELDS}
+        self._positions = array("i")
+        self._keys: Dict[str, int] = {}
+    
+    def add(self, ids: List[str], payloads: List[Dict[str, Any]], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), self.dimension):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dimension}, got {vectors.shape}")
+        self._vectors.write(vectors.astype(VECTOR_DTYPES[self.vector_dtype][1]).tobytes())
+        
+        for point_id, payload in zip(ids, payloads):
+            self._ids.add(point_id.encode("utf-8"))
+            self._text.add(payload["text"].encode("utf-8"))
+            for field in DICTIONARY_FIELDS:
+                value = payload.get(field)
+                values = self._dictionaries[field]
+                self._codes[field].append(NULL_CODE if value is None else values.setdefault(value, len(values)))
+            self._positions.append(int(payload.get("position", 0)))
+            encoded = bytearray()
+            _encode_value(encoded, payload.get("metadata") or {}, self._keys)
+            self._metadata.add(bytes(encoded))
+        self.count += len(ids)
+    
+    def _close_spool(self):
+        self._vectors.close()
+        for column in (self._ids, self._text, self._metadata):
+            column.close()
+    
+    def abort(self):
+        """Discard everything added; ``path`` is left as it was."""
+        self._close_spool()
+        shutil.rmtree(self._spool, ignore_errors=True)
+    
+    def close(self) -> int:
+        """Assemble the snapshot file; returns its size in bytes."""
+        self._close_spool()
+        
+        # (name, bytes or a spooled file path)
+        sections: List[Tuple[str, Any]] = [("vectors", self._vectors.name)]
+        for name, column in (("ids", self._ids), ("text", self._text), ("metadata", self._metadata)):
+            sections += [(f"{name}.offsets", column.offsets.tobytes()), (f"{name}.data", column.path)]
+        for field in DICTIONARY_FIELDS:
+            offsets, data = _pack_strings(list(self._dictionaries[field]))
+            sections += [
+                (f"{field}.offsets", offsets),
+                (f"{field}.data", data),
+                (f"{field}.codes", self._codes[field].tobytes())
+            ]
+        offsets, data = _pack_strings(list(self._keys))
+        sections += [("keys.offsets", offsets), ("keys.data", data), ("position", self._positions.tobytes())]
+        
+        tmp_path = self.path + ".tmp"
+        table = []
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(b"\0" * (_HEADER.size + _SECTION.size * len(sections)))
+                for name, content in sections:
+                    f.write(b"\0" * (-f.tell() % ALIGNMENT))
+                    offset = f.tell()
+                    if isinstance(content, bytes):
+                        f.write(content)
+                    else:
+                        with open(content, "rb") as source:
+                            shutil.copyfileobj(source, f, 1024 * 1024)
+                    table.append((name, offset, f.tell() - offset))
+                size = f.tell()
+                
+                f.seek(0)
+                f.write(_HEADER.pack(
+                    MAGIC, VERSION, VECTOR_DTYPES[self.vector_dtype][0],
+                    self.dimension, self.count, len(table)
+                ))
+                for name, offset, length in table:
+                    f.write(_SECTION.pack(name.encode("ascii"), offset, length))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            shutil.rmtree(self._spool, ignore_errors=True)
+        return size
+
+class SnapshotReader:
+    """Memory-maps a snapshot; columns are views into the file, decoded per batch."""
+    
+    def __init__(self, path: str):
+        self._file = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, dtype_code, self.dimension, self.count, section_count = _HEADER.unpack(
+            self._file[:_HEADER.size].tobytes()
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} snapshot")
+        self.vector_dtype = next(name for name, (code, _) in VECTOR_DTYPES.items() if code == dtype_code)
+        
+        table = self._file[_HEADER.size:_HEADER.size + _SECTION.size * section_count].tobytes()
+        self._sections = {}
+        for i in range(section_count):
+            name, offset, length = _SECTION.unpack_from(table, i * _SECTION.size)
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+        
+        self.vectors = self._column("vectors", VECTOR_DTYPES[self.vector_dtype][1]).reshape(
+            self.count, self.dimension
+        )
+        self.positions = self._column("position", np.int32)
+        self._dictionaries = {field: self._strings(field, 0, None) for field in DICTIONARY_FIELDS}
+        self._codes = {field: self._column(f"{field}.codes", np.uint32) for field in DICTIONARY_FIELDS}
+        self._keys = self._strings("keys", 0, None)
+    
+    def _column(self, name: str, dtype) -> np.ndarray:
+        offset, length = self._sections[name]
+        return self._file[offset:offset + length].view(dtype)
+    
+    def _raw(self, name: str, start: int, end) -> List[bytes]:
+        offsets = self._column(f"{name}.offsets", np.uint64)[start:None if end is None else end + 1].tolist()
+        if len(offsets) < 2:
+            return []
+        base = offsets[0]
+        data = self._column(f"{name}.data", np.uint8)[base:offsets[-1]].tobytes()
+        return [data[a - base:b - base] for a, b in zip(offsets[:-1], offsets[1:])]
+    
+    def _strings(self, name: str, start: int, end) -> List[str]:
+        return [data.decode("utf-8") for data in self._raw(name, start, end)]
+    
+    def batches(self, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """(ids, chunk dicts for ``upsert_chunks``, float32 vectors) per batch, in file order."""
+        for start in range(0, self.count, batch_size):
+            end = min(start + batch_size, self.count)
+            fields = {
+                field: [
+                    None if code == NULL_CODE else self._dictionaries[field][code]
+                    for code in self._codes[field][start:end].tolist()
+                ]
+                for field in DICTIONARY_FIELDS
+            }
+            chunks = []
+            for i, (text, metadata) in enumerate(zip(self._strings("text", start, end), self._raw("metadata", start, end))):
+                chunk = {
+                    "text": text,
+                    "source": fields["source"][i],
+                    "title": fields["title"][i],
+                    "section": fields["section"][i],
+                    "position": int(self.positions[start + i]),
+                    "metadata": _decode_value(metadata, 0, self._keys)[0]
+                }
+                if fields["tenant"][i] is not None:
+                    chunk["tenant"] = fields["tenant"][i]
+                chunks.append(chunk)
+            yield self._strings("ids", start, end), chunks, np.asarray(self.vectors[start:end], dtype=np.float32)
+    
+    def close(self):
+        self._file._mmap.close()
+
+def export_snapshot(
+    vector_db,
+    path: str,
+    vector_dtype: str = "float32",
+    batch_size: int = SNAPSHOT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Write every point of ``vector_db`` to a snapshot file."""
+    start = time.perf_counter()
+    writer = SnapshotWriter(path, vector_db.dimension, vector_dtype)
+    try:
+        for ids, payloads, vectors in vector_db.iter_points(batch_size):
+            writer.add(ids, payloads, vectors)
+    except BaseException:
+        # A partial export must not replace an earlier snapshot at ``path``
+        writer.abort()
+        raise
+    size = writer.close()
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": writer.count,
+        "bytes": size,
+        "seconds": seconds,
+        "chunks_per_second": writer.count / seconds if seconds else 0.0
+    }
+
+def import_snapshot(
+    path: str,
+    vector_db,
+    manifest=None,
+    lexical_index=None,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    concurrency: int = SNAPSHOT_IMPORT_CONCURRENCY
+) -> Dict[str, Any]:
+    """Upsert a snapshot through ``vector_db.upsert_chunks`` in parallel batches.
+    
+    Vectors are read from the snapshot's memory map one batch at a time,
+    so memory stays bounded by ``batch_size * concurrency``. The manifest
+    and lexical index, when given, are updated alongside, so incremental
+    re-ingestion and hybrid search work on the imported points.
+    """
+    start = time.perf_counter()
+    reader = SnapshotReader(path)
+    if reader.dimension != vector_db.dimension:
+        raise ValueError(
+            f"Snapshot dimension {reader.dimension} does not match store dimension {vector_db.dimension}"
+        )
+    
+    def load(batch) -> int:
+        ids, chunks, vectors = batch
+        vector_db.upsert_chunks(chunks, vectors, ids)
+        if lexical_index is not None:
+            lexical_index.add(ids, [_build_payload(chunk) for chunk in chunks])
+        if manifest is not None:
+            by_source: Dict[str, List[str]] = {}
+            for point_id, chunk in zip(ids, chunks):
+                by_source.setdefault(chunk["source"], []).append(point_id)
+            for source, source_ids in by_source.items():
+                manifest.add(source, source_ids)
+        return len(ids)
+    
+    imported = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            pending = deque()
+            for batch in reader.batches(batch_size):
+                pending.append(pool.submit(load, batch))
+                # Bounded read-ahead: at most two batches per worker in memory
+                if len(pending) >= 2 * concurrency:
+                    imported += pending.popleft().result()
+            while pending:
+                imported += pending.popleft().result()
+    finally:
+        reader.close()
+    
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": imported,
+        "seconds": seconds,
+        "chunks_per_second": imported / seconds if seconds else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a binary snapshot of the knowledge base")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write the configured vector store to a snapshot")
+    export.add_argument("path")
+    export.add_argument("--dtype", choices=list(VECTOR_DTYPES), default="float32")
+    load = commands.add_parser("import", help="Load a snapshot into the configured vector store")
+    load.add_argument("path")
+    load.add_argument("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE)
+    load.add_argument("--concurrency", type=int, default=SNAPSHOT_IMPORT_CONCURRENCY)
+    args = parser.parse_args()
+    
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app.lexical import close_lexical_index, get_lexical_index
+    from app.manifest import close_manifest, get_manifest
+    from app.vector_db import create_vector_db
+    
+    vector_db = create_vector_db()
+    try:
+        if args.command == "export":
+            result = export_snapshot(vector_db, args.path, args.dtype)
+        else:
+            result = import_snapshot(
+                args.path,
+                vector_db,
+                manifest=get_manifest(),
+                lexical_index=get_lexical_index(),
+                batch_size=args.batch_size,
+                concurrency=args.concurrency
+            )
+    finally:
+        vector_db.close()
+        close_lexical_index()
+        close_manifest()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
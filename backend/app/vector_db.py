@@ -1,19 +1,319 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List, Dict, Any
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, PointIdsList,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig,
+    SearchParams, QuantizationSearchParams, SearchRequest, PayloadSchemaType
+)
+from starlette.concurrency import run_in_threadpool
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+import asyncio
+import hashlib
+import json
 import os
 import uuid
 
-class VectorDB:
-    def __init__(self):
-        url = os.getenv("QDRANT_URL")
+import numpy as np
+
+from app.filters import SearchFilter, payload_index_fields, to_qdrant_filter
+from app.http_client import get_http_limits
+from app.metrics import traced
+from app.mmr import mmr_select
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+# Default candidate pool is top_k times this factor
+MMR_POOL_FACTOR = int(os.getenv("MMR_POOL_FACTOR", "4"))
+
+# "none", "int8" (scalar) or "binary"; quantized collections keep float32 originals on disk
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Candidates fetched with quantized vectors per result, then rescored in full precision
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "4.0"))
+
+# Namespace for deterministic point ids (uuid5), fixed so ids are stable across deploys
+POINT_ID_NAMESPACE = uuid.UUID("6f1c0a52-3b7e-4d2a-9a55-2f3c8e1d7b40")
+
+def content_hash(text: str, attributes: Optional[Dict[str, Any]] = None) -> str:
+    """Digest of a chunk's text, plus its ingest attributes (tenant, metadata) if any."""
+    digest = hashlib.sha256(text.encode("utf-8"))
+    if attributes:
+        digest.update(json.dumps(attributes, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+def make_point_id(source: str, digest: str, occurrence: int = 0) -> str:
+    """Stable id for a chunk: same source and content hash -> same point.
+    
+    ``occurrence`` tells apart identical chunks repeated within a source.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\x00{digest}\x00{occurrence}"))
+
+def _vectors_config(dimension: int) -> VectorParams:
+    return VectorParams(
+        size=dimension,
+        distance=Distance.COSINE,
+        on_disk=VECTOR_QUANTIZATION != "none"
+    )
+
+def _quantization_config():
+    """Qdrant quantization for new collections; codes stay in RAM, originals on disk."""
+    if VECTOR_QUANTIZATION == "none":
+        return None
+    if VECTOR_QUANTIZATION == "int8":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(
+            type=ScalarType.INT8,
+            quantile=0.99,
+            always_ram=True
+        ))
+    if VECTOR_QUANTIZATION == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown vector quantization: {VECTOR_QUANTIZATION}")
+
+def _search_params(ef_search: Optional[int] = None) -> Optional[SearchParams]:
+    """HNSW beam width for this search, and oversampling/rescoring for quantized vectors."""
+    if VECTOR_QUANTIZATION == "none" and ef_search is None:
+        return None
+    quantization = None
+    if VECTOR_QUANTIZATION != "none":
+        quantization = QuantizationSearchParams(rescore=True, oversampling=QUANTIZATION_OVERSAMPLING)
+    return SearchParams(hnsw_ef=ef_search, quantization=quantization)
+
+def _build_payload(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {
+        "text": chunk["text"],
+        "source": chunk["source"],
+        "title": chunk.get("title", ""),
+        "section": chunk.get("section", ""),
+        "position": chunk["position"],
+        "metadata": chunk.get("metadata", {})
+    }
+    if chunk.get("tenant"):
+        payload["tenant"] = chunk["tenant"]
+    return payload
+
+def _build_points(
+    chunks: List[Dict[str, Any]],
+    embeddings: List[List[float]],
+    ids: Optional[List[str]] = None
+) -> List[PointStruct]:
+    """Build Qdrant points from chunks and their embeddings."""
+    ids = ids or [str(uuid.uuid4()) for _ in chunks]
+    if isinstance(embeddings, np.ndarray):
+        embeddings = embeddings.tolist()
+    return [
+        PointStruct(id=point_id, vector=embedding, payload=_build_payload(chunk))
+        for point_id, chunk, embedding in zip(ids, chunks, embeddings)
+    ]
+
+def _format_hit(point_id: str, payload: Dict[str, Any], score: float) -> Dict[str, Any]:
+    return {
+        "id": point_id,
+        "text": payload["text"],
+        "source": payload.get("source", ""),
+        "title": payload.get("title", ""),
+        "section": payload.get("section", ""),
+        "position": payload.get("position", 0),
+        "score": score,
+        "metadata": payload.get("metadata", {})
+    }
+
+def _select_mmr(
+    query_embedding: List[float],
+    hits: List[Tuple[str, Dict[str, Any], float, Optional[Any]]],
+    top_k: int,
+    mmr_lambda: float,
+    pool_margin: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Pick top_k of the (id, payload, score, vector) hits with Maximal Marginal Relevance.
+    
+    With ``pool_margin``, the candidate pool is sized from the score
+    distribution: only hits within ``pool_margin`` of the best (and at
+    least top_k) are considered. Each chunk then also carries the
+    query's ``top_score``, ``score_gap`` (best minus runner-up) and
+    ``candidate_pool``, for the adaptive query pipeline.
+    """
+    if not hits:
+        return []
+    
+    profile = {}
+    if pool_margin is not None:
+        top_score = hits[0][2]
+        pool = max(top_k, sum(1 for hit in hits if hit[2] >= top_score - pool_margin))
+        hits = hits[:pool]
+        profile = {
+            "top_score": top_score,
+            "score_gap": top_score - hits[1][2] if len(hits) > 1 else top_score,
+            "candidate_pool": len(hits)
+        }
+    
+    if mmr_lambda >= 1.0 or hits[0][3] is None:
+        chosen = range(min(top_k, len(hits)))
+    else:
+        chosen = mmr_select(
+            np.asarray(query_embedding, dtype=np.float32),
+            np.asarray([vector for _, _, _, vector in hits], dtype=np.float32),
+            top_k,
+            lambda_mult=mmr_lambda,
+            relevance=np.asarray([score for _, _, score, _ in hits], dtype=np.float32)
+        )
+    return [{**_format_hit(*hits[i][:3]), **profile} for i in chosen]
+
+def _hits(results) -> List[Tuple[str, Dict[str, Any], float, Optional[Any]]]:
+    return [
+        (str(result.id), result.payload, result.score, result.vector)
+        for result in results
+    ]
+
+def _search_requests(
+    query_embeddings: List[List[float]],
+    limit: int,
+    score_threshold: float,
+    with_vectors: bool,
+    search_filter: Optional[SearchFilter] = None,
+    ef_search: Optional[int] = None
+) -> List[SearchRequest]:
+    """One Qdrant search request per query, for ``search_batch``."""
+    query_filter = to_qdrant_filter(search_filter)
+    return [
+        SearchRequest(
+            vector=query_embedding,
+            filter=query_filter,
+            limit=limit,
+            score_threshold=score_threshold,
+            params=_search_params(ef_search),
+            with_payload=True,
+            with_vector=with_vectors
+        )
+        for query_embedding in query_embeddings
+    ]
+
+def _candidate_limit(top_k: int, candidate_pool: Optional[int]) -> int:
+    return max(candidate_pool or top_k * MMR_POOL_FACTOR, top_k)
+
+class VectorStore(ABC):
+    """Contract shared by every vector-store backend.
+    
+    Backends implement ``upsert_chunks``, ``delete_points``,
+    ``iter_points`` and ``_search_hits``; MMR selection and result
+    formatting live here so all backends return identical chunk dicts.
+    """
+    
+    @abstractmethod
+    def upsert_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """Insert or overwrite points by id; random ids are assigned when ``ids`` is None."""
+    
+    @abstractmethod
+    def delete_points(self, ids: List[str]):
+        """Delete points by id; unknown ids are ignored."""
+    
+    @abstractmethod
+    def iter_points(self, batch_size: int = 1024) -> Iterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """Every stored point as (ids, payloads, float32 vectors) batches, for snapshots."""
+    
+    @abstractmethod
+    def _search_hits(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Tuple[str, Dict[str, Any], float, Optional[Any]]]:
+        """Return up to ``limit`` (id, payload, score, vector or None) passing ``search_filter``, best first.
+        
+        ``ef_search`` is the HNSW beam width for this search; None keeps the backend's default.
+        """
+    
+    @traced("vector_db.search")
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar chunks, diversified with Maximal Marginal Relevance.
+        
+        ``search_filter`` is applied inside the backend's search, not to its results.
+        """
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        hits = self._search_hits(
+            query_embedding,
+            limit=_candidate_limit(top_k, candidate_pool),
+            score_threshold=score_threshold,
+            with_vectors=mmr_lambda < 1.0,
+            search_filter=search_filter,
+            ef_search=ef_search
+        )
+        return _select_mmr(query_embedding, hits, top_k, mmr_lambda, pool_margin)
+    
+    def _search_hits_batch(
+        self,
+        query_embeddings: List[List[float]],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Tuple[str, Dict[str, Any], float, Optional[Any]]]]:
+        """``_search_hits`` for several queries; backends override to batch the work."""
+        return [
+            self._search_hits(
+                query_embedding, limit, score_threshold, with_vectors,
+                search_filter=search_filter, ef_search=ef_search
+            )
+            for query_embedding in query_embeddings
+        ]
+    
+    @traced("vector_db.search_batch")
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """``search`` for several queries at once, results in input order."""
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        batch_hits = self._search_hits_batch(
+            query_embeddings,
+            limit=_candidate_limit(top_k, candidate_pool),
+            score_threshold=score_threshold,
+            with_vectors=mmr_lambda < 1.0,
+            search_filter=search_filter,
+            ef_search=ef_search
+        )
+        return [
+            _select_mmr(query_embedding, hits, top_k, mmr_lambda, pool_margin)
+            for query_embedding, hits in zip(query_embeddings, batch_hits)
+        ]
+    
+    def close(self):
+        pass
+
+class VectorDB(VectorStore):
+    def __init__(self, url: Optional[str] = None, collection_name: Optional[str] = None):
+        url = url or os.getenv("QDRANT_URL")
         api_key = os.getenv("QDRANT_API_KEY")
         
         if not url or not api_key:
             raise ValueError("QDRANT_URL and QDRANT_API_KEY must be set")
         
         self.client = QdrantClient(url=url, api_key=api_key)
-        self.collection_name = os.getenv("QDRANT_COLLECTION_NAME", "rag_documents")
+        self.collection_name = collection_name or os.getenv("QDRANT_COLLECTION_NAME", "rag_documents")
         self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
         self._ensure_collection()
     
@@ -26,78 +326,384 @@ class VectorDB:
             if self.collection_name not in collection_names:
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.dimension,
-                        distance=Distance.COSINE
-                    )
+                    vectors_config=_vectors_config(self.dimension),
+                    quantization_config=_quantization_config()
+                )
+            # Idempotent; also adds indexes configured after the collection was created
+            for field_name, schema in payload_index_fields():
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType(schema)
                 )
         except Exception as e:
             print(f"Error ensuring collection: {e}")
             raise
     
+    @traced("vector_db.upsert")
     def upsert_chunks(
         self,
         chunks: List[Dict[str, Any]],
-        embeddings: List[List[float]]
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
     ):
         """Upsert document chunks with embeddings."""
-        if not chunks or not embeddings:
+        if not chunks or not len(embeddings):
+            return
+        
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=_build_points(chunks, embeddings, ids)
+        )
+    
+    @traced("vector_db.delete")
+    def delete_points(self, ids: List[str]):
+        """Delete points by id in one request."""
+        if not ids:
             return
         
-        points = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            point_id = str(uuid.uuid4())
-            point = PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload={
-                    "text": chunk["text"],
-                    "source": chunk["source"],
-                    "title": chunk.get("title", ""),
-                    "section": chunk.get("section", ""),
-                    "position": chunk["position"],
-                    "metadata": chunk.get("metadata", {})
-                }
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=list(ids))
+        )
+    
+    def iter_points(self, batch_size: int = 1024) -> Iterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """Scroll through the collection with payloads and vectors."""
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
             )
-            points.append(point)
+            if records:
+                yield (
+                    [str(record.id) for record in records],
+                    [record.payload for record in records],
+                    np.asarray([record.vector for record in records], dtype=np.float32)
+                )
+            if offset is None:
+                return
+    
+    def _search_hits(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Tuple[str, Dict[str, Any], float, Optional[Any]]]:
+        results = self.client.search(
+            collection_name=self.collection_name,
+            query_vector=query_embedding,
+            query_filter=to_qdrant_filter(search_filter),
+            limit=limit,
+            score_threshold=score_threshold,
+            search_params=_search_params(ef_search),
+            with_vectors=with_vectors
+        )
+        return _hits(results)
+    
+    def _search_hits_batch(
+        self,
+        query_embeddings: List[List[float]],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False,
+        search_filter: Optional[SearchFilter] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Tuple[str, Dict[str, Any], float, Optional[Any]]]]:
+        """All queries in one round trip."""
+        if not query_embeddings:
+            return []
+        batch = self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=_search_requests(
+                query_embeddings, limit, score_threshold, with_vectors, search_filter, ef_search
+            )
+        )
+        return [_hits(results) for results in batch]
+    
+    def close(self):
+        self.client.close()
+
+class AsyncVectorDB:
+    def __init__(self):
+        url = os.getenv("QDRANT_URL")
+        api_key = os.getenv("QDRANT_API_KEY")
         
-        self.client.upsert(
+        if not url or not api_key:
+            raise ValueError("QDRANT_URL and QDRANT_API_KEY must be set")
+        
+        self.client = AsyncQdrantClient(url=url, api_key=api_key, limits=get_http_limits())
+        self.collection_name = os.getenv("QDRANT_COLLECTION_NAME", "rag_documents")
+        self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+    
+    async def ensure_ready(self):
+        """Check the collection exists, creating it if needed."""
+        await self._ensure_collection()
+    
+    async def _ensure_collection(self):
+        """Create collection if it doesn't exist (once per instance)."""
+        if self._collection_ready:
+            return
+        
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            try:
+                collections = (await self.client.get_collections()).collections
+                collection_names = [c.name for c in collections]
+                
+                if self.collection_name not in collection_names:
+                    await self.client.create_collection(
+                        collection_name=self.collection_name,
+                        vectors_config=_vectors_config(self.dimension),
+                        quantization_config=_quantization_config()
+                    )
+                # Idempotent; also adds indexes configured after the collection was created
+                for field_name, schema in payload_index_fields():
+                    await self.client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name=field_name,
+                        field_schema=PayloadSchemaType(schema)
+                    )
+                self._collection_ready = True
+            except Exception as e:
+                print(f"Error ensuring collection: {e}")
+                raise
+    
+    @traced("vector_db.upsert")
+    async def upsert_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """Upsert document chunks with embeddings."""
+        if not chunks or not len(embeddings):
+            return
+        
+        await self._ensure_collection()
+        await self.client.upsert(
             collection_name=self.collection_name,
-            points=points
+            points=_build_points(chunks, embeddings, ids)
         )
     
-    def search(
+    @traced("vector_db.delete")
+    async def delete_points(self, ids: List[str]):
+        """Delete points by id in one request."""
+        if not ids:
+            return
+        
+        await self._ensure_collection()
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=list(ids))
+        )
+    
+    async def iter_points(self, batch_size: int = 1024) -> AsyncIterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """Scroll through the collection with payloads and vectors."""
+        await self._ensure_collection()
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if records:
+                yield (
+                    [str(record.id) for record in records],
+                    [record.payload for record in records],
+                    np.asarray([record.vector for record in records], dtype=np.float32)
+                )
+            if offset is None:
+                return
+    
+    @traced("vector_db.search")
+    async def search(
         self,
         query_embedding: List[float],
         top_k: int = 5,
-        score_threshold: float = 0.0
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
     ) -> List[Dict[str, Any]]:
-        """Search for similar chunks using MMR-like diversity."""
-        results = self.client.search(
+        """Search for similar chunks, diversified with Maximal Marginal Relevance."""
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        await self._ensure_collection()
+        results = await self.client.search(
             collection_name=self.collection_name,
             query_vector=query_embedding,
-            limit=top_k * 2,  # Get more for diversity
-            score_threshold=score_threshold
+            query_filter=to_qdrant_filter(search_filter),
+            limit=_candidate_limit(top_k, candidate_pool),
+            score_threshold=score_threshold,
+            search_params=_search_params(ef_search),
+            with_vectors=mmr_lambda < 1.0
         )
         
-        # Simple MMR: select diverse results
-        selected = []
-        used_sources = set()
-        
-        for result in results:
-            source = result.payload.get("source", "")
-            if len(selected) < top_k:
-                if source not in used_sources or len(used_sources) < top_k // 2:
-                    selected.append({
-                        "text": result.payload["text"],
-                        "source": result.payload.get("source", ""),
-                        "title": result.payload.get("title", ""),
-                        "section": result.payload.get("section", ""),
-                        "position": result.payload.get("position", 0),
-                        "score": result.score,
-                        "metadata": result.payload.get("metadata", {})
-                    })
-                    used_sources.add(source)
+        return _select_mmr(query_embedding, _hits(results), top_k, mmr_lambda, pool_margin)
+    
+    @traced("vector_db.search_batch")
+    async def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Search for several queries in one Qdrant request, results in input order."""
+        if not query_embeddings:
+            return []
         
-        return selected[:top_k]
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        await self._ensure_collection()
+        batch = await self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=_search_requests(
+                query_embeddings,
+                limit=_candidate_limit(top_k, candidate_pool),
+                score_threshold=score_threshold,
+                with_vectors=mmr_lambda < 1.0,
+                search_filter=search_filter,
+                ef_search=ef_search
+            )
+        )
+        return [
+            _select_mmr(query_embedding, _hits(results), top_k, mmr_lambda, pool_margin)
+            for query_embedding, results in zip(query_embeddings, batch)
+        ]
+    
+    async def close(self):
+        """Close the underlying client connections."""
+        await self.client.close()
+
+class AsyncVectorStore:
+    """Async facade over a blocking VectorStore (local or sharded); work runs in the threadpool."""
+    
+    def __init__(self, store: VectorStore):
+        self.store = store
+    
+    async def ensure_ready(self):
+        # In-process stores are loaded when constructed
+        pass
+    
+    async def upsert_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """Upsert document chunks with embeddings."""
+        await run_in_threadpool(self.store.upsert_chunks, chunks, embeddings, ids)
+    
+    async def delete_points(self, ids: List[str]):
+        """Delete points by id."""
+        await run_in_threadpool(self.store.delete_points, ids)
+    
+    async def iter_points(self, batch_size: int = 1024) -> AsyncIterator[Tuple[List[str], List[Dict[str, Any]], np.ndarray]]:
+        """The store's batches, each read in the threadpool."""
+        batches = self.store.iter_points(batch_size)
+        while True:
+            batch = await run_in_threadpool(next, batches, None)
+            if batch is None:
+                return
+            yield batch
+    
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar chunks, diversified with Maximal Marginal Relevance."""
+        return await run_in_threadpool(
+            self.store.search,
+            query_embedding,
+            top_k,
+            score_threshold,
+            mmr_lambda,
+            candidate_pool,
+            search_filter,
+            pool_margin,
+            ef_search
+        )
+    
+    async def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        score_threshold: float = 0.0,
+        mmr_lambda: Optional[float] = None,
+        candidate_pool: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        pool_margin: Optional[float] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Search for several queries in one threadpool call, results in input order."""
+        return await run_in_threadpool(
+            self.store.search_batch,
+            query_embeddings,
+            top_k,
+            score_threshold,
+            mmr_lambda,
+            candidate_pool,
+            search_filter,
+            pool_margin,
+            ef_search
+        )
+    
+    async def close(self):
+        # Local stores are shared process-wide and stay open; just persist them
+        persist = getattr(self.store, "persist", None)
+        if persist is not None:
+            await run_in_threadpool(persist)
+        else:
+            await run_in_threadpool(self.store.close)
+
+def _local_store() -> VectorStore:
+    from app.local_store import get_local_store
+    return get_local_store(
+        os.getenv("LOCAL_STORE_PATH", ".cache/vector_store"),
+        int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+    )
+
+def create_vector_db() -> VectorStore:
+    """Build the vector store selected by VECTOR_BACKEND ("qdrant", "local" or "sharded")."""
+    backend = os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend == "local":
+        return _local_store()
+    if backend == "sharded":
+        from app.sharding import create_sharded_store
+        return create_sharded_store()
+    return VectorDB()
 
+def create_async_vector_db():
+    """Async counterpart of create_vector_db."""
+    backend = os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend == "local":
+        return AsyncVectorStore(_local_store())
+    if backend == "sharded":
+        from app.sharding import create_sharded_store
+        return AsyncVectorStore(create_sharded_store())
+    return AsyncVectorDB()
@@ -0,0 +1,76 @@
+"""Recall@k vs. latency of the local HNSW index against the exact scan.
+
+Run from the backend directory:
+
+    python -m benchmarks.ann_recall --points 100000 --dim 256 --ef 16 32 64 128 256
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.ann import HNSWIndex
+
+def make_dataset(points: int, dim: int, queries: int, seed: int = 0):
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(points // 500, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=points + queries)
+    data = centers[labels] + 0.6 * rng.normal(size=(points + queries, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data[:points], data[points:]
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = vectors @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    vectors, queries = make_dataset(args.points, args.dim, args.queries)
+    
+    build_start = time.perf_counter()
+    index = HNSWIndex(M=args.M, ef_construction=args.ef_construction)
+    index.add(range(len(vectors)), vectors)
+    build_time = time.perf_counter() - build_start
+    
+    exact_start = time.perf_counter()
+    truth = [set(exact_top_k(vectors, q, args.k).tolist()) for q in queries]
+    exact_latency = (time.perf_counter() - exact_start) / len(queries)
+    
+    rows = []
+    for ef in args.ef:
+        start = time.perf_counter()
+        found = [index.search(q, args.k, vectors, ef_search=ef)[0] for q in queries]
+        latency = (time.perf_counter() - start) / len(queries)
+        recall = np.mean([len(t & set(f.tolist())) / args.k for t, f in zip(truth, found)])
+        rows.append({"ef_search": ef, "recall": float(recall), "latency_ms": latency * 1000})
+    
+    print(f"points={args.points} dim={args.dim} k={args.k} build={build_time:.1f}s")
+    print(f"{'method':<14}{'recall@' + str(args.k):>12}{'latency ms':>14}")
+    print(f"{'exact':<14}{1.0:>12.3f}{exact_latency * 1000:>14.3f}")
+    for row in rows:
+        print(f"{'hnsw ef=' + str(row['ef_search']):<14}{row['recall']:>12.3f}{row['latency_ms']:>14.3f}")
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "params": vars(args),
+                "build_seconds": build_time,
+                "exact_latency_ms": exact_latency * 1000,
+                "hnsw": rows
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
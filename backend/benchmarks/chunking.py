@@ -0,0 +1,79 @@
+"""Chunking throughput (chars/s): offset-slicing chunker vs. per-window decoding.
+
+Run from the backend directory:
+
+    python -m benchmarks.chunking --documents 64 --doc-words 20000 --workers 4
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from app.chunking import TextChunker, chunk_document
+from benchmarks.pipeline import make_corpus
+
+def window_decode_chunks(chunker: TextChunker, text: str):
+    """The previous algorithm: encode everything, then decode every overlapping window."""
+    tokens = chunker.encoding.encode(text)
+    step = chunker.chunk_size - chunker.chunk_overlap
+    return [
+        chunker.encoding.decode(tokens[i:i + chunker.chunk_size])
+        for i in range(0, len(tokens), step)
+    ]
+
+def measure(label: str, chars: int, run) -> dict:
+    start = time.perf_counter()
+    chunks = run()
+    elapsed = time.perf_counter() - start
+    result = {"label": label, "seconds": elapsed, "chars_per_second": chars / elapsed, "chunks": chunks}
+    print(f"{label:<28} {chars / elapsed / 1e6:7.2f} M chars/s  {chunks} chunks")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=32)
+    parser.add_argument("--doc-words", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    corpus = make_corpus(args.documents, args.doc_words)
+    texts = [document["text"] for document in corpus]
+    chars = sum(len(text) for text in texts)
+    chunker = TextChunker(args.chunk_size, args.overlap)
+    # Load the encoding's merge tables before timing anything
+    chunker.encoding.encode(texts[0])
+    
+    results = [
+        measure("window decode (previous)", chars, lambda: sum(
+            len(window_decode_chunks(chunker, text)) for text in texts
+        )),
+        measure("offset slicing", chars, lambda: sum(
+            len(chunker.chunk_text(text)) for text in texts
+        )),
+    ]
+    
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Start the workers and load their encodings outside the timed run
+            list(pool.map(chunk_document, [chunker.config] * args.workers, texts[:1] * args.workers,
+                          ["warmup"] * args.workers, ["warmup"] * args.workers))
+            results.append(measure(f"offset slicing, {args.workers} processes", chars, lambda: sum(
+                len(chunks) for chunks in pool.map(
+                    chunk_document,
+                    [chunker.config] * len(texts),
+                    texts,
+                    [document["source"] for document in corpus],
+                    [document["title"] for document in corpus]
+                )
+            )))
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "chars": chars, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
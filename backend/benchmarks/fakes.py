@@ -0,0 +1,159 @@
+"""Deterministic in-process stand-ins for OpenAI, Cohere, Groq and Qdrant.
+
+The fakes replace provider *clients*, so the real services (embedding
+cache and batching, prompt building, citation parsing, MMR, BM25) run
+unchanged. Each fake sleeps for a log-normally distributed latency and
+fails at a configurable rate; embedding failures are 429s so the
+ingestion retry path is exercised.
+"""
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+from app.local_store import LocalVectorStore
+from app.metrics import traced
+
+WORD = re.compile(r"\w+")
+
+class FakeProviderError(Exception):
+    """Raised by the fakes; carries an HTTP status like the real SDK errors."""
+    
+    def __init__(self, status_code: int, message: str = "injected failure"):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+class Latency:
+    """Seeded latency and failure injector.
+    
+    ``median_ms`` is the median delay; ``sigma`` widens the log-normal
+    tail (0 gives a constant delay).
+    """
+    
+    def __init__(self, median_ms: float, failure_rate: float = 0.0, sigma: float = 0.5, seed: int = 0):
+        self.median = median_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+    
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.median), self.sigma)
+    
+    def should_fail(self) -> bool:
+        return self.failure_rate > 0 and self.rng.random() < self.failure_rate
+    
+    async def wait(self, status_code: int = 500):
+        delay = self.sample()
+        failed = self.should_fail()
+        if delay:
+            await asyncio.sleep(delay)
+        if failed:
+            raise FakeProviderError(status_code)
+    
+    def wait_sync(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+def hash_embedding(text: str, dimension: int) -> List[float]:
+    """Unit-length hashed bag of words: similar texts get similar vectors."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in WORD.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimension] += 1.0 if value & (1 << 63) else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.tolist()
+
+class _FakeEmbeddings:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+    
+    async def create(self, model: str, input: List[str], dimensions: int = 1536, **kwargs):
+        await self.latency.wait(status_code=429)
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=hash_embedding(text, dimensions)) for text in input],
+            usage=SimpleNamespace(prompt_tokens=sum(len(text.split()) for text in input))
+        )
+
+class _FakeCompletions:
+    def __init__(self, latency: Latency, answer_words: int):
+        self.latency = latency
+        self.answer_words = answer_words
+        self.calls = 0
+    
+    async def create(self, model: str, messages, temperature: float = 0.0, **kwargs):
+        self.calls += 1
+        await self.latency.wait()
+        prompt = messages[-1]["content"]
+        sources = sorted(set(int(n) for n in re.findall(r"\[(\d+)\]", prompt)))[:2] or [1]
+        words = WORD.findall(prompt)[-self.answer_words:]
+        answer = " ".join(words) + " " + " ".join(f"[{n}]" for n in sources)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(
+                prompt_tokens=len(prompt.split()),
+                completion_tokens=len(answer.split()),
+                total_tokens=len(prompt.split()) + len(answer.split())
+            )
+        )
+
+class FakeOpenAI:
+    """Stands in for AsyncOpenAI/AsyncGroq: ``embeddings`` and ``chat.completions``."""
+    
+    def __init__(self, embed_latency: Latency, chat_latency: Latency, answer_words: int = 60):
+        self.embeddings = _FakeEmbeddings(embed_latency)
+        self.chat = SimpleNamespace(completions=_FakeCompletions(chat_latency, answer_words))
+
+class FakeCohere:
+    """Stands in for cohere.AsyncClient; scores by query word overlap."""
+    
+    def __init__(self, latency: Latency):
+        self.latency = latency
+    
+    async def rerank(self, model: str, query: str, documents: List[str], top_n: int, **kwargs):
+        await self.latency.wait()
+        query_words = set(WORD.findall(query.lower()))
+        scores = [
+            len(query_words & set(WORD.findall(document.lower()))) / (len(query_words) or 1)
+            for document in documents
+        ]
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])[:top_n]
+        return SimpleNamespace(results=[
+            SimpleNamespace(index=i, relevance_score=scores[i]) for i in order
+        ])
+    
+    async def close(self):
+        pass
+
+class FakeQdrant(LocalVectorStore):
+    """The local vector store plus a simulated network round trip per call."""
+    
+    def __init__(self, path: str, dimension: int, latency: Latency, **kwargs):
+        super().__init__(path, dimension, **kwargs)
+        self.latency = latency
+    
+    @traced("vector_db.upsert")
+    def upsert_chunks(self, chunks, embeddings, ids=None):
+        self.latency.wait_sync()
+        # Undecorated parent, so the round trip and the write share one span
+        return LocalVectorStore.upsert_chunks.__wrapped__(self, chunks, embeddings, ids)
+    
+    def _search_hits(self, query_embedding, limit, score_threshold, with_vectors=False, **kwargs):
+        self.latency.wait_sync()
+        return super()._search_hits(query_embedding, limit, score_threshold, with_vectors, **kwargs)
+    
+    def _search_hits_batch(self, query_embeddings, limit, score_threshold, with_vectors=False, **kwargs):
+        # One round trip for the batch (plus one per query when it falls back to single searches)
+        self.latency.wait_sync()
+        return super()._search_hits_batch(query_embeddings, limit, score_threshold, with_vectors, **kwargs)
@@ -0,0 +1,104 @@
+"""Latency and recall@k of filtered vs. unfiltered local vector search.
+
+Each point gets a ``bucket`` metadata value in [0, 1000); a filter
+matching the first ``selectivity * 1000`` buckets keeps that share of
+the rows. Recall is measured against an exact scan of the matching
+rows, for the exact and HNSW stores. Run from the backend directory:
+
+    python -m benchmarks.filtering --points 50000 --dim 256 --selectivity 0.5 0.1 0.01 0.001
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from app.filters import SearchFilter
+from app.local_store import LocalVectorStore
+from benchmarks.pipeline import percentiles
+from benchmarks.quantization import make_dataset
+
+BUCKETS = 1000
+
+def build_store(path: str, index: str, vectors: np.ndarray, batch: int = 1000) -> LocalVectorStore:
+    store = LocalVectorStore(path, vectors.shape[1], index=index, ann_min_points=0)
+    for start in range(0, len(vectors), batch):
+        rows = range(start, min(start + batch, len(vectors)))
+        store.upsert_chunks(
+            [
+                {
+                    "text": f"chunk {i}",
+                    "source": f"doc-{i // 20}",
+                    "position": i % 20,
+                    "metadata": {"bucket": i % BUCKETS}
+                }
+                for i in rows
+            ],
+            vectors[start:start + len(rows)].tolist(),
+            ids=[f"point-{i}" for i in rows]
+        )
+    return store
+
+def bucket_filter(selectivity: float) -> SearchFilter:
+    return SearchFilter(match={"metadata.bucket": list(range(max(1, round(selectivity * BUCKETS))))})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--selectivity", type=float, nargs="+", default=[0.5, 0.1, 0.01, 0.001])
+    parser.add_argument("--index", nargs="+", default=["exact", "hnsw"], choices=["exact", "hnsw"])
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    vectors, queries = make_dataset(args.points, args.dim, args.queries)
+    buckets = np.arange(args.points) % BUCKETS
+    
+    rows = []
+    for index in args.index:
+        with tempfile.TemporaryDirectory() as path:
+            store = build_store(path, index, vectors)
+            for selectivity in [None] + args.selectivity:
+                search_filter = bucket_filter(selectivity) if selectivity is not None else None
+                matching = np.flatnonzero(
+                    buckets < round(selectivity * BUCKETS) if selectivity is not None else buckets >= 0
+                )
+                
+                latencies, recalls = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    hits = store._search_hits(query.tolist(), args.k, -1.0, search_filter=search_filter)
+                    latencies.append(time.perf_counter() - start)
+                    
+                    scores = vectors[matching] @ query
+                    truth = matching[np.argsort(-scores)[:args.k]]
+                    found = {int(point_id.split("-")[1]) for point_id, _, _, _ in hits}
+                    recalls.append(len(found & set(truth.tolist())) / min(args.k, len(matching)))
+                
+                rows.append({
+                    "index": index,
+                    "selectivity": selectivity,
+                    "matching_points": int(len(matching)),
+                    "recall": float(np.mean(recalls)),
+                    "latency": percentiles(latencies)
+                })
+            store.close()
+    
+    print(f"points={args.points} dim={args.dim} k={args.k}")
+    print(f"{'index':<7}{'selectivity':>12}{'matching':>10}{'recall@' + str(args.k):>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in rows:
+        selectivity = "none" if row["selectivity"] is None else f"{row['selectivity']:g}"
+        print(
+            f"{row['index']:<7}{selectivity:>12}{row['matching_points']:>10}{row['recall']:>11.3f}"
+            f"{row['latency']['p50_ms']:>9.2f}{row['latency']['p95_ms']:>9.2f}"
+        )
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Offline end-to-end throughput and latency of /api/upload and /api/query.
+
+Every provider is replaced by a seeded in-process fake (see fakes.py) and
+the app is driven through its ASGI interface at fixed concurrency, so
+runs are comparable between commits without any API keys. Run from the
+backend directory:
+
+    python -m benchmarks.pipeline --documents 200 --queries 500 --concurrency 16 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import numpy as np
+
+STAGES = {
+    "chunking": ("chunking.feed", "chunking.flush"),
+    "embedding": ("embedding.embed_batch",),
+    "search": ("vector_db.search", "lexical.search"),
+    "upsert": ("vector_db.upsert", "lexical.add"),
+    "rerank": ("reranker.rerank",),
+    "generation": ("llm.generate_answer",),
+}
+
+def configure_environment(args, workdir: str):
+    """Point every backend at a scratch directory; must run before importing app."""
+    for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "COHERE_API_KEY"):
+        os.environ.setdefault(key, "offline-benchmark")
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "EMBEDDING_DIMENSION": str(args.dim),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical"),
+        "HYBRID_SEARCH": "true" if args.hybrid else "false",
+        "EMBEDDING_CACHE_ENABLED": "true" if args.embedding_cache else "false",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "MANIFEST_PATH": os.path.join(workdir, "manifest.sqlite3"),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "RERANK_CACHE_ENABLED": "true" if args.rerank_cache else "false",
+        "WARMUP_EMBEDDING": "false",
+    })
+
+# Everyday words mixed into the corpus vocabulary at mid-frequency ranks
+EVERYDAY_WORDS = [
+    "way", "weekend", "time", "place", "season", "station", "people", "forecast",
+    "festival", "holiday", "trip", "safe", "good", "long", "best", "starts",
+]
+
+def make_corpus(documents: int, words_per_document: int, seed: int = 0):
+    """Markdown-like documents over a fixed pseudo-word vocabulary, plus queries drawn from them."""
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ten", "ra", "vos", "qu", "el", "dan", "sor", "pi", "gu"]
+    vocabulary = [
+        "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        for _ in range(5000)
+    ]
+    # Natural-language questions then find weak, incidental BM25 matches
+    for word in EVERYDAY_WORDS:
+        vocabulary.insert(rng.randrange(100, 3000), word)
+    # Zipf-like weights, like natural text
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    
+    corpus = []
+    for d in range(documents):
+        words = rng.choices(vocabulary, weights=weights, k=words_per_document)
+        lines = [f"# Document {d}"]
+        for start in range(0, len(words), 12):
+            if start % 600 == 0:
+                lines.append(f"\n## Section {start // 600 + 1}\n")
+            lines.append(" ".join(words[start:start + 12]).capitalize() + ".")
+        corpus.append({"source": f"doc-{d}", "title": f"Document {d}", "text": "\n".join(lines)})
+    return corpus
+
+def make_queries(corpus: List[Dict[str, str]], count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(corpus)["text"].split()
+        start = rng.randrange(max(len(words) - 10, 1))
+        queries.append(" ".join(words[start:start + rng.randint(5, 10)]))
+    return queries
+
+def make_off_topic_queries(count: int, seed: int = 2) -> List[str]:
+    """Everyday questions the corpus cannot answer, in natural language.
+    
+    Some of their words (EVERYDAY_WORDS) also occur in the corpus, the way
+    real off-topic questions share words with a knowledge base, so BM25
+    finds weak incidental matches for them.
+    """
+    rng = random.Random(seed)
+    frames = [
+        "What is the best way to {} on a {} weekend?",
+        "How long does it take to {} before the {} season starts?",
+        "Can you recommend a good place to {} near the {} station?",
+        "Why do people {} when the {} forecast changes?",
+        "Who decides how to {} at a {} festival?",
+        "Is it safe to {} during a {} holiday trip?",
+    ]
+    activities = [
+        "bake sourdough bread", "learn the violin", "repaint a bicycle", "train a puppy",
+        "grow tomatoes indoors", "plan a wedding", "book cheap flights", "fix a leaking tap",
+    ]
+    contexts = ["rainy", "summer", "mountain", "crowded", "winter", "family", "coastal", "busy"]
+    return [
+        rng.choice(frames).format(rng.choice(activities), rng.choice(contexts))
+        for _ in range(count)
+    ]
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+def max_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+class SpanRecorder:
+    """Keeps every span duration, grouped by name."""
+    
+    def __init__(self):
+        self.samples = defaultdict(list)
+    
+    def __call__(self, name: str, duration: float):
+        self.samples[name].append(duration)
+    
+    def report(self) -> Dict[str, Any]:
+        stages = {
+            stage: percentiles([d for name in names for d in self.samples.get(name, [])])
+            for stage, names in STAGES.items()
+        }
+        stages["spans"] = {name: percentiles(values) for name, values in sorted(self.samples.items())}
+        return stages
+
+async def drive(client, requests: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """Send requests with at most ``concurrency`` in flight; return latency and throughput."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = defaultdict(int)
+    payloads = []
+    
+    async def send(request):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(request["path"], json=request["json"])
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                payloads.append(response.json())
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(send(request) for request in requests))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(requests),
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(requests) / elapsed if elapsed else 0.0,
+        "status_codes": dict(statuses),
+        "latency": percentiles(latencies),
+        "payloads": payloads,
+    }
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    
+    import app.main as main
+    from app.embeddings import AsyncEmbeddingService
+    from app.llm import AsyncLLMService
+    from app.metrics import add_span_listener, remove_span_listener
+    from app.reranker import AsyncReranker, LexicalReranker
+    from app.services import ServiceContainer
+    from app.vector_db import AsyncVectorStore
+    from benchmarks.fakes import FakeCohere, FakeOpenAI, FakeQdrant, Latency
+    
+    embed_latency = Latency(args.embed_latency, args.failure_rate, seed=args.seed)
+    llm_latency = Latency(args.llm_latency, args.failure_rate, seed=args.seed + 1)
+    
+    embedding_service = AsyncEmbeddingService()
+    embedding_service.client = FakeOpenAI(embed_latency, llm_latency, args.answer_words)
+    llm_service = AsyncLLMService()
+    llm_service.client = FakeOpenAI(embed_latency, llm_latency, args.answer_words)
+    if args.reranker == "local":
+        reranker = LexicalReranker()
+    else:
+        reranker = AsyncReranker(timeout=args.rerank_timeout / 1000.0)
+        reranker.client = FakeCohere(Latency(args.rerank_latency, args.failure_rate, seed=args.seed + 2))
+    vector_db = AsyncVectorStore(FakeQdrant(
+        os.path.join(args.workdir, "vectors"),
+        args.dim,
+        Latency(args.search_latency, seed=args.seed + 3),
+        index=args.index
+    ))
+    
+    services = ServiceContainer(
+        embedding_service=embedding_service,
+        vector_db=vector_db,
+        reranker=reranker,
+        llm_service=llm_service
+    )
+    await services.warm_up()
+    main.services = services
+    
+    corpus = make_corpus(args.documents, args.doc_words, args.seed)
+    off_topic = round(args.queries * args.off_topic)
+    queries = make_queries(corpus, args.queries - off_topic, args.seed + 1)
+    queries += make_off_topic_queries(off_topic, args.seed + 2)
+    random.Random(args.seed).shuffle(queries)
+    transport = httpx.ASGITransport(app=main.app)
+    results: Dict[str, Any] = {}
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        recorder = SpanRecorder()
+        add_span_listener(recorder)
+        upload = await drive(
+            client,
+            # Inline ingestion, so upload latency covers chunking, embedding and upsert
+            [{"path": "/api/upload?wait=true", "json": document} for document in corpus],
+            args.concurrency
+        )
+        remove_span_listener(recorder)
+        chunks = sum(payload["chunks_created"] for payload in upload.pop("payloads"))
+        upload["chunks_created"] = chunks
+        upload["chunks_per_second"] = chunks / upload["elapsed_seconds"] if upload["elapsed_seconds"] else 0.0
+        upload["chars_per_second"] = (
+            sum(len(document["text"]) for document in corpus) / upload["elapsed_seconds"]
+            if upload["elapsed_seconds"] else 0.0
+        )
+        upload["stages"] = recorder.report()
+        results["upload"] = upload
+        
+        recorder = SpanRecorder()
+        add_span_listener(recorder)
+        query = await drive(
+            client,
+            [{"path": "/api/query", "json": {"query": text, "adaptive": args.adaptive}} for text in queries],
+            args.concurrency
+        )
+        remove_span_listener(recorder)
+        payloads = query.pop("payloads")
+        query["cached"] = sum(1 for payload in payloads if payload.get("cached"))
+        # What the adaptive pipeline saves: provider calls, tokens and cost
+        query["reranks_skipped"] = sum(1 for payload in payloads if payload["timing"].get("reranking_skipped"))
+        query["generations_skipped"] = sum(
+            1 for payload in payloads if payload["timing"].get("generation_skipped")
+        )
+        query["llm_tokens"] = sum(payload["token_estimate"]["total"] for payload in payloads)
+        query["cost_usd"] = sum(payload.get("cost_estimate") or 0.0 for payload in payloads)
+        query["stages"] = recorder.report()
+        results["query"] = query
+    
+    await services.close()
+    return results
+
+def print_summary(results: Dict[str, Any]):
+    for phase in ("upload", "query"):
+        data = results[phase]
+        latency = data["latency"]
+        print(
+            f"{phase:>6}: {data['throughput_rps']:8.1f} req/s  "
+            f"p50={latency.get('p50_ms', 0):.1f}ms p95={latency.get('p95_ms', 0):.1f}ms "
+            f"p99={latency.get('p99_ms', 0):.1f}ms  status={data['status_codes']}"
+        )
+        for stage in STAGES:
+            stats = data["stages"][stage]
+            if stats["count"]:
+                print(
+                    f"        {stage:<10} n={stats['count']:<6} p50={stats['p50_ms']:.2f}ms "
+                    f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+                )
+    query = results["query"]
+    print(
+        f"  query: reranks skipped={query['reranks_skipped']} generations skipped={query['generations_skipped']} "
+        f"llm tokens={query['llm_tokens']} cost=${query['cost_usd']:.4f}"
+    )
+    print(f"max RSS: {results['max_rss_mb']:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--doc-words", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--index", choices=["exact", "hnsw"], default="exact")
+    parser.add_argument("--embed-latency", type=float, default=30.0, help="Median ms per embedding request")
+    parser.add_argument("--search-latency", type=float, default=2.0, help="Median ms per vector store call")
+    parser.add_argument("--rerank-latency", type=float, default=40.0, help="Median ms per rerank request")
+    parser.add_argument("--reranker", choices=["cohere", "local"], default="cohere")
+    parser.add_argument("--rerank-timeout", type=float, default=1500.0, help="Remote rerank budget in ms")
+    parser.add_argument("--llm-latency", type=float, default=400.0, help="Median ms per completion")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Injected provider failure rate")
+    parser.add_argument("--answer-words", type=int, default=60)
+    parser.add_argument("--hybrid", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--embedding-cache", action="store_true")
+    parser.add_argument("--answer-cache", action="store_true")
+    parser.add_argument("--rerank-cache", action="store_true")
+    parser.add_argument("--adaptive", action="store_true", help="Query with the adaptive early-exit pipeline")
+    parser.add_argument("--off-topic", type=float, default=0.0, help="Share of queries the corpus cannot answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        args.workdir = workdir
+        configure_environment(args, workdir)
+        results = asyncio.run(run(args))
+    
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "workdir")}
+    results = {"revision": git_revision(), "config": config, **results, "max_rss_mb": max_rss_mb()}
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
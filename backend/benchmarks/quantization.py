@@ -0,0 +1,112 @@
+"""Memory footprint and recall@k of quantized and truncated vectors vs. the float32 scan.
+
+Every configuration is scored against exact float32 search at the full
+dimension, so Matryoshka truncation and quantization losses add up in
+one recall number. Run from the backend directory:
+
+    python -m benchmarks.quantization --points 100000 --dim 1536 --dims 1536 768 256
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.embeddings import truncate_embeddings
+from app.quantization import make_codes, rescored_top_k
+from benchmarks.ann_recall import exact_top_k
+
+def make_dataset(points: int, dim: int, queries: int, cluster_size: int = 50, seed: int = 0):
+    """Clustered unit vectors whose variance decays along the dimensions.
+    
+    Matryoshka-trained embeddings front-load information the same way,
+    which is what makes truncating them viable. Recall of the binary
+    codes depends strongly on how tight the clusters are, so try a few
+    ``--cluster-size`` values before picking an oversampling factor.
+    """
+    rng = np.random.default_rng(seed)
+    decay = (1.0 / np.sqrt(1.0 + np.arange(dim) / 64.0)).astype(np.float32)
+    centers = rng.normal(size=(max(points // cluster_size, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=points + queries)
+    data = (centers[labels] + rng.normal(size=(points + queries, dim)).astype(np.float32)) * decay
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data[:points], data[points:]
+
+def truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    if dim >= vectors.shape[1]:
+        return vectors
+    return np.asarray(truncate_embeddings(vectors, dim), dtype=np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1536, 768, 256], help="Truncated dimensions to try")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--cluster-size", type=int, default=50)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    vectors, queries = make_dataset(args.points, args.dim, args.queries, args.cluster_size)
+    truth = [set(exact_top_k(vectors, q, args.k).tolist()) for q in queries]
+    baseline_bytes = vectors.nbytes
+    
+    # Truncating can only shorten vectors; the defaults assume --dim 1536
+    dims = list(dict.fromkeys(min(dim, args.dim) for dim in args.dims))
+    
+    rows = []
+    for dim in dims:
+        matrix = truncate(vectors, dim)
+        dim_queries = truncate(queries, dim)
+        configs = [("float32", None)] + [
+            (quantization, oversampling)
+            for quantization in ("int8", "binary")
+            for oversampling in args.oversampling
+        ]
+        codes_by_type = {}
+        for quantization, oversampling in configs:
+            if quantization == "float32":
+                resident = matrix.nbytes
+                search = lambda q: exact_top_k(matrix, q, args.k)
+            else:
+                if quantization not in codes_by_type:
+                    codes = make_codes(quantization, dim)
+                    codes.resize(len(matrix))
+                    codes.set(slice(None), matrix)
+                    codes_by_type[quantization] = codes
+                codes = codes_by_type[quantization]
+                resident = codes.nbytes
+                search = lambda q: rescored_top_k(codes, q, matrix, args.k, oversampling)[0]
+            
+            start = time.perf_counter()
+            found = [search(q) for q in dim_queries]
+            latency = (time.perf_counter() - start) / len(dim_queries)
+            recall = np.mean([len(t & set(f.tolist())) / args.k for t, f in zip(truth, found)])
+            rows.append({
+                "dim": dim,
+                "quantization": quantization,
+                "oversampling": oversampling,
+                "resident_bytes": int(resident),
+                "bytes_per_vector": resident / len(matrix),
+                "memory_ratio": resident / baseline_bytes,
+                "recall": float(recall),
+                "latency_ms": latency * 1000
+            })
+    
+    print(f"points={args.points} dim={args.dim} k={args.k} float32 baseline={baseline_bytes / 2**20:.1f} MiB")
+    print(f"{'dim':>6} {'storage':<10}{'oversample':>11}{'bytes/vec':>11}{'memory':>9}{'recall@' + str(args.k):>11}{'ms/query':>10}")
+    for row in rows:
+        oversampling = "-" if row["oversampling"] is None else f"{row['oversampling']:g}"
+        print(
+            f"{row['dim']:>6} {row['quantization']:<10}{oversampling:>11}{row['bytes_per_vector']:>11.0f}"
+            f"{row['memory_ratio']:>9.3f}{row['recall']:>11.3f}{row['latency_ms']:>10.3f}"
+        )
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "baseline_bytes": baseline_bytes, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Answer latency and provider load under slow, hung and failing LLM providers.
+
+Two fake providers (see fakes.py) sit behind AsyncLLMService's provider
+pool: a primary with a configurable latency tail or failure mode, and a
+healthy secondary. Each scenario reports answer latency percentiles,
+errors, and how many requests each provider received, so the cost of
+hedging shows up next to what it saves. Run from the backend directory:
+
+    python -m benchmarks.resilience --requests 400 --concurrency 8 --output resilience.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict
+
+from benchmarks.pipeline import percentiles
+
+def make_pool(name: str, primary, secondary, timeout: float, hedging: bool):
+    from app.llm import LLMTarget
+    from app.resilience import ProviderPool, Upstream
+    
+    return ProviderPool("llm", [
+        Upstream(f"{name}:primary", LLMTarget("groq", "primary", primary)),
+        Upstream(f"{name}:secondary", LLMTarget("openai", "secondary", secondary))
+    ], timeout, hedging=hedging)
+
+async def run_scenario(llm_service, args, name: str, primary_latency, hedging: bool, timeout: float) -> Dict[str, Any]:
+    from benchmarks.fakes import FakeOpenAI, Latency
+    
+    primary = FakeOpenAI(Latency(0), primary_latency)
+    secondary = FakeOpenAI(Latency(0), Latency(args.llm_latency, sigma=0.3, seed=args.seed + 1))
+    llm_service.pool = make_pool(name, primary, secondary, timeout, hedging)
+    
+    chunks = [{"text": f"Context passage {i} about the disk.", "source": "doc", "position": i} for i in range(3)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+    
+    async def ask(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            result = await llm_service.generate_answer(f"question {i}", chunks)
+            latencies.append(time.perf_counter() - start)
+            errors += "error" in result
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    
+    primary_calls = primary.chat.completions.calls
+    secondary_calls = secondary.chat.completions.calls
+    return {
+        "scenario": name,
+        "hedging": hedging,
+        "timeout_ms": timeout * 1000,
+        "elapsed_seconds": elapsed,
+        "errors": errors,
+        "latency": percentiles(latencies),
+        "primary_calls": primary_calls,
+        "secondary_calls": secondary_calls,
+        "calls_per_request": (primary_calls + secondary_calls) / args.requests,
+        "breaker": llm_service.pool.primary.breaker.state
+    }
+
+async def run(args):
+    from app.llm import AsyncLLMService
+    from benchmarks.fakes import Latency
+    
+    llm_service = AsyncLLMService()
+    timeout = args.timeout / 1000.0
+    tail = lambda: Latency(args.llm_latency, sigma=args.tail_sigma, seed=args.seed)
+    scenarios = [
+        ("tail", tail(), False, timeout),
+        ("tail-hedged", tail(), True, timeout),
+        ("outage", Latency(args.llm_latency, failure_rate=1.0, seed=args.seed), True, timeout),
+        ("hang", Latency(args.llm_latency * 100, sigma=0.0), True, timeout),
+    ]
+    return [
+        await run_scenario(llm_service, args, name, latency, hedging, scenario_timeout)
+        for name, latency, hedging, scenario_timeout in scenarios
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=100.0, help="Median ms per completion")
+    parser.add_argument("--tail-sigma", type=float, default=1.0, help="Log-normal sigma of the primary's latency")
+    parser.add_argument("--timeout", type=float, default=2000.0, help="Per-attempt deadline in ms")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    for key in ("OPENAI_API_KEY", "GROQ_API_KEY"):
+        os.environ.setdefault(key, "offline-benchmark")
+    rows = asyncio.run(run(args))
+    
+    print(f"{'scenario':<12}{'hedging':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'primary':>9}{'secondary':>10}{'calls/req':>10}  breaker")
+    for row in rows:
+        latency = row["latency"]
+        print(
+            f"{row['scenario']:<12}{str(row['hedging']):>8}{latency['p50_ms']:>9.0f}{latency['p95_ms']:>9.0f}"
+            f"{latency['p99_ms']:>9.0f}{row['errors']:>8}{row['primary_calls']:>9}{row['secondary_calls']:>10}"
+            f"{row['calls_per_request']:>10.2f}  {row['breaker']}"
+        )
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
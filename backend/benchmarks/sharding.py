@@ -0,0 +1,111 @@
+"""Scatter-gather search latency and recall over local stand-in shards.
+
+Each shard is a fake Qdrant node (the local store plus a simulated
+round trip). For each shard count the corpus is routed by source, and
+search latency and recall@k against an exact scan of the whole corpus
+are measured, then again with one shard slowed past the per-shard
+deadline. Finally a shard is added and ``rebalance`` reports how many
+points moved. Run from the backend directory:
+
+    python -m benchmarks.sharding --points 50000 --shards 1 2 4 8 --slow-ms 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.sharding import ShardedVectorStore, rebalance
+from benchmarks.fakes import FakeQdrant, Latency
+from benchmarks.pipeline import percentiles
+from benchmarks.quantization import make_dataset
+
+def load(store: ShardedVectorStore, vectors: np.ndarray, batch: int = 1000):
+    for start in range(0, len(vectors), batch):
+        rows = range(start, min(start + batch, len(vectors)))
+        store.upsert_chunks(
+            [{"text": f"chunk {i}", "source": f"doc-{i // 20}", "position": i % 20} for i in rows],
+            vectors[start:start + len(rows)],
+            ids=[f"point-{i}" for i in rows]
+        )
+
+def measure(store: ShardedVectorStore, vectors: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    latencies, recalls = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store._search_hits(query.tolist(), k, -1.0)
+        latencies.append(time.perf_counter() - start)
+        truth = set(np.argsort(-(vectors @ query))[:k].tolist())
+        found = {int(point_id.split("-")[1]) for point_id, _, _, _ in hits}
+        recalls.append(len(found & truth) / k)
+    return {"recall": float(np.mean(recalls)), "latency": percentiles(latencies)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shard-ms", type=float, default=10.0, help="Median round trip per shard")
+    parser.add_argument("--slow-ms", type=float, default=1000.0, help="Round trip of the slowed shard")
+    parser.add_argument("--timeout-ms", type=float, default=200.0, help="Per-shard deadline")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    vectors, queries = make_dataset(args.points, args.dim, args.queries)
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in args.shards:
+            # Breakers are process-wide by shard name, so each run gets its own names
+            shards = {
+                f"{count}x-{i}": FakeQdrant(
+                    os.path.join(workdir, f"{count}-{i}"), args.dim, Latency(args.shard_ms, seed=i)
+                )
+                for i in range(count)
+            }
+            store = ShardedVectorStore(shards, timeout=args.timeout_ms / 1000.0)
+            load(store, vectors)
+            sizes = [sum(len(ids) for ids, _, _ in shard.iter_points()) for shard in shards.values()]
+            row = {"shards": count, "points_per_shard": sizes, "healthy": measure(store, vectors, queries, args.k)}
+            
+            if count > 1:
+                shards[f"{count}x-0"].latency = Latency(args.slow_ms, sigma=0)
+                row["one_slow"] = measure(store, vectors, queries, args.k)
+                shards[f"{count}x-0"].latency = Latency(args.shard_ms)
+                store.close()
+                shards[f"{count}x-{count}"] = FakeQdrant(
+                    os.path.join(workdir, f"{count}-{count}"), args.dim, Latency(args.shard_ms)
+                )
+                grown = ShardedVectorStore(shards, timeout=args.timeout_ms / 1000.0)
+                start = time.perf_counter()
+                moved = rebalance(grown)
+                row["rebalance"] = {
+                    "moved_fraction": moved["moved"] / args.points,
+                    "seconds": time.perf_counter() - start
+                }
+                store = grown
+            store.close()
+            for shard in shards.values():
+                shard.close()
+            rows.append(row)
+    
+    print(f"points={args.points} dim={args.dim} k={args.k} shard_ms={args.shard_ms} timeout_ms={args.timeout_ms}")
+    print(f"{'shards':>6}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'slow recall':>13}{'slow p95 ms':>13}{'moved':>8}")
+    for row in rows:
+        slow = row.get("one_slow")
+        print(
+            f"{row['shards']:>6}{row['healthy']['recall']:>8.3f}{row['healthy']['latency']['p50_ms']:>9.1f}"
+            f"{row['healthy']['latency']['p95_ms']:>9.1f}"
+            + (f"{slow['recall']:>13.3f}{slow['latency']['p95_ms']:>13.1f}" if slow else f"{'-':>13}{'-':>13}")
+            + (f"{row['rebalance']['moved_fraction']:>8.1%}" if "rebalance" in row else f"{'-':>8}")
+        )
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
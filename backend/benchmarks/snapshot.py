@@ -0,0 +1,98 @@
+"""Snapshot size and import throughput (chunks/s).
+
+Exports a synthetic knowledge base with float32 and float16 vectors,
+compares the file sizes with the same points as JSON, then imports the
+snapshot into a fresh local store and into the fake Qdrant (a simulated
+round trip per upsert) at several concurrency levels. Run from the
+backend directory:
+
+    python -m benchmarks.snapshot --points 50000 --dim 1536 --concurrency 1 4 8
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from app.local_store import LocalVectorStore
+from app.snapshot import export_snapshot, import_snapshot
+from benchmarks.fakes import FakeQdrant, Latency
+from benchmarks.pipeline import make_corpus
+
+def build_store(path: str, points: int, dim: int, batch: int = 1000, seed: int = 0) -> LocalVectorStore:
+    rng = np.random.default_rng(seed)
+    corpus = make_corpus(max(1, points // 20), 120, seed)
+    store = LocalVectorStore(path, dim)
+    for start in range(0, points, batch):
+        rows = range(start, min(start + batch, points))
+        store.upsert_chunks(
+            [
+                {
+                    "text": corpus[(i // 20) % len(corpus)]["text"][:800],
+                    "source": f"doc-{i // 20}.txt",
+                    "title": f"Document {i // 20}",
+                    "section": None,
+                    "position": i % 20,
+                    "metadata": {"customer": f"customer-{i % 50}", "published_at": 1700000000 + i},
+                    "tenant": f"tenant-{i % 4}"
+                }
+                for i in rows
+            ],
+            rng.standard_normal((len(rows), dim)).astype(np.float32),
+            ids=[f"point-{i}" for i in rows]
+        )
+    return store
+
+def json_size(store: LocalVectorStore) -> int:
+    size = 0
+    for ids, payloads, vectors in store.iter_points():
+        for point_id, payload, vector in zip(ids, payloads, vectors.tolist()):
+            size += len(json.dumps({"id": point_id, "payload": payload, "vector": vector}).encode("utf-8")) + 1
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=2048)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--qdrant-ms", type=float, default=20.0, help="Median fake Qdrant upsert latency")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = {"sizes": {}, "imports": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        source = build_store(os.path.join(workdir, "source"), args.points, args.dim)
+        results["sizes"]["json"] = json_size(source)
+        for dtype in ("float32", "float16"):
+            path = os.path.join(workdir, f"kb-{dtype}.snap")
+            exported = export_snapshot(source, path, dtype, args.batch_size)
+            results["sizes"][dtype] = exported["bytes"]
+        source.close()
+        
+        path = os.path.join(workdir, "kb-float32.snap")
+        for target in ("local", "qdrant"):
+            for concurrency in args.concurrency:
+                store_path = os.path.join(workdir, f"{target}-{concurrency}")
+                if target == "local":
+                    store = LocalVectorStore(store_path, args.dim)
+                else:
+                    store = FakeQdrant(store_path, args.dim, Latency(args.qdrant_ms, seed=concurrency))
+                imported = import_snapshot(path, store, batch_size=args.batch_size, concurrency=concurrency)
+                store.close()
+                results["imports"].append({"target": target, "concurrency": concurrency, **imported})
+    
+    print(f"points={args.points} dim={args.dim} batch={args.batch_size}")
+    for name, size in results["sizes"].items():
+        print(f"{name:<8}{size / 1e6:>10.1f} MB{size / results['sizes']['json']:>8.1%} of JSON")
+    print(f"{'target':<8}{'concurrency':>12}{'seconds':>10}{'chunks/s':>12}")
+    for row in results["imports"]:
+        print(f"{row['target']:<8}{row['concurrency']:>12}{row['seconds']:>10.2f}{row['chunks_per_second']:>12.0f}")
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+DIMENSION = 64
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """Point every backend at a scratch directory, with caches and warm-up embedding off."""
+    for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "COHERE_API_KEY"):
+        monkeypatch.setenv(key, "offline-test")
+    for key, value in {
+        "VECTOR_BACKEND": "local",
+        "LOCAL_STORE_PATH": str(tmp_path / "vectors"),
+        "EMBEDDING_DIMENSION": str(DIMENSION),
+        "LEXICAL_INDEX_PATH": str(tmp_path / "lexical"),
+        "MANIFEST_PATH": str(tmp_path / "manifest.sqlite3"),
+        "INGEST_JOBS_PATH": str(tmp_path / "jobs"),
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "ANSWER_CACHE_ENABLED": "false",
+        "RERANK_CACHE_ENABLED": "false",
+        "CHUNK_WORKERS": "1",
+        "WARMUP_EMBEDDING": "false",
+    }.items():
+        monkeypatch.setenv(key, value)
+    return tmp_path
+
+@pytest.fixture
+def app_client(offline):
+    """Async context manager factory: an httpx client on the app, every provider faked.
+    
+    Latencies are median milliseconds for the fake providers of
+    benchmarks/fakes.py; the real services run on top of them.
+    """
+    import app.main as main
+    from app.embeddings import AsyncEmbeddingService
+    from app.llm import AsyncLLMService
+    from app.reranker import LexicalReranker
+    from app.services import ServiceContainer
+    from app.vector_db import AsyncVectorStore
+    from benchmarks.fakes import FakeOpenAI, FakeQdrant, Latency
+    
+    @asynccontextmanager
+    async def connect(embed_ms: float = 5.0, llm_ms: float = 5.0, search_ms: float = 1.0):
+        embedding_service = AsyncEmbeddingService()
+        embedding_service.client = FakeOpenAI(Latency(embed_ms, sigma=0), Latency(llm_ms, sigma=0))
+        llm_service = AsyncLLMService()
+        llm_service.client = FakeOpenAI(Latency(embed_ms, sigma=0), Latency(llm_ms, sigma=0))
+        vector_db = AsyncVectorStore(FakeQdrant(str(offline / "vectors"), DIMENSION, Latency(search_ms, sigma=0)))
+        services = ServiceContainer(
+            embedding_service=embedding_service,
+            vector_db=vector_db,
+            reranker=LexicalReranker(),
+            llm_service=llm_service
+        )
+        await services.warm_up()
+        main.services = services
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+                yield client
+        finally:
+            main.services = None
+            await services.close()
+    
+    return connect
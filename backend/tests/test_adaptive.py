@@ -0,0 +1,41 @@
+from app.adaptive import (
+    ADAPTIVE_MIN_LEXICAL_SCORE, ADAPTIVE_MIN_SCORE, ADAPTIVE_RERANK_GAP,
+    score_profile, skip_generation, skip_rerank
+)
+
+def dense_chunk(top_score: float, score_gap: float, candidate_pool: int = 20, **fields):
+    return {
+        "text": "chunk", "source": "doc", "position": 0,
+        "top_score": top_score, "score_gap": score_gap, "candidate_pool": candidate_pool,
+        **fields
+    }
+
+def lexical_chunk(score: float):
+    return {"text": "chunk", "source": "other", "position": 1, "lexical_score": score}
+
+def test_generation_is_skipped_when_nothing_is_relevant():
+    weak = ADAPTIVE_MIN_SCORE / 2
+    assert skip_generation(score_profile([dense_chunk(weak, 0.0)]))
+    # Nothing retrieved at all
+    assert skip_generation(score_profile([]))
+
+def test_incidental_lexical_hits_do_not_keep_generation():
+    weak = ADAPTIVE_MIN_SCORE / 2
+    incidental = ADAPTIVE_MIN_LEXICAL_SCORE / 4
+    profile = score_profile([dense_chunk(weak, 0.0), lexical_chunk(incidental), lexical_chunk(incidental / 2)])
+    assert profile["lexical_hits"] == 2
+    assert skip_generation(profile)
+
+def test_generation_runs_on_a_good_dense_or_lexical_match():
+    assert not skip_generation(score_profile([dense_chunk(ADAPTIVE_MIN_SCORE + 0.1, 0.0)]))
+    weak = ADAPTIVE_MIN_SCORE / 2
+    strong = min(1.0, ADAPTIVE_MIN_LEXICAL_SCORE * 2)
+    assert not skip_generation(score_profile([dense_chunk(weak, 0.0), lexical_chunk(strong)]))
+
+def test_rerank_is_skipped_when_the_ranking_is_decisive():
+    decisive = score_profile([dense_chunk(0.8, ADAPTIVE_RERANK_GAP + 0.05)])
+    close = score_profile([dense_chunk(0.8, ADAPTIVE_RERANK_GAP / 2)])
+    assert skip_rerank(decisive, candidates=10, rerank_top_k=3)
+    assert not skip_rerank(close, candidates=10, rerank_top_k=3)
+    # Nothing for the reranker to choose between
+    assert skip_rerank(close, candidates=3, rerank_top_k=3)
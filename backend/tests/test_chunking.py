@@ -0,0 +1,66 @@
+import random
+
+from app.chunking import TextChunker
+
+PARAGRAPHS = [
+    "# Overview\n\nThe ingestion pipeline splits documents into overlapping windows. "
+    "Each window is embedded once and stored with its source and section.",
+    "## Café notes\n\nNaïve façades déjà vu: résumé, coöperate, smörgåsbord. "
+    "Prices are quoted in € and £, and the menu lists crème brûlée.",
+    "## 多言語\n\n検索拡張生成は、文書を分割して埋め込みます。"
+    "日本語と中文混合的文本也需要正确切分。Ünïcödé stays intact.",
+    "## Emoji\n\nDeploys went well 🚀🚀 and the team celebrated 🎉. "
+    "Flags 🇯🇵🇫🇷 and families 👨‍👩‍👧 are several code points each.",
+]
+
+def make_text(paragraphs: int = 24) -> str:
+    rng = random.Random(7)
+    return "\n\n".join(rng.choice(PARAGRAPHS) for _ in range(paragraphs))
+
+def chunk_spans(text, chunks):
+    """(start, end) of each chunk in text, found left to right."""
+    spans = []
+    start = 0
+    for chunk in chunks:
+        start = text.find(chunk.text, start)
+        assert start >= 0, f"chunk {chunk.position} is not a slice of the input"
+        spans.append((start, start + len(chunk.text)))
+    return spans
+
+def test_chunks_are_exact_slices_covering_the_text():
+    chunker = TextChunker(chunk_size=64, chunk_overlap=16)
+    text = make_text()
+    chunks = chunker.chunk_text(text, source="doc")
+    assert len(chunks) > 5
+    
+    spans = chunk_spans(text, chunks)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start <= previous_end
+    assert [chunk.position for chunk in chunks] == list(range(len(chunks)))
+
+def test_tokens_decode_to_chunk_text_across_multibyte_characters():
+    chunker = TextChunker(chunk_size=48, chunk_overlap=12)
+    chunks = chunker.chunk_text(make_text(), source="doc")
+    for chunk in chunks:
+        assert chunker.encoding.decode(chunk.tokens) == chunk.text
+        assert chunk.metadata["token_count"] == len(chunk.tokens)
+
+def test_streamed_pieces_match_whole_text():
+    chunker = TextChunker(chunk_size=64, chunk_overlap=16)
+    text = make_text()
+    whole = chunker.chunk_text(text, source="doc")
+    
+    rng = random.Random(11)
+    pieces = []
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 200)
+        pieces.append(text[i:i + step])
+        i += step
+    streamed = list(chunker.iter_chunks(pieces, source="doc"))
+    
+    assert [chunk.text for chunk in streamed] == [chunk.text for chunk in whole]
+    assert [chunk.tokens for chunk in streamed] == [chunk.tokens for chunk in whole]
+    assert [chunk.section for chunk in streamed] == [chunk.section for chunk in whole]
@@ -0,0 +1,26 @@
+import asyncio
+
+from benchmarks.pipeline import drive, make_corpus, make_queries
+
+def test_query_throughput_scales_with_concurrency(app_client):
+    """Provider calls are awaited, so in-flight queries overlap instead of queueing."""
+    corpus = make_corpus(4, 300)
+    queries = make_queries(corpus, 48)
+    
+    async def measure():
+        async with app_client(embed_ms=20.0, llm_ms=60.0) as client:
+            for document in corpus:
+                response = await client.post("/api/upload?wait=true", json=document)
+                assert response.status_code == 200
+            
+            requests = [{"path": "/api/query", "json": {"query": query}} for query in queries]
+            return {
+                concurrency: await drive(client, requests, concurrency)
+                for concurrency in (1, 4, 16)
+            }
+    
+    runs = asyncio.run(measure())
+    for run in runs.values():
+        assert run["status_codes"] == {200: len(queries)}
+    assert runs[4]["throughput_rps"] > 2.5 * runs[1]["throughput_rps"]
+    assert runs[16]["throughput_rps"] > 1.5 * runs[4]["throughput_rps"]
@@ -0,0 +1,10 @@
+from app.context import ContextPacker
+
+def test_oversized_chunk_is_cut_on_a_character_boundary():
+    packer = ContextPacker()
+    text = "Deploys went well " + "🚀" * 20 + " and the café reopened"
+    for budget in range(1, packer.count(text)):
+        [packed] = packer.pack([{"id": "big", "text": text, "source": "doc", "position": 0}], budget)
+        assert "�" not in packed["text"]
+        assert text.startswith(packed["text"])
+        assert packed["context_tokens"] <= budget
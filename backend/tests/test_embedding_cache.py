@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+import threading
+
+from app.embedding_cache import EmbeddingCache, cache_key
+from app.embeddings import AsyncEmbeddingService
+from benchmarks.fakes import FakeOpenAI, Latency
+
+def async_service(cache: EmbeddingCache) -> AsyncEmbeddingService:
+    service = AsyncEmbeddingService()
+    service.client = FakeOpenAI(Latency(0), Latency(0))
+    service.cache = cache
+    return service
+
+def test_disk_tier_runs_off_the_event_loop(offline):
+    path = str(offline / "embeddings.sqlite3")
+    texts = ["alpha beta", "gamma delta"]
+    
+    async def embed_twice():
+        service = async_service(EmbeddingCache(path=path))
+        first = await service.embed_batch(texts)
+        # A fresh process: empty memory tier, same disk tier
+        service.cache = EmbeddingCache(path=path)
+        disk_threads = []
+        read_disk = service.cache._read_disk
+        service.cache._read_disk = lambda keys: disk_threads.append(threading.get_ident()) or read_disk(keys)
+        second = await service.embed_batch(texts)
+        return first, second, disk_threads, service.cache.stats()
+    
+    first, second, disk_threads, stats = asyncio.run(embed_twice())
+    assert second == first
+    assert stats["disk_hits"] == 2 and stats["misses"] == 0
+    assert disk_threads and threading.get_ident() not in disk_threads
+
+def test_access_times_are_written_with_the_next_insert(offline):
+    path = str(offline / "embeddings.sqlite3")
+    EmbeddingCache(path=path).put_many("model", 3, {"old": [1.0, 0.0, 0.0]})
+    reader = sqlite3.connect(path)
+    key = cache_key("model", 3, "old")
+    written = reader.execute("SELECT accessed FROM embeddings WHERE key = ?", (key,)).fetchone()[0]
+    
+    cache = EmbeddingCache(path=path)
+    assert cache.get_many("model", 3, ["old"]) == [[1.0, 0.0, 0.0]]
+    assert reader.execute("SELECT accessed FROM embeddings WHERE key = ?", (key,)).fetchone()[0] == written
+    
+    cache.put_many("model", 3, {"new": [0.0, 1.0, 0.0]})
+    assert reader.execute("SELECT accessed FROM embeddings WHERE key = ?", (key,)).fetchone()[0] > written
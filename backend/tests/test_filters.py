@@ -0,0 +1,13 @@
+from app.filters import PayloadIndex, SearchFilter
+
+def test_values_of_different_types_get_different_keys():
+    assert SearchFilter({"metadata.n": [1]}).key() != SearchFilter({"metadata.n": ["1"]}).key()
+    assert SearchFilter({"source": ["a", "b"]}).key() == SearchFilter({"source": ["b", "a"]}).key()
+
+def test_cached_mask_is_not_reused_across_value_types():
+    index = PayloadIndex()
+    index.add(0, {"source": "doc", "metadata": {"n": 1}})
+    index.add(1, {"source": "doc", "metadata": {"n": "1"}})
+    
+    assert index.mask(SearchFilter({"metadata.n": [1]}), 2).tolist() == [True, False]
+    assert index.mask(SearchFilter({"metadata.n": ["1"]}), 2).tolist() == [False, True]
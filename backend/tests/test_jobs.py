@@ -0,0 +1,46 @@
+import asyncio
+
+from app.jobs import FAILED, QUEUED, SPOOLING, IngestionJobQueue, JobJournal, JobQueueFull
+
+async def slow_pieces(text: str):
+    for word in text.split():
+        await asyncio.sleep(0.005)
+        yield word + " "
+
+def test_concurrent_submits_respect_max_pending(offline):
+    journal = JobJournal(str(offline / "jobs"))
+    # No workers: submitted jobs stay pending
+    queue = IngestionJobQueue(journal, pipeline_factory=None, workers=0, max_pending=2)
+    
+    async def submit_many():
+        await queue.start()
+        return await asyncio.gather(
+            *(
+                queue.submit([(slow_pieces("one two three four"), f"doc-{i}.md", "Doc")])
+                for i in range(5)
+            ),
+            return_exceptions=True
+        )
+    
+    results = asyncio.run(submit_many())
+    accepted = [result for result in results if isinstance(result, str)]
+    refused = [result for result in results if isinstance(result, JobQueueFull)]
+    assert len(accepted) == 2 and len(refused) == 3
+    for job_id in accepted:
+        job = journal.get(job_id)
+        assert job["status"] == QUEUED and job["documents_total"] == 1
+        with open(journal.spool_path(job_id, 0), encoding="utf-8") as f:
+            assert f.read() == "one two three four "
+    journal.close()
+
+def test_jobs_interrupted_while_spooling_are_failed_on_start(offline):
+    journal = JobJournal(str(offline / "jobs"))
+    journal.reserve("half-spooled", [])
+    assert journal.get("half-spooled")["status"] == SPOOLING
+    
+    queue = IngestionJobQueue(journal, pipeline_factory=None, workers=0)
+    asyncio.run(queue.start())
+    job = journal.get("half-spooled")
+    assert job["status"] == FAILED and "spooling" in job["error"]
+    assert queue._pending == 0
+    journal.close()
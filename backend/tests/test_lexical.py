@@ -0,0 +1,84 @@
+import tiktoken
+
+from app.lexical import BM25Index, reciprocal_rank_fusion
+
+def open_index(path) -> BM25Index:
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return BM25Index(
+        str(path),
+        encode=encoding.encode_ordinary,
+        token_bytes=encoding.decode_single_token_bytes
+    )
+
+# Enough other documents that the query terms are not near-stopwords
+FILLER = [
+    f"release notes for the {name} frontend"
+    for name in ("alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta")
+]
+
+def add_two(path):
+    index = open_index(path)
+    index.add(
+        ["a", "b"] + [f"filler-{i}" for i in range(len(FILLER))],
+        [
+            {"text": "qdrant stores dense vectors", "source": "a.md"},
+            {"text": "bm25 scores lexical matches", "source": "b.md"},
+        ] + [{"text": text, "source": "notes.md"} for text in FILLER]
+    )
+    index.close()
+
+def found(index: BM25Index, query: str):
+    return [point_id for point_id, _, _ in index.search(query, top_k=5)]
+
+def test_delete_survives_restart(tmp_path):
+    add_two(tmp_path)
+    index = open_index(tmp_path)
+    index.delete(["a"])
+    index.close()
+    
+    index = open_index(tmp_path)
+    assert "a" not in found(index, "qdrant dense vectors")
+    assert found(index, "bm25 lexical")[0] == "b"
+    assert len(index) == 1 + len(FILLER)
+    index.close()
+
+def test_delete_is_replayed_from_the_log_after_a_crash(tmp_path):
+    add_two(tmp_path)
+    index = open_index(tmp_path)
+    index.delete(["a"])
+    # No close: the snapshot predates the delete, only the log has it
+    
+    reopened = open_index(tmp_path)
+    assert "a" not in found(reopened, "qdrant dense vectors")
+    assert len(reopened) == 1 + len(FILLER)
+    
+    reopened.add(["a"], [{"text": "qdrant stores dense vectors again", "source": "a.md"}])
+    reopened.close()
+    assert found(open_index(tmp_path), "qdrant dense vectors")[0] == "a"
+
+def test_normalized_scores_discount_incidental_matches(tmp_path):
+    add_two(tmp_path)
+    index = open_index(tmp_path)
+    index.add(["c"], [{"text": "the cluster restarts every weekend", "source": "ops.md"}])
+    on_topic = index.search("qdrant stores dense vectors", normalize=True)
+    # Shares only "weekend" with the index
+    off_topic = index.search("where can my family go hiking this weekend", normalize=True)
+    assert on_topic[0][0] == "a" and 0.3 < on_topic[0][2] < 1.0
+    assert off_topic[0][0] == "c" and off_topic[0][2] < 0.2
+    index.close()
+
+def test_fusion_keeps_the_dense_score():
+    dense = [
+        {"id": "a", "score": 0.82, "dense_score": 0.82},
+        {"id": "b", "score": 0.74, "dense_score": 0.74}
+    ]
+    lexical = [
+        {"id": "b", "score": 0.9, "lexical_score": 0.9},
+        {"id": "c", "score": 0.6, "lexical_score": 0.6}
+    ]
+    fused = reciprocal_rank_fusion([dense, lexical], top_k=3)
+    
+    assert [chunk["id"] for chunk in fused] == ["b", "a", "c"]
+    assert [chunk["score"] for chunk in fused] == [0.74, 0.82, 0.6]
+    assert fused[0]["lexical_score"] == 0.9
+    assert fused[0]["rrf_score"] > fused[1]["rrf_score"] > fused[2]["rrf_score"]
@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.local_store import LocalVectorStore
+
+def clustered(rng, count: int, center: np.ndarray) -> np.ndarray:
+    return center + 0.3 * rng.standard_normal((count, len(center))).astype(np.float32)
+
+def hnsw_store(path, dimension: int) -> LocalVectorStore:
+    return LocalVectorStore(str(path), dimension, index="hnsw", ann_min_points=1, hnsw_params={"M": 8})
+
+def test_ef_search_reaches_the_graph(tmp_path):
+    rng = np.random.default_rng(0)
+    store = hnsw_store(tmp_path, 16)
+    store.upsert_chunks(
+        [{"text": str(i), "source": "s", "position": i} for i in range(200)],
+        rng.standard_normal((200, 16)).astype(np.float32)
+    )
+    beams = []
+    search = store.index.search
+    store.index.search = lambda *args, ef_search=None, **kwargs: beams.append(ef_search) or search(*args, ef_search=ef_search, **kwargs)
+    
+    query = rng.standard_normal(16).tolist()
+    store.search(query, top_k=5, ef_search=150)
+    store.search_batch([query, query], top_k=5, ef_search=20)
+    store.search(query, top_k=5)
+    assert beams == [150, 20, 20, None]
+
+def test_reembedded_point_is_relinked(tmp_path):
+    rng = np.random.default_rng(1)
+    dimension = 16
+    east, west = np.zeros(dimension, dtype=np.float32), np.zeros(dimension, dtype=np.float32)
+    east[0], west[0] = 1.0, -1.0
+    store = hnsw_store(tmp_path, dimension)
+    ids = [f"point-{i}" for i in range(300)]
+    store.upsert_chunks(
+        [{"text": point_id, "source": "s", "position": i} for i, point_id in enumerate(ids)],
+        np.concatenate((clustered(rng, 150, east), clustered(rng, 150, west))),
+        ids=ids
+    )
+    
+    row = store._rows["point-0"]
+    old_links = list(store.index._graph[0][row])
+    moved = clustered(rng, 1, west)
+    store.upsert_chunks([{"text": "moved", "source": "s", "position": 0}], moved, ids=["point-0"])
+    
+    links = store.index._graph[0][row]
+    assert links and all(store._vectors[link][0] < 0 for link in links)
+    assert not any(row in store.index._graph[0][link] for link in old_links)
+    hits = store._search_hits(moved[0].tolist(), 5, -1.0, ef_search=16)
+    assert "point-0" in [point_id for point_id, _, _, _ in hits]
+
+def test_search_on_a_snapshot_taken_before_the_entry_point_moved(tmp_path):
+    rng = np.random.default_rng(2)
+    store = hnsw_store(tmp_path, 16)
+    store.upsert_chunks(
+        [{"text": str(i), "source": "s", "position": i} for i in range(5)],
+        rng.standard_normal((5, 16)).astype(np.float32)
+    )
+    count, matrix, _, _, _, entry = store._snapshot()
+    # Keep inserting, as a concurrent writer would, until a new node tops the graph
+    while store.index.entry_point < count:
+        store.upsert_chunks(
+            [{"text": "late", "source": "s", "position": 0}],
+            rng.standard_normal((1, 16)).astype(np.float32)
+        )
+    
+    query = rng.standard_normal(16).astype(np.float32)
+    for snapshot_entry in (entry, None):
+        rows, _ = store.index.search(query, 3, matrix, entry=snapshot_entry)
+        assert len(rows) == 3 and all(row < count for row in rows)
@@ -0,0 +1,130 @@
+import asyncio
+import time
+import uuid
+
+from app.resilience import CIRCUIT_FAILURE_THRESHOLD, HEDGE_MIN_SAMPLES, CircuitBreaker, ProviderPool, Upstream
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def make_pool(*names: str, hedging: bool = False) -> ProviderPool:
+    """Upstreams whose target is their short name; breakers are fresh per pool."""
+    run = uuid.uuid4().hex[:8]
+    return ProviderPool("test", [Upstream(f"{run}:{name}", name) for name in names], timeout=5.0, hedging=hedging)
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test-breaker", failure_threshold=2, reset_timeout=0.05)
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+def test_failover_follows_upstream_order_and_skips_open_breakers():
+    pool = make_pool("first", "second", "third", "fourth")
+    calls = []
+    
+    async def call(target):
+        calls.append(target)
+        if target != "fourth":
+            raise ProviderError(500)
+        return target
+    
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        pool.upstreams[2].breaker.record_failure()
+    
+    upstream, result = asyncio.run(pool.call(call))
+    assert result == "fourth" and upstream is pool.upstreams[3]
+    assert calls == ["first", "second", "fourth"]
+
+def test_rate_limit_fails_over_without_tripping_the_breaker():
+    pool = make_pool("primary", "secondary")
+    calls = []
+    
+    async def call(target):
+        calls.append(target)
+        if target == "primary":
+            raise ProviderError(429)
+        return target
+    
+    async def ask_many():
+        return [await pool.call(call) for _ in range(CIRCUIT_FAILURE_THRESHOLD * 2)]
+    
+    results = asyncio.run(ask_many())
+    assert all(result == "secondary" for _, result in results)
+    # Every request still tried the primary first
+    assert calls.count("primary") == CIRCUIT_FAILURE_THRESHOLD * 2
+    assert pool.primary.breaker.state == CircuitBreaker.CLOSED
+    assert pool.primary.breaker.failures == 0
+
+def test_server_errors_trip_the_breaker():
+    pool = make_pool("primary", "secondary")
+    calls = []
+    
+    async def call(target):
+        calls.append(target)
+        if target == "primary":
+            raise ProviderError(503)
+        return target
+    
+    async def ask_many():
+        return [await pool.call(call) for _ in range(CIRCUIT_FAILURE_THRESHOLD * 2)]
+    
+    asyncio.run(ask_many())
+    assert calls.count("primary") == CIRCUIT_FAILURE_THRESHOLD
+    assert pool.primary.breaker.state == CircuitBreaker.OPEN
+
+def test_hedge_fires_once_the_call_outlasts_p95():
+    pool = make_pool("primary", "secondary", hedging=True)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        pool.primary.latencies.add(0.06)
+    started = {}
+    
+    async def call(target):
+        started[target] = time.perf_counter()
+        await asyncio.sleep(2.0 if target == "primary" else 0.01)
+        return target
+    
+    async def timed():
+        start = time.perf_counter()
+        _, result = await pool.call(call)
+        return result, started["secondary"] - start, time.perf_counter() - start
+    
+    result, hedged_after, elapsed = asyncio.run(timed())
+    assert result == "secondary"
+    assert 0.05 <= hedged_after < 0.5
+    assert elapsed < 1.0
+    # The losing primary attempt was cancelled, not counted against it
+    assert pool.primary.breaker.state == CircuitBreaker.CLOSED
+
+def test_no_hedge_for_calls_faster_than_p95():
+    pool = make_pool("primary", "secondary", hedging=True)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        pool.primary.latencies.add(0.2)
+    calls = []
+    
+    async def call(target):
+        calls.append(target)
+        await asyncio.sleep(0.02)
+        return target
+    
+    _, result = asyncio.run(pool.call(call))
+    assert result == "primary" and calls == ["primary"]
@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+
+from app.resilience import CIRCUIT_FAILURE_THRESHOLD
+from app.sharding import create_sharded_store, merge_hits, rebalance
+
+def sharded(tmp_path, *names: str, timeout: float = 1.0):
+    store = create_sharded_store(",".join(f"local:{tmp_path / name}" for name in names))
+    store.timeout = timeout
+    return store
+
+def fill(store, count: int = 120):
+    rng = np.random.default_rng(0)
+    chunks = [{"text": f"chunk {i}", "source": f"doc-{i // 4}", "position": i % 4} for i in range(count)]
+    store.upsert_chunks(chunks, rng.standard_normal((count, store.dimension)).astype(np.float32), [f"p{i}" for i in range(count)])
+    return rng.standard_normal(store.dimension).tolist()
+
+def placement(store):
+    """shard name -> sources of the points it holds."""
+    return {
+        name: [payload["source"] for _, payloads, _ in shard.iter_points() for payload in payloads]
+        for name, shard in store.shards.items()
+    }
+
+def test_merge_hits_orders_by_score_and_drops_duplicates():
+    first = [("a", {}, 0.9, None), ("b", {}, 0.5, None)]
+    second = [("c", {}, 0.7, None), ("a", {}, 0.6, None), ("d", {}, 0.4, None)]
+    assert [hit[0] for hit in merge_hits([first, second], 3)] == ["a", "c", "b"]
+    assert [hit[0] for hit in merge_hits([first, second], 10)] == ["a", "c", "b", "d"]
+
+def test_points_are_routed_by_source(offline):
+    store = sharded(offline, "one", "two", "three")
+    fill(store)
+    
+    held = placement(store)
+    assert sum(len(sources) for sources in held.values()) == 120
+    assert sum(1 for sources in held.values() if sources) > 1
+    for name, sources in held.items():
+        assert all(store.shard_for(source) == name for source in sources)
+
+def test_search_matches_a_single_store(offline):
+    store = sharded(offline, "one", "two")
+    query = fill(store)
+    single = sharded(offline, "single")
+    fill(single)
+    
+    assert [hit[0] for hit in store._search_hits(query, 10, -1.0)] == [hit[0] for hit in single._search_hits(query, 10, -1.0)]
+
+def test_slow_shard_is_left_out_of_the_result(offline):
+    store = sharded(offline, "fast", "slow", timeout=0.1)
+    query = fill(store)
+    slow_name = next(name for name in store.shards if name.endswith("slow"))
+    slow = store.shards[slow_name]
+    search = slow._search_hits
+    slow._search_hits = lambda *args, **kwargs: time.sleep(1.0) or search(*args, **kwargs)
+    
+    try:
+        start = time.perf_counter()
+        hits = store._search_hits(query, 10, -1.0)
+        assert time.perf_counter() - start < 0.5
+    finally:
+        del slow._search_hits
+    held = placement(store)
+    assert hits and all(store.shard_for(payload["source"]) != slow_name for _, payload, _, _ in hits)
+    assert len(hits) == min(10, sum(len(sources) for name, sources in held.items() if name != slow_name))
+    assert store.breakers[slow_name].failures == 1
+
+def test_open_breaker_skips_the_shard(offline):
+    store = sharded(offline, "up", "down")
+    query = fill(store)
+    down_name = next(name for name in store.shards if name.endswith("down"))
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        store.breakers[down_name].record_failure()
+    calls = []
+    down = store.shards[down_name]
+    search = down._search_hits
+    down._search_hits = lambda *args, **kwargs: calls.append(args) or search(*args, **kwargs)
+    
+    try:
+        hits = store._search_hits(query, 5, -1.0)
+    finally:
+        del down._search_hits
+    assert calls == []
+    assert len(hits) == 5 and all(store.shard_for(payload["source"]) != down_name for _, payload, _, _ in hits)
+
+def test_rebalance_after_adding_a_shard(offline):
+    store = sharded(offline, "one", "two")
+    query = fill(store)
+    before = [hit[0] for hit in store._search_hits(query, 10, -1.0)]
+    
+    grown = sharded(offline, "one", "two", "three")
+    assert rebalance(grown, batch_size=16, dry_run=True)["scanned"] == 120
+    result = rebalance(grown, batch_size=16)
+    assert result["moved"] > 0
+    assert all(move.endswith(f"-> {offline / 'three'}") for move in result["moves"])
+    
+    held = placement(grown)
+    assert sum(len(sources) for sources in held.values()) == 120
+    for name, sources in held.items():
+        assert all(grown.shard_for(source) == name for source in sources)
+    assert rebalance(grown, batch_size=16)["moved"] == 0
+    assert [hit[0] for hit in grown._search_hits(query, 10, -1.0)] == before
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.local_store import LocalVectorStore
+from app.snapshot import export_snapshot, import_snapshot
+
+DIMENSION = 16
+
+def make_store(path, count: int = 40) -> LocalVectorStore:
+    rng = np.random.default_rng(0)
+    store = LocalVectorStore(str(path), DIMENSION)
+    chunks = [
+        {
+            "text": f"Chunk {i}: naïve café 検索 🚀",
+            "source": f"doc-{i // 10}",
+            "title": "Überblick" if i % 2 else None,
+            "section": None if i % 3 else "§ Ergebnisse",
+            "position": i % 10,
+            "metadata": {"n": i, "ratio": i / 4, "tags": ["a", "ü"], "nested": {"ok": i % 2 == 0, "none": None}},
+            **({"tenant": "acme"} if i % 4 == 0 else {})
+        }
+        for i in range(count)
+    ]
+    store.upsert_chunks(chunks, rng.standard_normal((count, DIMENSION)).astype(np.float32), ids=[f"p{i}" for i in range(count)])
+    return store
+
+def points(store):
+    """id -> (payload, vector) for every point in the store."""
+    return {
+        point_id: (payload, vector)
+        for ids, payloads, vectors in store.iter_points(7)
+        for point_id, payload, vector in zip(ids, payloads, vectors)
+    }
+
+@pytest.mark.parametrize("vector_dtype, tolerance", [("float32", 1e-6), ("float16", 1e-2)])
+def test_round_trip_into_a_local_store(tmp_path, vector_dtype, tolerance):
+    source = make_store(tmp_path / "source")
+    path = str(tmp_path / "kb.snap")
+    stats = export_snapshot(source, path, vector_dtype, batch_size=9)
+    assert stats["chunks"] == 40
+    
+    target = LocalVectorStore(str(tmp_path / "target"), DIMENSION)
+    import_snapshot(path, target, batch_size=8, concurrency=2)
+    
+    expected, imported = points(source), points(target)
+    assert imported.keys() == expected.keys()
+    for point_id, (payload, vector) in expected.items():
+        assert imported[point_id][0] == payload
+        np.testing.assert_allclose(imported[point_id][1], vector, atol=tolerance)
+
+class FailingStore:
+    dimension = DIMENSION
+    
+    def iter_points(self, batch_size):
+        yield ["x"], [{"text": "partial", "source": "doc", "position": 0}], np.ones((1, DIMENSION), dtype=np.float32)
+        raise ConnectionError("backend went away")
+
+def test_failed_export_keeps_the_previous_snapshot(tmp_path):
+    path = str(tmp_path / "kb.snap")
+    export_snapshot(make_store(tmp_path / "source"), path)
+    with open(path, "rb") as f:
+        previous = f.read()
+    
+    with pytest.raises(ConnectionError):
+        export_snapshot(FailingStore(), path)
+    
+    with open(path, "rb") as f:
+        assert f.read() == previous
+    assert sorted(os.listdir(tmp_path)) == ["kb.snap", "source"]
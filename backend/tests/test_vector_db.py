@@ -0,0 +1,31 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.local_store import LocalVectorStore
+from app.vector_db import AsyncVectorStore, VectorStore
+
+def test_incomplete_backend_fails_when_constructed():
+    class UpsertOnly(VectorStore):
+        def upsert_chunks(self, chunks, embeddings, ids=None):
+            pass
+    
+    with pytest.raises(TypeError, match="delete_points"):
+        UpsertOnly()
+
+def test_async_facade_iterates_the_store(tmp_path):
+    store = LocalVectorStore(str(tmp_path), 4)
+    ids = [f"point-{i}" for i in range(5)]
+    store.upsert_chunks(
+        [{"text": point_id, "source": "s", "position": i} for i, point_id in enumerate(ids)],
+        np.eye(5, 4, dtype=np.float32) + 0.1,
+        ids=ids
+    )
+    
+    async def collect():
+        return [batch async for batch in AsyncVectorStore(store).iter_points(batch_size=2)]
+    
+    batches = asyncio.run(collect())
+    assert [len(batch_ids) for batch_ids, _, _ in batches] == [2, 2, 1]
+    assert [point_id for batch_ids, _, _ in batches for point_id in batch_ids] == ids
@@ -1,7 +1,7 @@
 'use client';
 
 import { useState } from 'react';
-import { uploadDocument } from '@/lib/api';
+import { uploadDocument, waitForUploadJob } from '@/lib/api';
 
 export default function TextUpload({ onUpload }: { onUpload: () => void }) {
   const [text, setText] = useState('');
@@ -20,11 +20,16 @@ export default function TextUpload({ onUpload }: { onUpload: () => void }) {
     setMessage('');
 
     try {
-      await uploadDocument({
+      const { job_id } = await uploadDocument({
         text,
         title: title || 'Untitled Document',
         source: 'user_input'
       });
+      setMessage('Processing document...');
+      const job = await waitForUploadJob(job_id);
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed');
+      }
       setMessage('Document uploaded successfully!');
       setText('');
       setTitle('');
@@ -8,6 +8,15 @@ export interface UploadRequest {
   source?: string;
 }
 
+export interface UploadJob {
+  job_id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  documents_total: number;
+  documents_done: number;
+  chunks_created: number;
+  error?: string | null;
+}
+
 export interface QueryRequest {
   query: string;
   top_k?: number;
@@ -50,6 +59,22 @@ export const uploadDocument = async (data: UploadRequest) => {
   return response.data;
 };
 
+export const getUploadJob = async (jobId: string): Promise<UploadJob> => {
+  const response = await axios.get(`${API_URL}/api/jobs/${jobId}`);
+  return response.data;
+};
+
+// Uploads are processed in the background; poll until the job finishes
+export const waitForUploadJob = async (jobId: string, intervalMs = 1000): Promise<UploadJob> => {
+  while (true) {
+    const job = await getUploadJob(jobId);
+    if (job.status === 'succeeded' || job.status === 'failed') {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
 export const queryRAG = async (data: QueryRequest): Promise<AnswerResponse> => {
   const response = await axios.post(`${API_URL}/api/query`, data);
   return response.data;